@@ -133,3 +133,22 @@ async def get_current_admin(
             detail=f'Only for {c.USER_NAME_ROLE_ADMIN}'
         )
     return current_user
+
+
+async def get_current_seller_or_admin(
+    current_user: UserModel = Depends(get_current_user)
+):
+    """
+    Проверяет, что пользователь - продавец или администратор.
+    """
+    if current_user.role not in (
+        c.USER_NAME_ROLE_SELLER, c.USER_NAME_ROLE_ADMIN
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=(
+                f'Only {c.USER_NAME_ROLE_SELLER} or '
+                f'{c.USER_NAME_ROLE_ADMIN} can perform this action'
+            )
+        )
+    return current_user
@@ -0,0 +1,44 @@
+"""
+Архивация старых секций заказов: секции orders и order_items
+выгружаются в сжатый CSV (ORDER_ARCHIVE_ROOT), отсоединяются и удаляются.
+
+Запуск:
+    python -m app.commands.archive_orders
+    python -m app.commands.archive_orders --before 2024-01
+"""
+import argparse
+import asyncio
+from datetime import date, datetime
+
+from loguru import logger
+
+import app.config as conf
+from app.service.partitions import (
+    add_months, archive_order_partitions, get_current_month
+)
+
+
+def parse_month(value: str) -> date:
+    return datetime.strptime(value, '%Y-%m').date()
+
+
+async def main(before: date):
+    archives = await archive_order_partitions(before)
+    logger.info(
+        f'Archived {len(archives)} order partitions before {before}: '
+        f'{", ".join(path.name for path in archives)}'
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--before',
+        type=parse_month,
+        default=add_months(
+            get_current_month(), -conf.ORDER_ARCHIVE_AFTER_MONTHS
+        ),
+        help='Архивировать месяцы раньше этого (ГГГГ-ММ)'
+    )
+    args = parser.parse_args()
+    asyncio.run(main(args.before))
@@ -0,0 +1,94 @@
+"""
+Создание уменьшенных копий для уже загруженных картинок в MEDIA_ROOT
+и запись имеющихся копий в media_blobs (в том числе созданных до
+появления колонки variants).
+
+Запуск: python -m app.commands.backfill_image_variants
+"""
+import asyncio
+
+import aiofiles
+from loguru import logger
+from sqlalchemy import update
+
+import app.config as conf
+from app.database import async_session_maker
+from app.models import MediaBlob
+from app.service.storage import LocalMediaStorage
+from app.service.images import (
+    generate_image_variants,
+    get_variant_name,
+    is_variant_name,
+    shutdown_image_process_pool
+)
+
+
+def get_originals() -> list:
+    """Оригиналы картинок в MEDIA_ROOT"""
+    return [
+        path for path in sorted(conf.MEDIA_ROOT.iterdir())
+        # Скрытые файлы - временные файлы загрузок
+        if path.is_file() and not path.name.startswith('.')
+        and not is_variant_name(path.name)
+    ]
+
+
+def get_existing_variants(path) -> list[str]:
+    """Копии картинки, файлы которых есть рядом с оригиналом"""
+    return [
+        variant for variant in conf.IMAGE_VARIANTS
+        if (conf.MEDIA_ROOT / get_variant_name(path.name, variant)).exists()
+    ]
+
+
+async def create_missing_variants(path) -> bool:
+    """Создаёт недостающие копии картинки, False - при ошибке обработки"""
+    async with aiofiles.open(path, 'rb') as source:
+        data = await source.read()
+    try:
+        variants = await generate_image_variants(data)
+    except Exception as e:
+        logger.warning(f'Image variants for {path.name} failed: {e}')
+        return False
+    for variant, content in variants.items():
+        variant_path = conf.MEDIA_ROOT / get_variant_name(path.name, variant)
+        async with aiofiles.open(variant_path, 'wb') as out_file:
+            await out_file.write(content)
+    return True
+
+
+async def backfill_image_variants() -> int:
+    """
+    Создаёт недостающие копии, записывает имеющиеся копии в media_blobs
+    и возвращает число картинок, для которых копии созданы
+    """
+    done = 0
+    async with async_session_maker() as db:
+        for path in get_originals():
+            variants = get_existing_variants(path)
+            if len(variants) < len(conf.IMAGE_VARIANTS):
+                if await create_missing_variants(path):
+                    done += 1
+                variants = get_existing_variants(path)
+            await db.execute(
+                update(MediaBlob)
+                .where(
+                    MediaBlob.backend == LocalMediaStorage.name,
+                    MediaBlob.file_name == path.name
+                )
+                .values(variants=variants or None)
+            )
+        await db.commit()
+    return done
+
+
+async def main():
+    try:
+        done = await backfill_image_variants()
+    finally:
+        shutdown_image_process_pool()
+    logger.info(f'Image variants created for {done} images')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
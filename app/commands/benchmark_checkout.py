@@ -0,0 +1,140 @@
+"""
+Нагрузочная проверка оформления корзины одной транзакцией: число
+оформлений в секунду и задержка checkout_cart_items для корзин
+из 50 позиций при параллельных покупателях.
+Каждому покупателю временно кладутся в корзину по одной штуке разных
+активных товаров. Оформление проходит весь путь (резервы, их списание,
+вставка заказов пачкой, статистика продаж, чистка корзины и уменьшение
+остатка), но его транзакция откатывается - корзина, резервы и остатки
+товаров возвращаются к состоянию до оформления. После проверки корзины
+и резервы покупателей удаляются.
+Нужны активные покупатели с пустыми корзинами и достаточно товаров
+с остатком не меньше числа покупателей.
+
+Запуск: python -m app.commands.benchmark_checkout --items 50 --workers 16 --duration 10
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from fastapi import HTTPException
+from loguru import logger
+from sqlalchemy import delete, exists, insert, select
+
+import app.constants as c
+from app.database import async_session_maker
+from app.models import (
+    CartItem as CartItemModel,
+    Product as ProductModel,
+    User as UserModel
+)
+from app.service.stock_holds import release_stock_holds
+from app.service.tools import checkout_cart_items
+
+
+async def run_worker(buyer: UserModel, deadline: float) -> list[float]:
+    latencies = []
+    while time.monotonic() < deadline:
+        async with async_session_maker() as db:
+            started = time.perf_counter()
+            try:
+                await checkout_cart_items(buyer, db)
+                latencies.append(time.perf_counter() - started)
+            except HTTPException as e:
+                logger.warning(f'Checkout of buyer {buyer.id} failed: {e}')
+            finally:
+                await db.rollback()
+    return latencies
+
+
+async def fill_carts(buyer_ids: list[int], product_ids: list[int]) -> None:
+    async with async_session_maker() as db:
+        await db.execute(
+            insert(CartItemModel),
+            [
+                {
+                    'user_id': buyer_id,
+                    'product_id': product_id,
+                    'quantity': 1
+                }
+                for buyer_id in buyer_ids
+                for product_id in product_ids
+            ]
+        )
+        await db.commit()
+
+
+async def clear_carts(buyer_ids: list[int]) -> None:
+    async with async_session_maker() as db:
+        await db.execute(
+            delete(CartItemModel).where(CartItemModel.user_id.in_(buyer_ids))
+        )
+        for buyer_id in buyer_ids:
+            await release_stock_holds(buyer_id, db)
+        await db.commit()
+
+
+async def main(items: int, workers: int, duration: float):
+    async with async_session_maker() as db:
+        buyers = (await db.scalars(
+            select(UserModel)
+            .where(
+                UserModel.role == c.USER_NAME_ROLE_BUYER,
+                UserModel.is_active == True,
+                ~exists().where(CartItemModel.user_id == UserModel.id)
+            )
+            .order_by(UserModel.id)
+            .limit(workers)
+        )).all()
+        product_ids = (await db.scalars(
+            select(ProductModel.id)
+            .where(
+                ProductModel.is_active == True,
+                ProductModel.stock >= workers
+            )
+            .order_by(ProductModel.id)
+            .limit(items)
+        )).all()
+    if len(buyers) < workers:
+        raise SystemExit(
+            f'Need {workers} active buyers with empty carts, '
+            f'found {len(buyers)}'
+        )
+    if len(product_ids) < items:
+        raise SystemExit(
+            f'Need {items} active products with stock >= {workers}, '
+            f'found {len(product_ids)}'
+        )
+    buyer_ids = [buyer.id for buyer in buyers]
+    await fill_carts(buyer_ids, product_ids)
+    try:
+        deadline = time.monotonic() + duration
+        results = await asyncio.gather(*(
+            run_worker(buyer, deadline) for buyer in buyers
+        ))
+    finally:
+        await clear_carts(buyer_ids)
+    latencies = sorted(
+        latency for worker_latencies in results
+        for latency in worker_latencies
+    )
+    if not latencies:
+        raise SystemExit('No checkout succeeded')
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    logger.info(
+        f'{workers} buyers, {items}-item carts: '
+        f'{len(latencies) / duration:.1f} checkouts/sec '
+        f'({len(latencies) * items / duration:.0f} order items/sec), '
+        f'latency mean {statistics.mean(latencies) * 1000:.1f} ms, '
+        f'p95 {p95 * 1000:.1f} ms'
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=50)
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10)
+    args = parser.parse_args()
+    asyncio.run(main(args.items, args.workers, args.duration))
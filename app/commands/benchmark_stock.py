@@ -0,0 +1,108 @@
+"""
+Нагрузочная проверка оформления заказов на один товар: число заказов
+в секунду при параллельных покупателях без шардов и с шардами остатка.
+Заказ проходит весь путь create_one_order (резерв, его списание,
+вставка заказа, статистика продаж и уменьшение остатка), но его
+транзакция откатывается, а резерв снимается - остаток товара
+не меняется; режим шардов товара после проверки восстанавливается.
+Нужно не меньше активных покупателей, чем параллельных заказов.
+
+Запуск: python -m app.commands.benchmark_stock 12 --workers 32 --duration 10
+"""
+import argparse
+import asyncio
+import time
+
+from fastapi import HTTPException
+from loguru import logger
+from sqlalchemy import select
+
+import app.config as conf
+import app.constants as c
+from app.database import async_session_maker
+from app.models import Product as ProductModel, User as UserModel
+from app.service.stock_holds import release_stock_holds
+from app.service.stock_shards import disable_stock_shards, enable_stock_shards
+from app.service.tools import create_one_order
+
+
+async def run_worker(
+    product_id: int, buyer: UserModel, deadline: float
+) -> int:
+    done = 0
+    while time.monotonic() < deadline:
+        async with async_session_maker() as db:
+            try:
+                await create_one_order(product_id, 1, buyer, db)
+                done += 1
+            except HTTPException:
+                pass
+            finally:
+                await db.rollback()
+                await release_stock_holds(buyer.id, db, [product_id])
+                await db.commit()
+    return done
+
+
+async def measure(
+    product_id: int, buyers: list[UserModel], duration: float
+) -> float:
+    deadline = time.monotonic() + duration
+    done = await asyncio.gather(*(
+        run_worker(product_id, buyer, deadline) for buyer in buyers
+    ))
+    return sum(done) / duration
+
+
+async def set_shards(product_id: int, shard_count: int) -> None:
+    async with async_session_maker() as db:
+        if shard_count:
+            await enable_stock_shards(product_id, db, shard_count)
+        else:
+            await disable_stock_shards(product_id, db)
+        await db.commit()
+
+
+async def main(
+    product_id: int, shard_count: int, workers: int, duration: float
+):
+    async with async_session_maker() as db:
+        initial_shards = await db.scalar(
+            select(ProductModel.stock_shards)
+            .where(ProductModel.id == product_id)
+        )
+        buyers = (await db.scalars(
+            select(UserModel)
+            .where(
+                UserModel.role == c.USER_NAME_ROLE_BUYER,
+                UserModel.is_active == True
+            )
+            .order_by(UserModel.id)
+            .limit(workers)
+        )).all()
+    if len(buyers) < workers:
+        raise SystemExit(f'Need {workers} active buyers, found {len(buyers)}')
+    try:
+        await set_shards(product_id, 0)
+        unsharded = await measure(product_id, buyers, duration)
+        await set_shards(product_id, shard_count)
+        sharded = await measure(product_id, buyers, duration)
+    finally:
+        await set_shards(product_id, initial_shards or 0)
+    logger.info(
+        f'Product {product_id}, {workers} buyers: '
+        f'{unsharded:.0f} orders/sec without shards, '
+        f'{sharded:.0f} orders/sec with {shard_count} shards'
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('product_id', type=int)
+    parser.add_argument('--shards', type=int, default=conf.STOCK_SHARD_COUNT)
+    parser.add_argument('--workers', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10)
+    args = parser.parse_args()
+    asyncio.run(main(
+        args.product_id, args.shards, args.workers, args.duration
+    ))
@@ -0,0 +1,223 @@
+"""
+Проверка повторов и размыкателя цепи общего HTTP-клиента на локальном
+тестовом сервере aiohttp: повтор ответов 5xx, отказ без повторов на 4xx,
+таймауты, размыкание цепи и единственный пробный запрос после
+reset_timeout. Завершается с ошибкой, если поведение не совпало.
+
+Запуск: python -m app.commands.check_http_client
+"""
+import asyncio
+import sys
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from fastapi import HTTPException
+from loguru import logger
+
+import app.config as conf
+from app.service.http_client import CircuitBreaker, call_with_retry
+
+
+# Таймаут клиента проверки и задержка «медленного» ответа (в секундах)
+CHECK_TIMEOUT = 0.2
+SLOW_RESPONSE_DELAY = 1
+# Размыкатель проверки: reset_timeout больше первой задержки повтора,
+# чтобы повтор после неудачной пробы не стал новой пробой
+CHECK_FAILURE_THRESHOLD = 2
+CHECK_RESET_TIMEOUT = 2
+
+
+def create_check_app() -> web.Application:
+    """
+    Тестовый сервис: /flaky отвечает 500 заданное число раз, затем 200,
+    /down - всегда 500, /missing - 404, /slow - дольше таймаута клиента,
+    /ok - 200 с задержкой (для параллельных пробных запросов)
+    """
+    app = web.Application()
+    # Изменяемое состояние сервиса (ключи приложения после старта
+    # не меняются)
+    state = {'calls': {}, 'flaky_failures': 0}
+    app['state'] = state
+
+    def count(request: web.Request) -> int:
+        calls = state['calls']
+        calls[request.path] = calls.get(request.path, 0) + 1
+        return calls[request.path]
+
+    async def flaky(request: web.Request) -> web.Response:
+        if count(request) <= state['flaky_failures']:
+            return web.Response(status=500)
+        return web.Response(text='ok')
+
+    async def down(request: web.Request) -> web.Response:
+        count(request)
+        return web.Response(status=500)
+
+    async def missing(request: web.Request) -> web.Response:
+        count(request)
+        return web.Response(status=404)
+
+    async def slow(request: web.Request) -> web.Response:
+        count(request)
+        await asyncio.sleep(SLOW_RESPONSE_DELAY)
+        return web.Response(text='ok')
+
+    async def ok(request: web.Request) -> web.Response:
+        count(request)
+        await asyncio.sleep(CHECK_TIMEOUT / 2)
+        return web.Response(text='ok')
+
+    app.router.add_get('/flaky', flaky)
+    app.router.add_get('/down', down)
+    app.router.add_get('/missing', missing)
+    app.router.add_get('/slow', slow)
+    app.router.add_get('/ok', ok)
+    return app
+
+
+def request_factory(session: aiohttp.ClientSession, url):
+    async def request() -> str:
+        async with session.get(url) as response:
+            return await response.text()
+    return request
+
+
+def create_breaker() -> CircuitBreaker:
+    return CircuitBreaker(
+        'Check server', CHECK_FAILURE_THRESHOLD, CHECK_RESET_TIMEOUT
+    )
+
+
+async def check_retries(server: TestServer, session: aiohttp.ClientSession):
+    """Ответы 5xx повторяются, 4xx - нет"""
+    state = server.app['state']
+    state['flaky_failures'] = conf.HTTP_RETRY_ATTEMPTS - 1
+    breaker = CircuitBreaker('Check server', conf.HTTP_RETRY_ATTEMPTS, 1)
+    result = await call_with_retry(
+        request_factory(session, server.make_url('/flaky')), breaker
+    )
+    assert result == 'ok', result
+    assert state['calls']['/flaky'] == conf.HTTP_RETRY_ATTEMPTS
+    assert breaker.failures == 0 and breaker.opened_at is None
+
+    try:
+        await call_with_retry(
+            request_factory(session, server.make_url('/missing')), breaker
+        )
+    except aiohttp.ClientResponseError as e:
+        assert e.status == 404, e.status
+    else:
+        raise AssertionError('404 was not raised')
+    assert state['calls']['/missing'] == 1
+
+
+async def check_timeouts(
+    server: TestServer, session: aiohttp.ClientSession
+):
+    """Таймаут повторяется и после всех попыток поднимается наружу"""
+    breaker = CircuitBreaker('Check server', conf.HTTP_RETRY_ATTEMPTS + 1, 1)
+    try:
+        await call_with_retry(
+            request_factory(session, server.make_url('/slow')), breaker
+        )
+    except asyncio.TimeoutError:
+        pass
+    else:
+        raise AssertionError('Timeout was not raised')
+    assert server.app['state']['calls']['/slow'] == conf.HTTP_RETRY_ATTEMPTS
+    assert breaker.failures == conf.HTTP_RETRY_ATTEMPTS
+
+
+async def check_circuit_breaker(
+    server: TestServer, session: aiohttp.ClientSession
+):
+    """
+    Цепь размыкается после серии ошибок, после reset_timeout пропускает
+    ровно один пробный запрос из параллельных, неудачная проба снова
+    размыкает цепь, удачная - замыкает
+    """
+    calls = server.app['state']['calls']
+    breaker = create_breaker()
+    try:
+        await call_with_retry(
+            request_factory(session, server.make_url('/down')), breaker
+        )
+    except (aiohttp.ClientResponseError, HTTPException):
+        pass
+    assert breaker.opened_at is not None, 'Circuit was not opened'
+    down_calls = calls['/down']
+    assert down_calls == CHECK_FAILURE_THRESHOLD, down_calls
+
+    # Разомкнутая цепь отклоняет запрос, не обращаясь к сервису
+    try:
+        await call_with_retry(
+            request_factory(session, server.make_url('/down')), breaker
+        )
+    except HTTPException as e:
+        assert e.status_code == 503, e.status_code
+    else:
+        raise AssertionError('Open circuit let the request through')
+    assert calls['/down'] == down_calls
+
+    # Неудачная проба: в сервис уходит один запрос, цепь снова разомкнута
+    await asyncio.sleep(CHECK_RESET_TIMEOUT)
+    try:
+        await call_with_retry(
+            request_factory(session, server.make_url('/down')), breaker
+        )
+    except HTTPException as e:
+        assert e.status_code == 503, e.status_code
+    assert calls['/down'] == down_calls + 1
+    assert breaker.opened_at is not None and not breaker.probing
+
+    # Удачная проба: из параллельных запросов проходит только один
+    await asyncio.sleep(CHECK_RESET_TIMEOUT)
+    results = await asyncio.gather(
+        *(
+            call_with_retry(
+                request_factory(session, server.make_url('/ok')), breaker
+            )
+            for _ in range(5)
+        ),
+        return_exceptions=True
+    )
+    rejected = [
+        result for result in results
+        if isinstance(result, HTTPException) and result.status_code == 503
+    ]
+    assert calls['/ok'] == 1, calls['/ok']
+    assert len(rejected) == 4, results
+    assert breaker.opened_at is None and breaker.failures == 0
+
+    # Цепь замкнута - запросы снова проходят
+    assert await call_with_retry(
+        request_factory(session, server.make_url('/ok')), breaker
+    ) == 'ok'
+
+
+async def main() -> bool:
+    server = TestServer(create_check_app())
+    await server.start_server()
+    session = aiohttp.ClientSession(
+        timeout=aiohttp.ClientTimeout(total=CHECK_TIMEOUT),
+        raise_for_status=True
+    )
+    failed = False
+    try:
+        for check in (check_retries, check_timeouts, check_circuit_breaker):
+            try:
+                await check(server, session)
+            except AssertionError as e:
+                failed = True
+                logger.error(f'{check.__name__} failed: {e!r}')
+            else:
+                logger.info(f'{check.__name__} passed')
+    finally:
+        await session.close()
+        await server.close()
+    return not failed
+
+
+if __name__ == '__main__':
+    sys.exit(0 if asyncio.run(main()) else 1)
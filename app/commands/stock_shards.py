@@ -0,0 +1,38 @@
+"""
+Включение и отключение шардов остатка популярных товаров.
+
+Запуск:
+    python -m app.commands.stock_shards enable 12 34 --shards 8
+    python -m app.commands.stock_shards disable 12 34
+"""
+import argparse
+import asyncio
+
+from loguru import logger
+
+import app.config as conf
+from app.database import async_session_maker
+from app.service.stock_shards import (
+    disable_stock_shards, enable_stock_shards, sync_sharded_stock
+)
+
+
+async def main(action: str, product_ids: list[int], shard_count: int):
+    async with async_session_maker() as db:
+        for product_id in sorted(product_ids):
+            if action == 'enable':
+                await enable_stock_shards(product_id, db, shard_count)
+            else:
+                await disable_stock_shards(product_id, db)
+        await db.commit()
+    await sync_sharded_stock()
+    logger.info(f'Stock shards {action}d for products {product_ids}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('action', choices=['enable', 'disable'])
+    parser.add_argument('product_ids', type=int, nargs='+')
+    parser.add_argument('--shards', type=int, default=conf.STOCK_SHARD_COUNT)
+    args = parser.parse_args()
+    asyncio.run(main(args.action, args.product_ids, args.shards))
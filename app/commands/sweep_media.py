@@ -0,0 +1,27 @@
+"""
+Разовая очистка хранилища от картинок-сирот (то же, что делает
+периодическая задача воркеров).
+
+Запуск: python -m app.commands.sweep_media
+"""
+import asyncio
+
+from loguru import logger
+
+from app.service.cleanup import sweep_media
+from app.service.http_client import create_http_session
+from app.service.storage import create_media_storage
+
+
+async def main():
+    http_session = create_http_session()
+    try:
+        report = await sweep_media(create_media_storage(http_session))
+    finally:
+        await http_session.close()
+    if report is None:
+        logger.info('Media sweep is already running in another process')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
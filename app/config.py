@@ -1,4 +1,5 @@
 import os
+import socket
 import uuid
 from pathlib import Path
 from dotenv import load_dotenv
@@ -30,6 +31,15 @@ MIDDLEWARE_TRUSTED_HOST_ALLOWED_HOSTS = [
     "127.0.0.1"
 ]
 MIDDLEWARE_GZIP_MINIMUM_SIZE = 500
+# Уже сжатые форматы, которые не имеет смысла сжимать повторно
+MIDDLEWARE_GZIP_EXCLUDED_CONTENT_TYPES = (
+    'text/event-stream',
+    'image/',
+    'video/',
+    'audio/',
+    'application/zip',
+    'application/gzip',
+)
 
 # По логированию
 LOGGER_FILE = 'info.log'
@@ -74,9 +84,171 @@ API_VERSION = 'v1'
 DISK_INFO_URL = f'{API_HOST}{API_VERSION}/disk/'
 REQUEST_UPLOAD_URL = f'{DISK_INFO_URL}resources/upload'
 DOWNLOAD_LINK_URL = f'{DISK_INFO_URL}resources/download'
+RESOURCES_URL = f'{DISK_INFO_URL}resources'
+# Файлы лежат в папке приложения, в БД хранится путь app:/<имя файла>
+YANDEX_APP_PATH_PREFIX = 'app:/'
+# Ссылки на скачивание временные: кэшируются меньше их срока жизни
+YANDEX_LINK_CACHE_TTL = 30 * 60
+YANDEX_LINK_CACHE_MAX_SIZE = 10_000
+# Постоянный адрес API, перенаправляющий на актуальную ссылку скачивания
+YANDEX_IMAGE_URL = '/api/v1/media/yandex'
 # "os.environ.get" чуть быстрее "os.getenv"
 DISK_TOKEN = os.environ.get('DISK_TOKEN')
 # Словарь с заголовком авторизации.
 AUTH_HEADERS = {
     'Authorization': f'OAuth {DISK_TOKEN}'
 }
+
+# Канал Postgres LISTEN/NOTIFY для сброса кэшей категорий во всех воркерах
+CATEGORY_CHANGES_CHANNEL = 'categories_changed'
+# Пока подписка не активна, реестр и дерево категорий перечитываются
+# не чаще одного раза за это время (в секундах)
+CATEGORY_REGISTRY_FALLBACK_TTL = 5
+# Пауза перед повторной подпиской после потери соединения для
+# уведомлений: начальная и максимальная (удваивается, в секундах)
+CATEGORY_LISTENER_RECONNECT_DELAY = 1
+CATEGORY_LISTENER_RECONNECT_MAX_DELAY = 60
+
+# Общий HTTP-клиент для внешних хранилищ (создаётся на время жизни воркера)
+HTTP_POOL_LIMIT = 100
+HTTP_POOL_LIMIT_PER_HOST = 20
+HTTP_DNS_CACHE_TTL = 300
+HTTP_KEEPALIVE_TIMEOUT = 30
+# Таймауты запросов (в секундах)
+HTTP_TIMEOUT_TOTAL = 60
+HTTP_TIMEOUT_CONNECT = 5
+HTTP_TIMEOUT_SOCK_READ = 30
+# Повторы запросов с экспоненциальной задержкой
+HTTP_RETRY_ATTEMPTS = 3
+HTTP_RETRY_BACKOFF = 0.5
+# Размыкатель цепи: после стольких ошибок подряд запросы к хранилищу
+# не выполняются в течение HTTP_CIRCUIT_RESET_TIMEOUT секунд
+HTTP_CIRCUIT_FAILURE_THRESHOLD = 5
+HTTP_CIRCUIT_RESET_TIMEOUT = 30
+
+# :::ХРАНИЛИЩЕ МЕДИА:::
+# Бэкенд хранения картинок товаров: 'local', 'yandex' или 's3'
+MEDIA_STORAGE_BACKEND = os.environ.get('MEDIA_STORAGE_BACKEND', 'local')
+# Ограничение одновременных загрузок в хранилище на один воркер
+MEDIA_MAX_CONCURRENT_UPLOADS = 8
+# Одновременные загрузки одного файла: срок его записи загрузкой,
+# вставившей строку media_blobs, после которого запись перехватывает
+# ждущая загрузка, и интервал проверки ссылки (в секундах)
+MEDIA_BLOB_WRITE_TIMEOUT = 2 * 60
+MEDIA_BLOB_WAIT_INTERVAL = 0.2
+# Параметры S3-совместимого хранилища
+S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL')
+S3_REGION = os.environ.get('S3_REGION', 'us-east-1')
+S3_BUCKET = os.environ.get('S3_BUCKET')
+S3_ACCESS_KEY = os.environ.get('S3_ACCESS_KEY')
+S3_SECRET_KEY = os.environ.get('S3_SECRET_KEY')
+# Публичный адрес бакета (CDN), по умолчанию {S3_ENDPOINT_URL}/{S3_BUCKET}
+S3_PUBLIC_URL = os.environ.get('S3_PUBLIC_URL')
+
+# Уменьшенные копии картинок товаров: имя -> максимальные (ширина, высота)
+IMAGE_VARIANTS = {
+    'thumb': (160, 160),
+    'card': (480, 480),
+    'full': (1200, 1200),
+}
+# Формат копий: 'webp' или 'jpeg'
+IMAGE_VARIANT_FORMAT = 'webp'
+IMAGE_VARIANT_QUALITY = 80
+# Количество процессов для обработки картинок (не блокирует event loop)
+IMAGE_PROCESS_WORKERS = 2
+
+# :::РАЗДАЧА МЕДИА:::
+# Файлы с именем по хешу содержимого никогда не меняются
+MEDIA_CACHE_CONTROL_IMMUTABLE = 'public, max-age=31536000, immutable'
+MEDIA_CACHE_CONTROL_DEFAULT = 'public, max-age=86400'
+# Отдача файлов через nginx (X-Accel-Redirect): приложение только находит
+# файл, а nginx отдаёт его с диска через sendfile
+MEDIA_X_ACCEL_REDIRECT = (
+    os.environ.get('MEDIA_X_ACCEL_REDIRECT', 'false').lower() == 'true'
+)
+# internal location nginx, указывающий на папку DIRECTORY_USER_CONTENT
+MEDIA_X_ACCEL_PREFIX = '/protected-media'
+
+# :::ОЧИСТКА МЕДИА:::
+# Очередь фонового удаления картинок (на воркер)
+MEDIA_CLEANUP_QUEUE_SIZE = 1000
+MEDIA_CLEANUP_SHUTDOWN_TIMEOUT = 10
+# Периодическая очистка сирот: интервал, размер пачки и пауза
+# между пачками (ограничение нагрузки на БД и хранилище), в секундах
+MEDIA_SWEEP_INTERVAL = 60 * 60
+MEDIA_SWEEP_BATCH_SIZE = 200
+MEDIA_SWEEP_BATCH_PAUSE = 1
+# Файлы моложе этого возраста не трогаются (загрузка может быть в процессе)
+MEDIA_SWEEP_GRACE_PERIOD = 60 * 60
+# Ключ advisory lock Postgres: очистку выполняет один воркер
+MEDIA_SWEEP_LOCK_KEY = 4_201_337
+
+# :::ОТЛОЖЕННАЯ ЗАГРУЗКА КАРТИНОК:::
+# Папка для дополнительных картинок, ожидающих загрузки в хранилище
+# (вне DIRECTORY_USER_CONTENT, чтобы не раздаваться как статика)
+MEDIA_STAGING_ROOT = BASE_DIR / 'media_staging'
+MEDIA_STAGING_ROOT.mkdir(parents=True, exist_ok=True)
+# Имя узла, на диске которого лежат его отложенные картинки и части
+# сессий загрузки: задачи загрузки берут в работу только воркеры того же
+# узла, части и завершение сессии принимаются только её узлом
+MEDIA_STAGING_NODE = os.getenv('MEDIA_STAGING_NODE') or socket.gethostname()
+# Фоновый обработчик задач: пачка, интервал опроса (в секундах)
+IMAGE_JOB_BATCH_SIZE = 10
+IMAGE_JOB_POLL_INTERVAL = 2
+# Повторы неудачных загрузок с экспоненциальной задержкой (в секундах)
+IMAGE_JOB_MAX_ATTEMPTS = 5
+IMAGE_JOB_RETRY_BACKOFF = 30
+# Задача в работе дольше этого времени (упавший воркер) берётся заново
+IMAGE_JOB_LEASE_TIMEOUT = 5 * 60
+
+# :::ВОЗОБНОВЛЯЕМАЯ ЗАГРУЗКА:::
+# Папка для частично загруженных файлов сессий загрузки (и временных
+# файлов загрузок в удалённые хранилища)
+MEDIA_UPLOAD_ROOT = BASE_DIR / 'media_uploads'
+MEDIA_UPLOAD_ROOT.mkdir(parents=True, exist_ok=True)
+# Время жизни незавершённой сессии загрузки (в секундах)
+UPLOAD_SESSION_TTL = 24 * 60 * 60
+# Аренда смещения на время приёма части (в секундах): запрос, оборвавшийся
+# без освобождения аренды, не блокирует сессию дольше этого времени
+UPLOAD_CHUNK_LEASE_TIMEOUT = 10 * 60
+
+# :::РЕЗЕРВЫ ТОВАРОВ:::
+# Время жизни резерва, продлеваемое при изменении корзины (в секундах)
+STOCK_HOLD_TTL = 15 * 60
+# Очистка истёкших резервов: интервал (в секундах) и размер пачки
+STOCK_HOLD_SWEEP_INTERVAL = 60
+STOCK_HOLD_SWEEP_BATCH_SIZE = 500
+# Пространство ключей advisory lock Postgres для резервов
+# (второй ключ - id покупателя)
+STOCK_HOLD_LOCK_KEY = 4_201_338
+# Число шардов остатка, включаемых для популярного товара по умолчанию
+STOCK_SHARD_COUNT = 8
+# Интервал синхронизации products.stock и карточек товаров
+# с суммой шардов (в секундах)
+STOCK_SHARD_SYNC_INTERVAL = 5
+# Ключ advisory lock Postgres: остатки шардов синхронизирует один воркер
+STOCK_SHARD_SYNC_LOCK_KEY = 4_201_340
+
+# :::ИДЕМПОТЕНТНОСТЬ ЗАКАЗОВ:::
+# Сколько хранится ответ по ключу Idempotency-Key (в секундах)
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+# Сколько повтор ждёт завершения выполняющегося запроса
+# и интервал проверки его состояния (в секундах)
+IDEMPOTENCY_WAIT_TIMEOUT = 30
+IDEMPOTENCY_POLL_INTERVAL = 0.5
+# Запрос в работе дольше этого времени (упавший воркер) выполняется заново
+IDEMPOTENCY_LEASE_TIMEOUT = 5 * 60
+# Интервал удаления устаревших ключей (в секундах)
+IDEMPOTENCY_SWEEP_INTERVAL = 60 * 60
+
+# :::СЕКЦИИ ЗАКАЗОВ:::
+# На сколько месяцев вперёд создаются секции orders и order_items
+ORDER_PARTITION_MONTHS_AHEAD = 3
+# Интервал проверки секций (в секундах)
+ORDER_PARTITION_CHECK_INTERVAL = 24 * 60 * 60
+# Ключ advisory lock Postgres: секции создаёт один воркер
+ORDER_PARTITION_LOCK_KEY = 4_201_339
+# Архивация: секции старше этого числа месяцев выгружаются
+# в сжатый CSV в ORDER_ARCHIVE_ROOT и удаляются из БД
+ORDER_ARCHIVE_AFTER_MONTHS = 24
+ORDER_ARCHIVE_ROOT = BASE_DIR / 'orders_archive'
@@ -36,4 +36,54 @@ TOKEN_DICT_KEY_EXPIRE = 'exp'
 PRODUCT_CART_ITEM_QUANTITY_MIN = 1
 
 ORDER_STATUS_LENGTH_MAX = 20
-ORDER_DEFAULT_STATUS = 'pending'
+ORDER_STATUS_PENDING = 'pending'
+ORDER_STATUS_PAID = 'paid'
+ORDER_STATUS_SHIPPED = 'shipped'
+ORDER_STATUS_DELIVERED = 'delivered'
+ORDER_STATUS_CANCELLED = 'cancelled'
+ORDER_DEFAULT_STATUS = ORDER_STATUS_PENDING
+# Допустимые переходы статусов заказа (из статуса -> в статусы)
+ORDER_STATUS_TRANSITIONS = {
+    ORDER_STATUS_PENDING: (ORDER_STATUS_PAID, ORDER_STATUS_CANCELLED),
+    ORDER_STATUS_PAID: (ORDER_STATUS_SHIPPED, ORDER_STATUS_CANCELLED),
+    ORDER_STATUS_SHIPPED: (ORDER_STATUS_DELIVERED,),
+    ORDER_STATUS_DELIVERED: (),
+    ORDER_STATUS_CANCELLED: (),
+}
+# Наибольшее число заказов в одном запросе смены статусов
+ORDER_STATUS_BULK_MAX_SIZE = 5000
+
+# Статистика продаж продавца: период по умолчанию и наибольший
+# (в днях), число самых продаваемых товаров в ответе
+SELLER_STATS_DEFAULT_DAYS = 30
+SELLER_STATS_MAX_DAYS = 366
+SELLER_STATS_TOP_PRODUCTS = 10
+# Размер страницы списка заказов покупателя
+ORDER_ROUTER_MIN_SIZE = 1
+ORDER_ROUTER_MAX_SIZE = 100
+ORDER_ROUTER_DEFAULT_SIZE = 20
+
+# Статус дополнительных картинок товара (отложенная загрузка)
+IMAGE_STATUS_LENGTH_MAX = 20
+IMAGE_STATUS_READY = 'ready'
+IMAGE_STATUS_PENDING = 'pending'
+IMAGE_STATUS_FAILED = 'failed'
+# Статусы задач загрузки картинок
+IMAGE_JOB_STATUS_PENDING = 'pending'
+IMAGE_JOB_STATUS_PROCESSING = 'processing'
+IMAGE_JOB_STATUS_DONE = 'done'
+IMAGE_JOB_STATUS_FAILED = 'failed'
+# Ошибка, которую повтор не исправит (файл отклонён или потерян)
+IMAGE_JOB_STATUS_REJECTED = 'rejected'
+
+# Сессии возобновляемой загрузки картинок
+UPLOAD_SESSION_STATUS_OPEN = 'open'
+UPLOAD_SESSION_STATUS_FINALIZED = 'finalized'
+# Сколько первых байт файла нужно для проверки его сигнатуры
+UPLOAD_SIGNATURE_LENGTH = 12
+
+# Ключи идемпотентности запросов создания заказов
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+IDEMPOTENCY_STATUS_LENGTH_MAX = 20
+IDEMPOTENCY_STATUS_PROCESSING = 'processing'
+IDEMPOTENCY_STATUS_COMPLETED = 'completed'
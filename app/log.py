@@ -7,6 +7,8 @@ from loguru import logger
 import app.config as conf
 
 
+# log_id по умолчанию для записей вне запроса (фоновые задачи, lifespan)
+logger.configure(extra={'log_id': '-'})
 logger.add(
     conf.LOGGER_FILE,
     format=conf.LOGGER_FORMAT,
@@ -1,20 +1,92 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.httpsredirect import HTTPSRedirectMiddleware
-from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
-from fastapi.staticfiles import StaticFiles
 
 import app.config as conf
+from app.database import async_session_maker
 from app.log import log_middleware
-from app.middlewares import TimingMiddleware
+from app.middlewares import MediaGZipMiddleware, TimingMiddleware
 from app.routers import (
-    categories, products, users, reviews, profiles, orders, carts
+    categories, products, users, reviews, profiles, orders, carts, media,
+    uploads, sellers
+)
+from app.service.cache import (
+    category_registry,
+    listen_category_changes,
+    stop_listening_category_changes
 )
+from app.service.cleanup import MediaCleanupQueue, run_media_sweeper
+from app.service.http_client import create_http_session
+from app.service.idempotency import run_idempotency_key_sweeper
+from app.service.image_jobs import run_image_upload_worker
+from app.service.images import shutdown_image_process_pool
+from app.service.partitions import run_order_partition_maintenance
+from app.service.stock_holds import run_stock_hold_sweeper
+from app.service.stock_shards import run_stock_shard_sync
+from app.service.storage import create_media_storage
+from app.staticfiles import MediaStaticFiles
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Действия при запуске и остановке приложения (каждого воркера)
+    """
+    # Подписка на сброс реестра категорий при их изменении в любом
+    # воркере и загрузка реестра (после подписки, чтобы не пропустить
+    # изменения между загрузкой и подпиской)
+    category_listener = await listen_category_changes()
+    async with async_session_maker() as db:
+        await category_registry.load(db)
+    # Общий HTTP-клиент для внешних хранилищ и выбранное в настройках
+    # хранилище картинок (доступны в request.state)
+    http_session = create_http_session()
+    media_storage = create_media_storage(http_session)
+    # Фоновое удаление картинок и периодическая очистка сирот
+    media_cleanup = MediaCleanupQueue(media_storage)
+    media_cleanup.start()
+    media_sweeper = asyncio.create_task(run_media_sweeper(media_storage))
+    # Фоновая загрузка отложенных дополнительных картинок товаров
+    image_upload_worker = asyncio.create_task(
+        run_image_upload_worker(media_storage)
+    )
+    # Периодическое снятие истёкших резервов товаров
+    stock_hold_sweeper = asyncio.create_task(run_stock_hold_sweeper())
+    # Синхронизация остатков популярных товаров с суммой их шардов
+    stock_shard_sync = asyncio.create_task(run_stock_shard_sync())
+    # Удаление устаревших ключей идемпотентности заказов
+    idempotency_key_sweeper = asyncio.create_task(
+        run_idempotency_key_sweeper()
+    )
+    # Создание будущих месячных секций заказов
+    order_partition_maintenance = asyncio.create_task(
+        run_order_partition_maintenance()
+    )
+    yield {
+        'http_session': http_session,
+        'media_storage': media_storage,
+        'media_cleanup': media_cleanup,
+    }
+    order_partition_maintenance.cancel()
+    idempotency_key_sweeper.cancel()
+    stock_shard_sync.cancel()
+    stock_hold_sweeper.cancel()
+    image_upload_worker.cancel()
+    media_sweeper.cancel()
+    await media_cleanup.stop()
+    await http_session.close()
+    await stop_listening_category_changes(category_listener)
+    shutdown_image_process_pool()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # монтирование подприложения для обслуживания статических файлов
+# (с заголовками кэширования и режимом отдачи через nginx)
 # P.S.
 # - Все запросы, начинающиеся с /media, будут обр-ся этим подприложением
 # - StaticFiles(directory="media") указывает, что файлы нужно брать
@@ -24,7 +96,7 @@ app = FastAPI()
 # или в документации).
 app.mount(
     f'/{conf.DIRECTORY_USER_CONTENT}',
-    StaticFiles(directory=conf.DIRECTORY_USER_CONTENT),
+    MediaStaticFiles(directory=conf.DIRECTORY_USER_CONTENT),
     name=conf.DIRECTORY_USER_CONTENT
 )
 
@@ -43,12 +115,16 @@ app_v1.include_router(users.router)
 app_v1.include_router(reviews.router)
 app_v1.include_router(orders.router_1)
 app_v1.include_router(carts.router)
+app_v1.include_router(media.router)
+app_v1.include_router(uploads.router)
+app_v1.include_router(sellers.router)
 
 
 app.mount('/api/v1', app_v1)
 
+# Сжатие ответов, кроме уже сжатых форматов (картинки и т.п.)
 app.add_middleware(
-    GZipMiddleware, minimum_size=conf.MIDDLEWARE_GZIP_MINIMUM_SIZE
+    MediaGZipMiddleware, minimum_size=conf.MIDDLEWARE_GZIP_MINIMUM_SIZE
 )
 # app.add_middleware(HTTPSRedirectMiddleware)
 app.add_middleware(
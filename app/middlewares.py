@@ -1,5 +1,10 @@
 import time
 
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware, GZipResponder
+
+import app.config as conf
+
 
 class TimingMiddleware:
     """Вывод времени запроса в консоль"""
@@ -11,3 +16,36 @@ class TimingMiddleware:
         await self.app(scope, receive, send)
         duration = time.time() - start_time
         print(f"----Request duration: {duration:.10f} seconds")
+
+
+class MediaGZipResponder(GZipResponder):
+    """Сжатие ответа, кроме уже сжатых форматов (картинки и т.п.)"""
+    async def send_with_compression(self, message):
+        if message['type'] == 'http.response.start':
+            content_type = Headers(raw=message['headers']).get(
+                'content-type', ''
+            )
+            await super().send_with_compression(message)
+            self.content_type_is_excluded = content_type.startswith(
+                conf.MIDDLEWARE_GZIP_EXCLUDED_CONTENT_TYPES
+            )
+            return
+        await super().send_with_compression(message)
+
+
+class MediaGZipMiddleware(GZipMiddleware):
+    """
+    GZipMiddleware, не сжимающий типы из
+    MIDDLEWARE_GZIP_EXCLUDED_CONTENT_TYPES
+    """
+    async def __call__(self, scope, receive, send):
+        if (
+            scope['type'] == 'http'
+            and 'gzip' in Headers(scope=scope).get('Accept-Encoding', '')
+        ):
+            responder = MediaGZipResponder(
+                self.app, self.minimum_size, compresslevel=self.compresslevel
+            )
+            await responder(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
@@ -0,0 +1,73 @@
+"""create product_cards
+
+Revision ID: 7e5a2c9b4f13
+Revises: 4b1f0c7d2a91
+Create Date: 2026-10-19 13:40:07.284519
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7e5a2c9b4f13'
+down_revision: Union[str, Sequence[str], None] = '4b1f0c7d2a91'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('product_cards',
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('price', sa.Float(), nullable=False),
+    sa.Column('stock', sa.Integer(), nullable=False),
+    sa.Column('rating', sa.Float(), nullable=False),
+    sa.Column('is_active', sa.Boolean(), nullable=False),
+    sa.Column('image_url', sa.String(), nullable=True),
+    sa.Column('category_id', sa.Integer(), nullable=False),
+    sa.Column('category_name', sa.String(length=50), nullable=False),
+    sa.Column('seller_id', sa.Integer(), nullable=False),
+    sa.Column('seller_name', sa.String(), nullable=False),
+    sa.Column('review_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['product_id'], ['products.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('product_id')
+    )
+    op.create_index('ix_product_cards_is_active_category_id', 'product_cards', ['is_active', 'category_id'], unique=False)
+    op.create_index('ix_product_cards_is_active_seller_id', 'product_cards', ['is_active', 'seller_id'], unique=False)
+    # Заполнение карточек по существующим товарам
+    op.execute(
+        """
+        INSERT INTO product_cards (
+            product_id, name, price, stock, rating, is_active, image_url,
+            category_id, category_name, seller_id, seller_name, review_count
+        )
+        SELECT
+            products.id, products.name, products.price, products.stock,
+            products.rating, products.is_active,
+            coalesce(
+                products.image_url,
+                (SELECT images.title_url FROM images
+                 WHERE images.product_id = products.id
+                 ORDER BY images.id LIMIT 1)
+            ),
+            products.category_id, categories.name,
+            products.seller_id, users.email,
+            (SELECT count(*) FROM reviews
+             WHERE reviews.product_id = products.id
+             AND reviews.is_active = true)
+        FROM products
+        JOIN categories ON categories.id = products.category_id
+        JOIN users ON users.id = products.seller_id
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_product_cards_is_active_seller_id', table_name='product_cards')
+    op.drop_index('ix_product_cards_is_active_category_id', table_name='product_cards')
+    op.drop_table('product_cards')
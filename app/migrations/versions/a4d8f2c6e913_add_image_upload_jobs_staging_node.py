@@ -0,0 +1,34 @@
+"""add image_upload_jobs staging_node
+
+Revision ID: a4d8f2c6e913
+Revises: f3a9c5e7b214
+Create Date: 2026-10-20 10:41:17.502946
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4d8f2c6e913'
+down_revision: Union[str, Sequence[str], None] = 'f3a9c5e7b214'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Задачи, поставленные до появления колонки, остаются без узла
+    # и берутся любым воркером, как раньше
+    op.add_column('image_upload_jobs', sa.Column('staging_node', sa.String(), nullable=True))
+    op.drop_index('ix_image_upload_jobs_status_next_attempt_at', table_name='image_upload_jobs')
+    op.create_index('ix_image_upload_jobs_node_status_next_attempt_at', 'image_upload_jobs', ['staging_node', 'status', 'next_attempt_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_image_upload_jobs_node_status_next_attempt_at', table_name='image_upload_jobs')
+    op.create_index('ix_image_upload_jobs_status_next_attempt_at', 'image_upload_jobs', ['status', 'next_attempt_at'], unique=False)
+    op.drop_column('image_upload_jobs', 'staging_node')
@@ -0,0 +1,50 @@
+"""create image_upload_jobs and products.image_status
+
+Revision ID: a9d4e6b1c372
+Revises: f1a7c3e9b204
+Create Date: 2026-10-19 17:25:51.604118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a9d4e6b1c372'
+down_revision: Union[str, Sequence[str], None] = 'f1a7c3e9b204'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('products', sa.Column('image_status', sa.String(length=20), server_default='ready', nullable=False))
+    op.alter_column('products', 'image_status', server_default=None)
+    op.create_table('image_upload_jobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('position', sa.Integer(), nullable=False),
+    sa.Column('staged_name', sa.String(), nullable=False),
+    sa.Column('original_name', sa.String(), nullable=True),
+    sa.Column('content_type', sa.String(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('last_error', sa.String(), nullable=True),
+    sa.Column('next_attempt_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+    sa.ForeignKeyConstraint(['product_id'], ['products.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_image_upload_jobs_status_next_attempt_at', 'image_upload_jobs', ['status', 'next_attempt_at'], unique=False)
+    op.create_index('ix_image_upload_jobs_product_id', 'image_upload_jobs', ['product_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_image_upload_jobs_product_id', table_name='image_upload_jobs')
+    op.drop_index('ix_image_upload_jobs_status_next_attempt_at', table_name='image_upload_jobs')
+    op.drop_table('image_upload_jobs')
+    op.drop_column('products', 'image_status')
@@ -0,0 +1,70 @@
+"""add stock reserved counters
+
+Revision ID: b5e9d3a7c152
+Revises: a4d8f2c6e913
+Create Date: 2026-10-20 14:08:52.317640
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5e9d3a7c152'
+down_revision: Union[str, Sequence[str], None] = 'a4d8f2c6e913'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('products', sa.Column('reserved', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('product_stock_shards', sa.Column('reserved', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('stock_holds', sa.Column('shard', sa.Integer(), nullable=True))
+    # Резервы популярных товаров раскладываются по шардам,
+    # счётчики заполняются по существующим резервам
+    op.execute(
+        """
+        UPDATE stock_holds
+        SET shard = stock_holds.id % products.stock_shards
+        FROM products
+        WHERE products.id = stock_holds.product_id
+            AND products.stock_shards > 0
+        """
+    )
+    op.execute(
+        """
+        UPDATE products
+        SET reserved = held.quantity
+        FROM (
+            SELECT product_id, sum(quantity) AS quantity
+            FROM stock_holds
+            WHERE shard IS NULL
+            GROUP BY product_id
+        ) AS held
+        WHERE products.id = held.product_id
+        """
+    )
+    op.execute(
+        """
+        UPDATE product_stock_shards
+        SET reserved = held.quantity
+        FROM (
+            SELECT product_id, shard, sum(quantity) AS quantity
+            FROM stock_holds
+            WHERE shard IS NOT NULL
+            GROUP BY product_id, shard
+        ) AS held
+        WHERE product_stock_shards.product_id = held.product_id
+            AND product_stock_shards.shard = held.shard
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('stock_holds', 'shard')
+    op.drop_column('product_stock_shards', 'reserved')
+    op.drop_column('products', 'reserved')
@@ -0,0 +1,49 @@
+"""add product snapshot to order_items
+
+Revision ID: b7e3f9a2c451
+Revises: a5d1e7f3b864
+Create Date: 2026-10-19 21:20:33.604127
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e3f9a2c451'
+down_revision: Union[str, Sequence[str], None] = 'a5d1e7f3b864'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('order_items', sa.Column('product_name', sa.String(length=100), nullable=True))
+    op.add_column('order_items', sa.Column('product_image_url', sa.String(length=200), nullable=True))
+    op.add_column('order_items', sa.Column('seller_id', sa.Integer(), nullable=True))
+    # Снимок для уже созданных заказов - текущее состояние товара
+    op.execute(
+        """
+        UPDATE order_items
+        SET product_name = products.name,
+            product_image_url = products.image_url,
+            seller_id = products.seller_id
+        FROM products
+        WHERE products.id = order_items.product_id
+        """
+    )
+    op.alter_column('order_items', 'product_name', nullable=False)
+    op.alter_column('order_items', 'seller_id', nullable=False)
+    op.create_foreign_key('order_items_seller_id_fkey', 'order_items', 'users', ['seller_id'], ['id'])
+    op.create_index(op.f('ix_order_items_product_image_url'), 'order_items', ['product_image_url'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_order_items_product_image_url'), table_name='order_items')
+    op.drop_constraint('order_items_seller_id_fkey', 'order_items', type_='foreignkey')
+    op.drop_column('order_items', 'seller_id')
+    op.drop_column('order_items', 'product_image_url')
+    op.drop_column('order_items', 'product_name')
@@ -0,0 +1,33 @@
+"""add media_blobs variants
+
+Revision ID: c8a4e6f1d327
+Revises: b5e9d3a7c152
+Create Date: 2026-10-20 16:32:05.914268
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c8a4e6f1d327'
+down_revision: Union[str, Sequence[str], None] = 'b5e9d3a7c152'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Копии уже загруженных картинок записывает
+    # python -m app.commands.backfill_image_variants
+    op.add_column('media_blobs', sa.Column('variants', postgresql.ARRAY(sa.String()), nullable=True))
+    op.create_index(op.f('ix_media_blobs_url'), 'media_blobs', ['url'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_media_blobs_url'), table_name='media_blobs')
+    op.drop_column('media_blobs', 'variants')
@@ -0,0 +1,191 @@
+"""partition orders and order_items by order_date
+
+Revision ID: c9f4a1d7e238
+Revises: b7e3f9a2c451
+Create Date: 2026-10-19 22:05:47.281930
+
+"""
+from datetime import date, datetime, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c9f4a1d7e238'
+down_revision: Union[str, Sequence[str], None] = 'b7e3f9a2c451'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Секции создаются до текущего месяца + MONTHS_AHEAD, дальше их
+# создаёт app.service.partitions (ORDER_PARTITION_MONTHS_AHEAD)
+MONTHS_AHEAD = 3
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def create_partitions() -> None:
+    """Месячные секции от первого заказа до будущих месяцев и секции по умолчанию"""
+    current_month = datetime.now(timezone.utc).date().replace(day=1)
+    first_order_date = op.get_bind().scalar(
+        sa.text('SELECT min(order_date) FROM orders_old')
+    )
+    month = current_month
+    if first_order_date is not None:
+        month = min(
+            month,
+            first_order_date.astimezone(timezone.utc).date().replace(day=1)
+        )
+    while month <= add_months(current_month, MONTHS_AHEAD):
+        end = add_months(month, 1)
+        for table in ('orders', 'order_items'):
+            op.execute(
+                f'CREATE TABLE {table}_y{month.year}m{month.month:02d} '
+                f'PARTITION OF {table} FOR VALUES '
+                f"FROM ('{month} 00:00:00+00') TO ('{end} 00:00:00+00')"
+            )
+        month = end
+    for table in ('orders', 'order_items'):
+        op.execute(f'CREATE TABLE {table}_default PARTITION OF {table} DEFAULT')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Старые таблицы переименовываются, данные переносятся в новые
+    # секционированные. Последовательность id заказов сохраняется
+    op.drop_index('ix_orders_buyer_id_order_date', table_name='orders')
+    op.drop_index(op.f('ix_order_items_product_image_url'), table_name='order_items')
+    op.drop_index(op.f('ix_order_items_product_id'), table_name='order_items')
+    op.drop_index(op.f('ix_order_items_order_id'), table_name='order_items')
+    op.rename_table('orders', 'orders_old')
+    op.rename_table('order_items', 'order_items_old')
+    op.execute('ALTER TABLE orders_old RENAME CONSTRAINT orders_pkey TO orders_old_pkey')
+    op.execute('ALTER TABLE order_items_old RENAME CONSTRAINT order_items_pkey TO order_items_old_pkey')
+    op.execute('ALTER SEQUENCE orders_id_seq OWNED BY NONE')
+
+    op.create_table('orders',
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('orders_id_seq')"), nullable=False),
+    sa.Column('order_date', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('total', sa.Numeric(precision=10, scale=2), nullable=False),
+    sa.Column('buyer_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.PrimaryKeyConstraint('id', 'order_date'),
+    postgresql_partition_by='RANGE (order_date)'
+    )
+    op.create_table('order_items',
+    sa.Column('order_id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('order_date', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('price', sa.Numeric(precision=10, scale=2), nullable=False),
+    sa.Column('product_name', sa.String(length=100), nullable=False),
+    sa.Column('product_image_url', sa.String(length=200), nullable=True),
+    sa.Column('seller_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['order_id', 'order_date'], ['orders.id', 'orders.order_date'], ),
+    sa.ForeignKeyConstraint(['product_id'], ['products.id'], ),
+    sa.ForeignKeyConstraint(['seller_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('order_id', 'product_id', 'order_date'),
+    postgresql_partition_by='RANGE (order_date)'
+    )
+    create_partitions()
+
+    op.execute(
+        """
+        INSERT INTO orders (id, order_date, updated_at, total, buyer_id, status)
+        SELECT id, order_date, updated_at, total, buyer_id, status
+        FROM orders_old
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO order_items (
+            order_id, product_id, order_date, quantity, price,
+            product_name, product_image_url, seller_id
+        )
+        SELECT order_items_old.order_id, order_items_old.product_id,
+               orders_old.order_date, order_items_old.quantity,
+               order_items_old.price, order_items_old.product_name,
+               order_items_old.product_image_url, order_items_old.seller_id
+        FROM order_items_old
+        JOIN orders_old ON orders_old.id = order_items_old.order_id
+        """
+    )
+    # Индексы создаются после переноса данных (во всех секциях сразу)
+    op.create_index('ix_orders_buyer_id_order_date', 'orders', ['buyer_id', 'order_date'], unique=False)
+    op.create_index(op.f('ix_order_items_order_id'), 'order_items', ['order_id'], unique=False)
+    op.create_index(op.f('ix_order_items_product_id'), 'order_items', ['product_id'], unique=False)
+    op.create_index(op.f('ix_order_items_product_image_url'), 'order_items', ['product_image_url'], unique=False)
+
+    op.drop_table('order_items_old')
+    op.drop_table('orders_old')
+    op.execute('ALTER SEQUENCE orders_id_seq OWNED BY orders.id')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Секции (в том числе отсоединённые архивацией данные) не возвращаются:
+    # переносится то, что сейчас есть в секционированных таблицах
+    op.drop_index(op.f('ix_order_items_product_image_url'), table_name='order_items')
+    op.drop_index(op.f('ix_order_items_product_id'), table_name='order_items')
+    op.drop_index(op.f('ix_order_items_order_id'), table_name='order_items')
+    op.drop_index('ix_orders_buyer_id_order_date', table_name='orders')
+    op.rename_table('orders', 'orders_partitioned')
+    op.rename_table('order_items', 'order_items_partitioned')
+    op.execute('ALTER TABLE orders_partitioned RENAME CONSTRAINT orders_pkey TO orders_partitioned_pkey')
+    op.execute('ALTER TABLE order_items_partitioned RENAME CONSTRAINT order_items_pkey TO order_items_partitioned_pkey')
+    op.execute('ALTER SEQUENCE orders_id_seq OWNED BY NONE')
+
+    op.create_table('orders',
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('orders_id_seq')"), nullable=False),
+    sa.Column('order_date', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('total', sa.Numeric(precision=10, scale=2), nullable=False),
+    sa.Column('buyer_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('order_items',
+    sa.Column('order_id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('price', sa.Numeric(precision=10, scale=2), nullable=False),
+    sa.Column('product_name', sa.String(length=100), nullable=False),
+    sa.Column('product_image_url', sa.String(length=200), nullable=True),
+    sa.Column('seller_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['order_id'], ['orders.id'], ),
+    sa.ForeignKeyConstraint(['product_id'], ['products.id'], ),
+    sa.ForeignKeyConstraint(['seller_id'], ['users.id'], name='order_items_seller_id_fkey'),
+    sa.PrimaryKeyConstraint('order_id', 'product_id')
+    )
+    op.execute(
+        """
+        INSERT INTO orders (id, order_date, updated_at, total, buyer_id, status)
+        SELECT id, order_date, updated_at, total, buyer_id, status
+        FROM orders_partitioned
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO order_items (
+            order_id, product_id, quantity, price,
+            product_name, product_image_url, seller_id
+        )
+        SELECT order_id, product_id, quantity, price,
+               product_name, product_image_url, seller_id
+        FROM order_items_partitioned
+        """
+    )
+    op.create_index('ix_orders_buyer_id_order_date', 'orders', ['buyer_id', 'order_date'], unique=False)
+    op.create_index(op.f('ix_order_items_order_id'), 'order_items', ['order_id'], unique=False)
+    op.create_index(op.f('ix_order_items_product_id'), 'order_items', ['product_id'], unique=False)
+    op.create_index(op.f('ix_order_items_product_image_url'), 'order_items', ['product_image_url'], unique=False)
+
+    # Удаление секционированной таблицы удаляет и её секции
+    op.drop_table('order_items_partitioned')
+    op.drop_table('orders_partitioned')
+    op.execute('ALTER SEQUENCE orders_id_seq OWNED BY orders.id')
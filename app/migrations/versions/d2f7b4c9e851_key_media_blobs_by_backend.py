@@ -0,0 +1,62 @@
+"""key media_blobs by backend
+
+Revision ID: d2f7b4c9e851
+Revises: c8a4e6f1d327
+Create Date: 2026-10-20 18:47:26.105893
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2f7b4c9e851'
+down_revision: Union[str, Sequence[str], None] = 'c8a4e6f1d327'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Недописанные файлы (запись прервана) не переносятся,
+    # оставшиеся в хранилище файлы уберёт очистка сирот
+    op.execute('DELETE FROM media_blobs WHERE url IS NULL')
+    op.add_column('media_blobs', sa.Column('backend', sa.String(), nullable=True))
+    op.add_column('media_blobs', sa.Column('writing_until', sa.DateTime(timezone=True), nullable=True))
+    # Бэкенд восстанавливается по виду ссылки на файл
+    op.execute(
+        """
+        UPDATE media_blobs
+        SET backend = CASE
+            WHEN url LIKE 'app:/%' THEN 'yandex'
+            WHEN url LIKE '/%' THEN 'local'
+            ELSE 's3'
+        END
+        """
+    )
+    op.alter_column('media_blobs', 'backend', nullable=False)
+    op.drop_constraint('media_blobs_file_name_key', 'media_blobs', type_='unique')
+    op.drop_constraint('media_blobs_pkey', 'media_blobs', type_='primary')
+    op.create_primary_key('media_blobs_pkey', 'media_blobs', ['backend', 'digest'])
+    op.create_unique_constraint('uq_media_blobs_backend_file_name', 'media_blobs', ['backend', 'file_name'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Из копий одного файла в разных хранилищах остаётся одна
+    op.execute(
+        """
+        DELETE FROM media_blobs
+        WHERE (backend, digest) NOT IN (
+            SELECT min(backend), digest FROM media_blobs GROUP BY digest
+        )
+        """
+    )
+    op.drop_constraint('uq_media_blobs_backend_file_name', 'media_blobs', type_='unique')
+    op.drop_constraint('media_blobs_pkey', 'media_blobs', type_='primary')
+    op.create_primary_key('media_blobs_pkey', 'media_blobs', ['digest'])
+    op.create_unique_constraint('media_blobs_file_name_key', 'media_blobs', ['file_name'])
+    op.drop_column('media_blobs', 'writing_until')
+    op.drop_column('media_blobs', 'backend')
@@ -0,0 +1,41 @@
+"""create order_status_events
+
+Revision ID: d4a8e2f6b319
+Revises: c9f4a1d7e238
+Create Date: 2026-10-19 22:41:12.907354
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4a8e2f6b319'
+down_revision: Union[str, Sequence[str], None] = 'c9f4a1d7e238'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('order_status_events',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('order_id', sa.Integer(), nullable=False),
+    sa.Column('order_date', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('buyer_id', sa.Integer(), nullable=False),
+    sa.Column('from_status', sa.String(length=20), nullable=True),
+    sa.Column('to_status', sa.String(length=20), nullable=False),
+    sa.Column('changed_by', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('published_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_order_status_events_unpublished', 'order_status_events', ['id'], unique=False, postgresql_where=sa.text('published_at IS NULL'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_order_status_events_unpublished', table_name='order_status_events', postgresql_where=sa.text('published_at IS NULL'))
+    op.drop_table('order_status_events')
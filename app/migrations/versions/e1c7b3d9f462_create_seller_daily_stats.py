@@ -0,0 +1,60 @@
+"""create seller_daily_stats
+
+Revision ID: e1c7b3d9f462
+Revises: d4a8e2f6b319
+Create Date: 2026-10-19 23:12:38.164205
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e1c7b3d9f462'
+down_revision: Union[str, Sequence[str], None] = 'd4a8e2f6b319'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('seller_daily_stats',
+    sa.Column('seller_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('slot', sa.Integer(), nullable=False),
+    sa.Column('revenue', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('units_sold', sa.Integer(), nullable=False),
+    sa.Column('orders_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['product_id'], ['products.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['seller_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('seller_id', 'day', 'product_id', 'slot')
+    )
+    # Статистика по уже оформленным (и не отменённым) заказам
+    op.execute(
+        """
+        INSERT INTO seller_daily_stats (
+            seller_id, day, product_id, slot,
+            revenue, units_sold, orders_count
+        )
+        SELECT order_items.seller_id,
+               (order_items.order_date AT TIME ZONE 'UTC')::date,
+               order_items.product_id,
+               0,
+               sum(order_items.quantity * order_items.price),
+               sum(order_items.quantity),
+               count(*)
+        FROM order_items
+        JOIN orders ON orders.id = order_items.order_id
+            AND orders.order_date = order_items.order_date
+        WHERE coalesce(orders.status, 'pending') <> 'cancelled'
+        GROUP BY 1, 2, 3
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('seller_daily_stats')
@@ -0,0 +1,29 @@
+"""add updated_at to media_blobs
+
+Revision ID: e4b9d2a6c815
+Revises: c3e8a1f5d627
+Create Date: 2026-10-19 16:03:27.551046
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4b9d2a6c815'
+down_revision: Union[str, Sequence[str], None] = 'c3e8a1f5d627'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('media_blobs', sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False))
+    op.alter_column('media_blobs', 'updated_at', server_default=None)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('media_blobs', 'updated_at')
@@ -0,0 +1,30 @@
+"""add upload_sessions upload_node
+
+Revision ID: e7c3a9f5b216
+Revises: d2f7b4c9e851
+Create Date: 2026-10-20 19:12:08.417365
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7c3a9f5b216'
+down_revision: Union[str, Sequence[str], None] = 'd2f7b4c9e851'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Сессии, открытые до появления колонки, остаются без узла
+    # и принимаются любым узлом, как раньше
+    op.add_column('upload_sessions', sa.Column('upload_node', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('upload_sessions', 'upload_node')
@@ -0,0 +1,50 @@
+"""store yandex disk paths instead of download links
+
+Revision ID: f1a7c3e9b204
+Revises: e4b9d2a6c815
+Create Date: 2026-10-19 16:48:10.372915
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1a7c3e9b204'
+down_revision: Union[str, Sequence[str], None] = 'e4b9d2a6c815'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Временные ссылки на скачивание с яндекс диска содержат имя файла
+# в параметре filename, по нему восстанавливается путь app:/<имя файла>
+COLUMNS = (
+    ('products', 'image_url'),
+    ('images', 'title_url'),
+    ('product_cards', 'image_url'),
+    ('media_blobs', 'url'),
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table, column in COLUMNS:
+        op.execute(
+            f"""
+            UPDATE {table}
+            SET {column} = 'app:/' || substring(
+                {column} from '[?&]filename=([^&]+)'
+            )
+            WHERE {column} ~ '^https://downloader\\.disk\\.yandex\\.'
+              AND {column} ~ '[?&]filename='
+            """
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Временные ссылки к этому моменту уже недействительны,
+    # пути к файлам остаются как есть
+    pass
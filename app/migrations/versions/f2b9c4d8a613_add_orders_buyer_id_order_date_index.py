@@ -0,0 +1,28 @@
+"""add orders buyer_id order_date index
+
+Revision ID: f2b9c4d8a613
+Revises: e8a4b2c6d917
+Create Date: 2026-10-19 20:12:40.926381
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2b9c4d8a613'
+down_revision: Union[str, Sequence[str], None] = 'e8a4b2c6d917'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_orders_buyer_id_order_date', 'orders', ['buyer_id', 'order_date'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_orders_buyer_id_order_date', table_name='orders')
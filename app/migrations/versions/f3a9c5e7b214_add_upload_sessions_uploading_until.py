@@ -0,0 +1,28 @@
+"""add upload_sessions uploading_until
+
+Revision ID: f3a9c5e7b214
+Revises: e1c7b3d9f462
+Create Date: 2026-10-20 10:04:51.318207
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3a9c5e7b214'
+down_revision: Union[str, Sequence[str], None] = 'e1c7b3d9f462'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('upload_sessions', sa.Column('uploading_until', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('upload_sessions', 'uploading_until')
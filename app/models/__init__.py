@@ -1,4 +1,5 @@
 from .categories import Category
+from .category_closures import CategoryClosure
 from .cart_items import CartItem
 from .products import Product
 from .users import User
@@ -6,7 +7,19 @@ from .reviews import Review
 from .profiles import Profile
 from .orders import Order, OrderItem
 from .images import Image
+from .product_cards import ProductCard
+from .media_blobs import MediaBlob
+from .image_upload_jobs import ImageUploadJob
+from .upload_sessions import UploadSession
+from .stock_holds import StockHold
+from .product_stock_shards import ProductStockShard
+from .idempotency_keys import IdempotencyKey
+from .order_status_events import OrderStatusEvent
+from .seller_daily_stats import SellerDailyStat
 __all__ = [
     "Category", "Product", "User", "Review",
-    "Profile", "Order", "OrderItem", "CartItem", "Image"
+    "Profile", "Order", "OrderItem", "CartItem", "Image",
+    "CategoryClosure", "ProductCard", "MediaBlob", "ImageUploadJob",
+    "UploadSession", "StockHold", "ProductStockShard",
+    "IdempotencyKey", "OrderStatusEvent", "SellerDailyStat"
 ]
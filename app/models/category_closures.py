@@ -0,0 +1,25 @@
+from sqlalchemy import ForeignKey, Integer, Index
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database import Base
+
+
+class CategoryClosure(Base):
+    """
+    Таблица замыкания (closure table) для дерева категорий.
+    Хранит все пары предок-потомок (включая саму категорию с depth = 0),
+    что позволяет получать всё поддерево категории одним индексным запросом
+    """
+    __tablename__ = "category_closures"
+
+    ancestor_id: Mapped[int] = mapped_column(
+        ForeignKey("categories.id", ondelete="CASCADE"), primary_key=True
+    )
+    descendant_id: Mapped[int] = mapped_column(
+        ForeignKey("categories.id", ondelete="CASCADE"), primary_key=True
+    )
+    depth: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_category_closures_descendant_id", "descendant_id"),
+    )
@@ -0,0 +1,53 @@
+from datetime import datetime
+
+from sqlalchemy import (
+    DateTime, ForeignKey, Index, Integer, String, Text, UniqueConstraint,
+    func
+)
+from sqlalchemy.orm import Mapped, mapped_column
+
+import app.constants as c
+from app.database import Base
+
+
+class IdempotencyKey(Base):
+    """
+    Ключ Idempotency-Key запроса покупателя с сохранённым ответом.
+    Повтор запроса с тем же ключом получает сохранённый ответ,
+    а не выполняет запрос заново
+    """
+    __tablename__ = "idempotency_keys"
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "key", name="uq_idempotency_keys_user_key"),
+        Index("ix_idempotency_keys_created_at", "created_at"),
+    )
+    id: Mapped[int] = mapped_column(primary_key=True)
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey("users.id", ondelete="CASCADE"), nullable=False
+    )
+    key: Mapped[str] = mapped_column(
+        String(c.IDEMPOTENCY_KEY_MAX_LENGTH), nullable=False
+    )
+    # SHA-256 метода, пути и параметров запроса: ключ нельзя
+    # использовать повторно для другого запроса
+    request_hash: Mapped[str] = mapped_column(String(64), nullable=False)
+    status: Mapped[str] = mapped_column(
+        String(c.IDEMPOTENCY_STATUS_LENGTH_MAX),
+        default=c.IDEMPOTENCY_STATUS_PROCESSING,
+        nullable=False
+    )
+    response_status: Mapped[int | None] = mapped_column(
+        Integer, nullable=True
+    )
+    # Готовый JSON ответа
+    response_body: Mapped[str | None] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        onupdate=func.now(),
+        nullable=False
+    )
@@ -0,0 +1,53 @@
+from datetime import datetime
+
+from sqlalchemy import ForeignKey, String, Integer, DateTime, Index, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+import app.constants as c
+from app.database import Base
+
+
+class ImageUploadJob(Base):
+    """
+    Задача фоновой загрузки дополнительной картинки товара в хранилище.
+    Файл до загрузки лежит в MEDIA_STAGING_ROOT узла staging_node
+    под именем staged_name
+    """
+    __tablename__ = "image_upload_jobs"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    product_id: Mapped[int] = mapped_column(
+        ForeignKey("products.id", ondelete="CASCADE"), nullable=False
+    )
+    # Порядок картинки среди загруженных вместе с товаром
+    position: Mapped[int] = mapped_column(Integer, nullable=False)
+    staged_name: Mapped[str] = mapped_column(String, nullable=False)
+    staging_node: Mapped[str | None] = mapped_column(String, nullable=True)
+    original_name: Mapped[str | None] = mapped_column(String, nullable=True)
+    content_type: Mapped[str] = mapped_column(String, nullable=False)
+    status: Mapped[str] = mapped_column(
+        String(c.IMAGE_STATUS_LENGTH_MAX),
+        default=c.IMAGE_JOB_STATUS_PENDING,
+        nullable=False
+    )
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    last_error: Mapped[str | None] = mapped_column(String, nullable=True)
+    # Не раньше этого времени задача берётся в работу (повторы с задержкой)
+    next_attempt_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=func.now(), nullable=False
+    )
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=func.now(), nullable=False
+    )
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=func.now(), onupdate=func.now(),
+        nullable=False
+    )
+
+    __table_args__ = (
+        Index(
+            "ix_image_upload_jobs_node_status_next_attempt_at",
+            "staging_node", "status", "next_attempt_at"
+        ),
+        Index("ix_image_upload_jobs_product_id", "product_id"),
+    )
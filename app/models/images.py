@@ -1,12 +1,16 @@
 from datetime import datetime
 
 from sqlalchemy import (
-    ForeignKey, String, Boolean, DateTime, Float, Computed, Integer, func
+    ForeignKey, String, Boolean, DateTime, Float, Computed, Integer, func,
+    select
+)
+from sqlalchemy.orm import (
+    Mapped, column_property, mapped_column, relationship
 )
-from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 import app.constants as c
 from app.database import Base
+from app.models.media_blobs import MediaBlob
 
 
 class Image(Base):
@@ -19,6 +23,12 @@ class Image(Base):
     title_url: Mapped[str] = mapped_column(
         nullable=False
     )
+    # Записанные уменьшенные копии картинки
+    variant_names: Mapped[list[str] | None] = column_property(
+        select(MediaBlob.variants)
+        .where(MediaBlob.url == title_url)
+        .scalar_subquery()
+    )
     is_active: Mapped[bool] = mapped_column(Boolean, default=True)
     product_id: Mapped[int] = mapped_column(
         ForeignKey("products.id"), nullable=False
@@ -0,0 +1,50 @@
+from datetime import datetime
+
+from sqlalchemy import String, Integer, DateTime, UniqueConstraint, func
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database import Base
+
+
+class MediaBlob(Base):
+    """
+    Загруженный в хранилище файл картинки, адресуемый по бэкенду
+    хранилища и SHA-256 содержимого. Один файл может использоваться
+    многими товарами, ref_count хранит число ссылок на него
+    """
+    __tablename__ = "media_blobs"
+
+    __table_args__ = (
+        UniqueConstraint(
+            "backend", "file_name", name="uq_media_blobs_backend_file_name"
+        ),
+    )
+    # Хранилище, в которое записан файл (MediaStorage.name): после смены
+    # бэкенда файл записывается в новое хранилище заново
+    backend: Mapped[str] = mapped_column(String, primary_key=True)
+    digest: Mapped[str] = mapped_column(String(64), primary_key=True)
+    file_name: Mapped[str] = mapped_column(String, nullable=False)
+    # Ссылка на файл появляется после успешной записи в хранилище
+    url: Mapped[str | None] = mapped_column(nullable=True, index=True)
+    # Срок записи файла процессом, вставившим строку: пока он
+    # не истёк, остальные загрузки того же файла ждут ссылку
+    writing_until: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+    # Записанные уменьшенные копии картинки (None - копий нет)
+    variants: Mapped[list[str] | None] = mapped_column(
+        ARRAY(String), nullable=True
+    )
+    ref_count: Mapped[int] = mapped_column(
+        Integer, default=0, nullable=False
+    )
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=func.now(), nullable=False
+    )
+    # Время последнего изменения ref_count: недавно использованные файлы
+    # не трогает очистка (ссылающаяся запись может быть ещё не сохранена)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=func.now(), onupdate=func.now(),
+        nullable=False
+    )
@@ -0,0 +1,46 @@
+from datetime import datetime
+
+from sqlalchemy import BigInteger, DateTime, Index, String, func, text
+from sqlalchemy.orm import Mapped, mapped_column
+
+import app.constants as c
+from app.database import Base
+
+
+class OrderStatusEvent(Base):
+    """
+    Событие смены статуса заказа (outbox): записывается в одной
+    транзакции со сменой статуса, внешние потребители читают
+    неопубликованные события по возрастанию id и отмечают published_at.
+    Ссылки на orders нет: заказы секционированы по дате, старые
+    секции архивируются, а события должны пережить их
+    """
+    __tablename__ = "order_status_events"
+
+    __table_args__ = (
+        Index(
+            "ix_order_status_events_unpublished",
+            "id",
+            postgresql_where=text("published_at IS NULL")
+        ),
+    )
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    order_id: Mapped[int] = mapped_column(nullable=False)
+    order_date: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False
+    )
+    buyer_id: Mapped[int] = mapped_column(nullable=False)
+    from_status: Mapped[str | None] = mapped_column(
+        String(c.ORDER_STATUS_LENGTH_MAX), nullable=True
+    )
+    to_status: Mapped[str] = mapped_column(
+        String(c.ORDER_STATUS_LENGTH_MAX), nullable=False
+    )
+    # Кто сменил статус (продавец или администратор)
+    changed_by: Mapped[int] = mapped_column(nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
+    published_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
@@ -1,25 +1,59 @@
 from datetime import datetime
 from decimal import Decimal
-from sqlalchemy import ForeignKey, Integer, Numeric, DateTime, func, String
-from sqlalchemy.orm import Mapped, mapped_column, relationship
-from datetime import datetime
+from sqlalchemy import (
+    ForeignKey, ForeignKeyConstraint, Integer, Numeric, DateTime, func,
+    String, Index, select
+)
+from sqlalchemy.orm import (
+    Mapped, column_property, mapped_column, relationship
+)
 
 import app.constants as c
 from app.database import Base
+from app.models.media_blobs import MediaBlob
 from app.models.products import Product
 
 class OrderItem(Base):
     __tablename__ = "order_items"
 
-    order_id: Mapped[int] = mapped_column(
-        ForeignKey("orders.id"), primary_key=True, index=True
+    # Секционирована по order_date вместе с orders (секции по месяцам
+    # создаёт app.service.partitions), ключ секционирования входит
+    # в первичный ключ и ссылку на заказ
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ["order_id", "order_date"], ["orders.id", "orders.order_date"]
+        ),
+        {"postgresql_partition_by": "RANGE (order_date)"},
     )
+
+    order_id: Mapped[int] = mapped_column(primary_key=True, index=True)
     product_id: Mapped[int] = mapped_column(
         ForeignKey("products.id"), primary_key=True, index=True
     )
+    # Дата заказа (копия orders.order_date)
+    order_date: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), primary_key=True
+    )
 
     quantity: Mapped[int] = mapped_column(Integer, default=1, nullable=False)
     price: Mapped[Decimal] = mapped_column(Numeric(10, 2), nullable=False)
+    # Снимок товара на момент покупки: история заказов не зависит
+    # от последующих изменений товара и читается без таблицы products
+    product_name: Mapped[str] = mapped_column(
+        String(c.PRODUCT_NAME_MAX_LENGTCH), nullable=False
+    )
+    product_image_url: Mapped[str | None] = mapped_column(
+        String(c.PRODUCT_MAX_LENGTH_IMAGE_URL), nullable=True, index=True
+    )
+    # Записанные уменьшенные копии картинки снимка
+    product_image_variant_names: Mapped[list[str] | None] = column_property(
+        select(MediaBlob.variants)
+        .where(MediaBlob.url == product_image_url)
+        .scalar_subquery()
+    )
+    seller_id: Mapped[int] = mapped_column(
+        ForeignKey("users.id"), nullable=False
+    )
 
     order: Mapped["Order"] = relationship(back_populates="items")
     product: Mapped["Product"] = relationship(back_populates="items")
@@ -28,10 +62,21 @@ class OrderItem(Base):
 class Order(Base):
     __tablename__ = 'orders'
 
-    id: Mapped[int] = mapped_column(primary_key=True)
+    # Список заказов покупателя по дате (фильтр и постраничный вывод).
+    # Таблица секционирована по месяцам order_date: запросы с условием
+    # на дату читают только нужные секции, старые секции архивируются
+    __table_args__ = (
+        Index("ix_orders_buyer_id_order_date", "buyer_id", "order_date"),
+        {"postgresql_partition_by": "RANGE (order_date)"},
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     # order_date: Mapped[datetime] = mapped_column(default=datetime.now)
     order_date: Mapped[datetime] = mapped_column(
-        DateTime(timezone=True), default=func.now(), nullable=False
+        DateTime(timezone=True),
+        default=func.now(),
+        primary_key=True,
+        nullable=False
     )
     updated_at: Mapped[datetime | None] = mapped_column(
         DateTime(timezone=True),
@@ -0,0 +1,56 @@
+from sqlalchemy import (
+    ForeignKey, String, Boolean, Float, Integer, Index, select
+)
+from sqlalchemy.orm import Mapped, column_property, mapped_column
+
+import app.constants as c
+from app.database import Base
+from app.models.media_blobs import MediaBlob
+
+
+class ProductCard(Base):
+    """
+    Денормализованная карточка товара для страниц списка товаров.
+    Собирается из products, categories, users, images и reviews
+    при их изменении, чтобы список читался из одной таблицы
+    """
+    __tablename__ = "product_cards"
+
+    product_id: Mapped[int] = mapped_column(
+        ForeignKey("products.id", ondelete="CASCADE"), primary_key=True
+    )
+    name: Mapped[str] = mapped_column(
+        String(c.PRODUCT_NAME_MAX_LENGTCH), nullable=False
+    )
+    price: Mapped[float] = mapped_column(Float, nullable=False)
+    stock: Mapped[int] = mapped_column(Integer, nullable=False)
+    rating: Mapped[float] = mapped_column(default=c.PRODUCT_MIN_RAITENG)
+    is_active: Mapped[bool] = mapped_column(Boolean, default=True)
+    # Основная картинка товара (или первая из дополнительных)
+    image_url: Mapped[str | None] = mapped_column(nullable=True)
+    # Записанные уменьшенные копии картинки
+    image_variant_names: Mapped[list[str] | None] = column_property(
+        select(MediaBlob.variants)
+        .where(MediaBlob.url == image_url)
+        .scalar_subquery()
+    )
+    category_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    category_name: Mapped[str] = mapped_column(
+        String(c.CATEGORY_NAME_MAX_LENGTCH), nullable=False
+    )
+    seller_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    seller_name: Mapped[str] = mapped_column(String, nullable=False)
+    review_count: Mapped[int] = mapped_column(
+        Integer, default=0, nullable=False
+    )
+
+    __table_args__ = (
+        Index(
+            "ix_product_cards_is_active_category_id",
+            "is_active", "category_id"
+        ),
+        Index(
+            "ix_product_cards_is_active_seller_id",
+            "is_active", "seller_id"
+        ),
+    )
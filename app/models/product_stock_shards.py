@@ -0,0 +1,23 @@
+from sqlalchemy import ForeignKey, Integer
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database import Base
+
+
+class ProductStockShard(Base):
+    """
+    Часть остатка популярного товара (products.stock_shards > 0).
+    Списания распределяются по строкам-шардам, а не упираются
+    в одну строку products; остаток товара - сумма шардов.
+    Резервы популярного товара учитываются в reserved своих шардов
+    """
+    __tablename__ = "product_stock_shards"
+
+    product_id: Mapped[int] = mapped_column(
+        ForeignKey("products.id", ondelete="CASCADE"), primary_key=True
+    )
+    shard: Mapped[int] = mapped_column(Integer, primary_key=True)
+    stock: Mapped[int] = mapped_column(Integer, nullable=False)
+    reserved: Mapped[int] = mapped_column(
+        Integer, default=0, server_default='0', nullable=False
+    )
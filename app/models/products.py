@@ -1,11 +1,14 @@
 from sqlalchemy import (
-    ForeignKey, String, Boolean, Float, Computed, Integer, Index
+    ForeignKey, String, Boolean, Float, Computed, Integer, Index, select
 )
 from sqlalchemy.dialects.postgresql import TSVECTOR
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy.orm import (
+    Mapped, column_property, mapped_column, relationship
+)
 
 import app.constants as c
 from app.database import Base
+from app.models.media_blobs import MediaBlob
 
 
 class Product(Base):
@@ -22,7 +25,23 @@ class Product(Base):
     image_url: Mapped[str | None] = mapped_column(
         String(c.PRODUCT_MAX_LENGTH_IMAGE_URL), nullable=True
     )
+    # Записанные уменьшенные копии картинки товара
+    image_variant_names: Mapped[list[str] | None] = column_property(
+        select(MediaBlob.variants)
+        .where(MediaBlob.url == image_url)
+        .scalar_subquery()
+    )
     stock: Mapped[int] = mapped_column(Integer, nullable=False)
+    # Количество товара в резервах покупателей (у товара без шардов).
+    # Доступный остаток - stock - reserved
+    reserved: Mapped[int] = mapped_column(
+        Integer, default=0, server_default='0', nullable=False
+    )
+    # Число шардов остатка популярного товара (0 - без шардов). У товара
+    # с шардами stock - периодически синхронизируемая сумма шардов
+    stock_shards: Mapped[int] = mapped_column(
+        Integer, default=0, server_default='0', nullable=False
+    )
     is_active: Mapped[bool] = mapped_column(Boolean, default=True)
     category_id: Mapped[int] = mapped_column(
         ForeignKey("categories.id"), nullable=False
@@ -31,6 +50,12 @@ class Product(Base):
         ForeignKey("users.id"), nullable=False
     )
     rating: Mapped[float] = mapped_column(default=c.PRODUCT_MIN_RAITENG)
+    # Состояние отложенной загрузки дополнительных картинок
+    image_status: Mapped[str] = mapped_column(
+        String(c.IMAGE_STATUS_LENGTH_MAX),
+        default=c.IMAGE_STATUS_READY,
+        nullable=False
+    )
 
     category: Mapped["Category"] = relationship(back_populates="products")
     seller: Mapped["User"]= relationship(back_populates="products")
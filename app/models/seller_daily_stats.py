@@ -0,0 +1,36 @@
+from datetime import date
+from decimal import Decimal
+
+from sqlalchemy import Date, ForeignKey, Integer, Numeric
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database import Base
+
+
+class SellerDailyStat(Base):
+    """
+    Продажи товара продавца за день (UTC): выручка, проданное количество
+    и число заказов. Обновляется при оформлении заказов (и отмене),
+    статистика продавца читается из этих строк без сканирования order_items.
+    Продажи популярного товара раскладываются по слотам slot (как остаток
+    по шардам), чтобы параллельные заказы не ждали одну строку
+    """
+    __tablename__ = "seller_daily_stats"
+
+    seller_id: Mapped[int] = mapped_column(
+        ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
+    )
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    product_id: Mapped[int] = mapped_column(
+        ForeignKey("products.id", ondelete="CASCADE"), primary_key=True
+    )
+    slot: Mapped[int] = mapped_column(Integer, primary_key=True, default=0)
+    revenue: Mapped[Decimal] = mapped_column(
+        Numeric(12, 2), default=0, nullable=False
+    )
+    units_sold: Mapped[int] = mapped_column(
+        Integer, default=0, nullable=False
+    )
+    orders_count: Mapped[int] = mapped_column(
+        Integer, default=0, nullable=False
+    )
@@ -0,0 +1,42 @@
+from datetime import datetime
+
+from sqlalchemy import (
+    DateTime, ForeignKey, Index, Integer, UniqueConstraint, func
+)
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database import Base
+
+
+class StockHold(Base):
+    """
+    Временный резерв товара покупателем (позиция корзины или
+    оформление заказа). Количество резерва учтено в счётчике reserved
+    товара или шарда shard (у популярного товара) до удаления резерва,
+    в том числе истёкшего - его снимает периодическая очистка
+    """
+    __tablename__ = "stock_holds"
+
+    __table_args__ = (
+        UniqueConstraint(
+            "user_id", "product_id", name="uq_stock_holds_user_product"
+        ),
+        Index("ix_stock_holds_product_id_expires_at", "product_id", "expires_at"),
+        Index("ix_stock_holds_expires_at", "expires_at"),
+    )
+    id: Mapped[int] = mapped_column(primary_key=True)
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey("users.id", ondelete="CASCADE"), nullable=False
+    )
+    product_id: Mapped[int] = mapped_column(
+        ForeignKey("products.id", ondelete="CASCADE"), nullable=False
+    )
+    quantity: Mapped[int] = mapped_column(Integer, nullable=False)
+    # Шард остатка, в котором учтён резерв (None - товар без шардов)
+    shard: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    expires_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False
+    )
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
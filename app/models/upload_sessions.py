@@ -0,0 +1,53 @@
+from datetime import datetime
+
+from sqlalchemy import ForeignKey, String, Integer, Boolean, DateTime, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+import app.constants as c
+from app.database import Base
+
+
+class UploadSession(Base):
+    """
+    Сессия возобновляемой загрузки картинки товара по частям.
+    Полученные байты лежат в MEDIA_UPLOAD_ROOT/<id>.part узла
+    upload_node, received_size - смещение, с которого ожидается следующая
+    часть, uploading_until - аренда сессии запросом, принимающим часть
+    или завершающим загрузку
+    """
+    __tablename__ = "upload_sessions"
+
+    id: Mapped[str] = mapped_column(String(36), primary_key=True)
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey("users.id"), nullable=False
+    )
+    product_id: Mapped[int] = mapped_column(
+        ForeignKey("products.id", ondelete="CASCADE"), nullable=False
+    )
+    # Основная картинка товара или дополнительная
+    is_main: Mapped[bool] = mapped_column(Boolean, default=False)
+    file_name: Mapped[str | None] = mapped_column(String, nullable=True)
+    content_type: Mapped[str] = mapped_column(String, nullable=False)
+    size: Mapped[int] = mapped_column(Integer, nullable=False)
+    received_size: Mapped[int] = mapped_column(
+        Integer, default=0, nullable=False
+    )
+    upload_node: Mapped[str | None] = mapped_column(String, nullable=True)
+    uploading_until: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+    status: Mapped[str] = mapped_column(
+        String(c.IMAGE_STATUS_LENGTH_MAX),
+        default=c.UPLOAD_SESSION_STATUS_OPEN,
+        nullable=False
+    )
+    expires_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False
+    )
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=func.now(), nullable=False
+    )
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=func.now(), onupdate=func.now(),
+        nullable=False
+    )
@@ -1,6 +1,7 @@
 from decimal import Decimal
 from fastapi import APIRouter, Depends, HTTPException, Response, status
-from sqlalchemy import delete, select
+from sqlalchemy import Integer, delete, func, literal, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
@@ -15,7 +16,15 @@ from app.schemas import (
     CartItemCreate,
     CartItemUpdate,
 )
-from app.service.tools import _get_cart_item, get_active_object_model_or_404
+from app.service.stock_holds import (
+    get_release_stock_holds_ctes,
+    place_stock_holds,
+    release_stock_holds
+)
+from app.service.tools import (
+    _get_returned_cart_item,
+    get_active_object_model_or_404
+)
 
 
 router = APIRouter(
@@ -24,6 +33,23 @@ router = APIRouter(
 )
 
 
+async def hold_cart_item(cart_item: CartItemModel, db: AsyncSession):
+    """
+    Резервирование товара позиции корзины на её количество
+    (с продлением срока резерва). Если доступного остатка
+    не хватает, изменения корзины откатываются
+    """
+    held = await place_stock_holds(
+        cart_item.user_id, {cart_item.product_id: cart_item.quantity}, db
+    )
+    if not held:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Not enough stock"
+        )
+
+
 @router.get("/", response_model=CartSchema)
 async def get_cart(
     db: AsyncSession = Depends(get_async_db),
@@ -67,25 +93,36 @@ async def add_item_to_cart(
     db: AsyncSession = Depends(get_async_db),
     current_user: UserModel = Depends(get_current_user),
 ):
-    await get_active_object_model_or_404(
-        ProductModel, payload.product_id, db
+    """
+    Добавление товара в корзину (или увеличение количества) одним
+    INSERT ... ON CONFLICT DO UPDATE: товар проверяется на активность
+    в том же запросе, позиция возвращается вместе с товаром
+    """
+    source = select(
+        literal(current_user.id, Integer),
+        ProductModel.id,
+        literal(payload.quantity, Integer)
+    ).where(
+        ProductModel.id == payload.product_id,
+        ProductModel.is_active == True
     )
-    cart_item = await _get_cart_item(db, current_user.id, payload.product_id)
-    if cart_item:
-        cart_item.quantity += payload.quantity
-    else:
-        cart_item = CartItemModel(
-            user_id=current_user.id,
-            product_id=payload.product_id,
-            quantity=payload.quantity,
-        )
-        db.add(cart_item)
+    stmt = pg_insert(CartItemModel).from_select(
+        ['user_id', 'product_id', 'quantity'], source
+    )
+    stmt = stmt.on_conflict_do_update(
+        constraint='uq_cart_items_user_product',
+        set_={
+            'quantity': CartItemModel.quantity + stmt.excluded.quantity,
+            'updated_at': func.now(),
+        }
+    )
+    cart_item = await _get_returned_cart_item(db, stmt)
+    if cart_item is None:
+        raise HTTPException(status_code=404, detail="Product not found")
 
+    await hold_cart_item(cart_item, db)
     await db.commit()
-    updated_item = await _get_cart_item(
-        db, current_user.id, payload.product_id
-    )
-    return updated_item
+    return cart_item
 
 
 @router.put("/items/{product_id}", response_model=CartItemSchema)
@@ -95,17 +132,31 @@ async def update_cart_item(
     db: AsyncSession = Depends(get_async_db),
     current_user: UserModel = Depends(get_current_user),
 ):
-    await get_active_object_model_or_404(
-        ProductModel, product_id, db
+    """
+    Изменение количества товара в корзине одним UPDATE ... FROM products
+    (только активного товара), позиция возвращается вместе с товаром
+    """
+    cart_item = await _get_returned_cart_item(
+        db,
+        update(CartItemModel)
+        .where(
+            CartItemModel.user_id == current_user.id,
+            CartItemModel.product_id == product_id,
+            ProductModel.id == CartItemModel.product_id,
+            ProductModel.is_active == True
+        )
+        .values(quantity=payload.quantity)
     )
-    cart_item = await _get_cart_item(db, current_user.id, product_id)
-    if not cart_item:
+    if cart_item is None:
+        # Причина ошибки уточняется только при промахе
+        await get_active_object_model_or_404(
+            ProductModel, product_id, db
+        )
         raise HTTPException(status_code=404, detail="Cart item not found")
 
-    cart_item.quantity = payload.quantity
+    await hold_cart_item(cart_item, db)
     await db.commit()
-    updated_item = await _get_cart_item(db, current_user.id, product_id)
-    return updated_item
+    return cart_item
 
 
 @router.delete("/items/{product_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -114,11 +165,23 @@ async def remove_item_from_cart(
     db: AsyncSession = Depends(get_async_db),
     current_user: UserModel = Depends(get_current_user),
 ):
-    cart_item = await _get_cart_item(db, current_user.id, product_id)
-    if not cart_item:
+    """
+    Удаление позиции корзины и снятие резерва её товара одним запросом
+    """
+    released = get_release_stock_holds_ctes(current_user.id, [product_id])
+    deleted = await db.scalar(
+        delete(CartItemModel)
+        .where(
+            CartItemModel.user_id == current_user.id,
+            CartItemModel.product_id == product_id
+        )
+        .add_cte(*released)
+        .returning(CartItemModel.id)
+    )
+    if deleted is None:
+        await db.rollback()
         raise HTTPException(status_code=404, detail="Cart item not found")
 
-    await db.delete(cart_item)
     await db.commit()
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
@@ -132,5 +195,6 @@ async def clear_cart(
         CartItemModel.user_id == current_user.id
     )
     )
+    await release_stock_holds(current_user.id, db)
     await db.commit()
     return Response(status_code=status.HTTP_204_NO_CONTENT)
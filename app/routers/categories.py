@@ -1,14 +1,36 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from pydantic import TypeAdapter
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.auth import get_current_admin
 from app.db_depends import get_async_db
 from app.models.categories import Category as CategoryModel
+from app.models.category_closures import CategoryClosure
+from app.models.products import Product as ProductModel
 from app.models.users import User as UserModel
-from app.schemas import Category as CategorySchema, CategoryCreate
-from app.service.validators import validate_category
-from app.service.tools import create_object_model, update_object_model
+from app.schemas import (
+    Category as CategorySchema,
+    CategoryCreate,
+    CategoryTree as CategoryTreeSchema
+)
+from app.service.cache import category_tree_cache, invalidate_category_caches
+from app.service.validators import (
+    validate_active_category,
+    validate_category,
+    validate_category_parent
+)
+from app.service.tools import (
+    add_category_closure,
+    build_category_tree,
+    move_category_closure,
+    notify_categories_changed,
+    refresh_product_cards,
+    commit_and_refresh,
+    update_object_model,
+    get_table_columns,
+    get_rows
+)
 
 
 router = APIRouter(
@@ -16,20 +38,39 @@ router = APIRouter(
     tags=["categories"],
 )
 
+# Сериализатор дерева категорий сразу в байты JSON
+category_tree_adapter = TypeAdapter(list[CategoryTreeSchema])
+
 
 @router.get("/", response_model=list[CategorySchema])
 async def get_all_categories(db: AsyncSession = Depends(get_async_db)):
     """
     Возвращает список всех активных категорий.
     """
-    stmt = select(CategoryModel).where(
+    stmt = select(*get_table_columns(CategoryModel)).where(
         CategoryModel.is_active == True
     )
-    result = await db.scalars(stmt)
-    categories = result.all()
+    categories = await get_rows(stmt, db)
     return categories
 
 
+@router.get("/tree", response_model=list[CategoryTreeSchema])
+async def get_category_tree(db: AsyncSession = Depends(get_async_db)):
+    """
+    Возвращает дерево всех активных категорий с вложенными подкатегориями.
+    Готовый JSON хранится в кэше до изменения категорий.
+    """
+    content = category_tree_cache.get()
+    if content is None:
+        generation = category_tree_cache.generation
+        roots = await build_category_tree(db)
+        content = category_tree_adapter.dump_json(
+            category_tree_adapter.validate_python(roots)
+        )
+        category_tree_cache.set(content, generation)
+    return Response(content=content, media_type="application/json")
+
+
 @router.post(
         "/",
         response_model=CategorySchema,
@@ -45,12 +86,16 @@ async def create_category(
     """
     # Проверка существования parent_id, если указан
     if category.parent_id is not None:
-        validate_category(
-            CategoryModel, category.parent_id, db
-        )
-    db_category = await create_object_model(
-        CategoryModel, category.model_dump(), db
-    )
+        await validate_active_category(category.parent_id, db)
+    db_category = CategoryModel(**category.model_dump())
+    db.add(db_category)
+    # отправляет запрос в БД (получение ID модели Category)
+    await db.flush()
+    # Добавление категории в таблицу замыкания (в той же транзакции)
+    await add_category_closure(db_category.id, category.parent_id, db)
+    await notify_categories_changed(db)
+    db_category = await commit_and_refresh(db_category, db)
+    invalidate_category_caches()
     return db_category
 
 
@@ -67,19 +112,35 @@ async def update_category(
     update_category = await validate_category(CategoryModel, category_id, db)
     # Проверка существования parent_id, если указан
     if category.parent_id is not None:
-        await validate_category(CategoryModel, category.parent_id, db)
+        await validate_active_category(category.parent_id, db)
         if category.parent_id == category_id:
             raise HTTPException(
                 status_code=400, detail="Category cannot be its own parent"
             )
+        # Проверка на цикл (новый родитель - потомок категории)
+        await validate_category_parent(
+            CategoryClosure, category_id, category.parent_id, db
+        )
+
+    # Перенос поддерева в таблице замыкания при смене родителя
+    if category.parent_id != update_category.parent_id:
+        await move_category_closure(category_id, category.parent_id, db)
 
     # Обновление категории
+    await notify_categories_changed(db)
     db_category = await update_object_model(
         CategoryModel,
         update_category,
         category.model_dump(),
-        db
+        db,
+        commit=False
+    )
+    # Обновление названия категории в карточках её товаров
+    await refresh_product_cards(
+        db, ProductModel.category_id == category_id
     )
+    await db.commit()
+    invalidate_category_caches()
     return db_category
 
 
@@ -95,9 +156,11 @@ async def delete_category(
     update_category = await validate_category(CategoryModel, category_id, db)
 
     # Мягкое удаление категории
+    await notify_categories_changed(db)
     await update_object_model(
             CategoryModel, update_category, {'is_active': False}, db
         )
+    invalidate_category_caches()
     return {
         "status": "success",
         "message": "Категория перестала быть активной"
@@ -0,0 +1,62 @@
+import aiohttp
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import RedirectResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import app.config as conf
+from app.db_depends import get_async_db
+from app.service.storage import (
+    MediaStorage, YandexDiskMediaStorage, get_media_storage
+)
+from app.service.tools import get_product_image_urls_stmt
+
+
+router = APIRouter(
+    prefix="/media",
+    tags=["media"],
+)
+
+
+@router.get(
+        "/yandex/{file_name}",
+        status_code=status.HTTP_307_TEMPORARY_REDIRECT,
+        response_class=RedirectResponse
+)
+async def get_yandex_disk_image(
+    file_name: str,
+    db: AsyncSession = Depends(get_async_db),
+    storage: MediaStorage = Depends(get_media_storage)
+):
+    """
+    Перенаправляет на актуальную временную ссылку скачивания картинки
+    с яндекс диска. Ссылки кэшируются, а при промахе кэша запрашиваются
+    сразу для всех картинок товара (клиент обычно загружает их следом)
+    """
+    if not isinstance(storage, YandexDiskMediaStorage):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Image not found"
+        )
+    path = f'{conf.YANDEX_APP_PATH_PREFIX}{file_name}'
+    urls = [path]
+    if not storage.is_link_cached(path):
+        urls = (await db.scalars(get_product_image_urls_stmt(path))).all()
+        # Отдаются только картинки, на которые ссылаются товары
+        if path not in urls:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Image not found"
+            )
+    try:
+        links = await storage.resolve_links(urls)
+    except aiohttp.ClientError as e:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=f"Image link is unavailable: {e}"
+        )
+    return RedirectResponse(
+        links[path],
+        headers={
+            'Cache-Control': f'private, max-age={conf.YANDEX_LINK_CACHE_TTL}'
+        }
+    )
@@ -1,21 +1,29 @@
-import asyncio
+from datetime import datetime
 
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy import delete, select
-from sqlalchemy.orm import selectinload
+from fastapi import APIRouter, Depends, Header, Query, Request
+from pydantic import TypeAdapter
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import contains_eager, selectinload
 from sqlalchemy.ext.asyncio import AsyncSession
 
 import app.constants as c
-from app.auth import get_current_buyer
+from app.auth import get_current_buyer, get_current_seller_or_admin
 from app.db_depends import get_async_db
-from app.models.cart_items import CartItem as CartItemModel
 from app.models.orders import Order, OrderItem
 from app.models.users import User as UserModel
-from app.schemas import OrderItem as OrderItemSchemas
+from app.schemas import (
+    OrderItem as OrderItemSchemas,
+    OrderItemList,
+    OrderStatusBulkResult,
+    OrderStatusBulkUpdate
+)
+from app.service.idempotency import run_idempotent
+from app.service.order_statuses import change_order_statuses
 from app.service.tools import (
+    checkout_cart_items,
     create_one_order,
-    get_list_order_item_id_done,
-    create_order_with_cart_item
+    decode_order_cursor,
+    encode_order_cursor
 )
 
 
@@ -26,122 +34,183 @@ router = APIRouter(
 
 router_1 = APIRouter(prefix='/orders', tags=["orders"])
 
+# Сериализаторы ответов создания заказов (ответ сохраняется
+# для повторов с тем же Idempotency-Key)
+order_item_adapter = TypeAdapter(OrderItemSchemas)
+order_items_adapter = TypeAdapter(list[OrderItemSchemas])
+
 
 @router.post('/', response_model=OrderItemSchemas)
 async def create_order(
     product_id: int,
+    request: Request,
     buyer: UserModel = Depends(get_current_buyer),
     quantity: int = Query(ge=1, le=100, default=1),
+    idempotency_key: str | None = Header(
+        None,
+        max_length=c.IDEMPOTENCY_KEY_MAX_LENGTH,
+        description="Ключ повтора запроса: заказ создаётся один раз"
+    ),
     db: AsyncSession = Depends(get_async_db)
 ):
     """Создание единичного заказа"""
-    order_item = await create_one_order(product_id, quantity, buyer, db)
-    return order_item
+    return await run_idempotent(
+        request,
+        db,
+        buyer.id,
+        idempotency_key,
+        order_item_adapter,
+        lambda: create_one_order(product_id, quantity, buyer, db)
+    )
 
 
-@router_1.get('/', response_model=list[OrderItemSchemas])
+@router_1.get('/', response_model=OrderItemList)
 async def list_order_items(
+    size: int = Query(
+        ge=c.ORDER_ROUTER_MIN_SIZE,
+        le=c.ORDER_ROUTER_MAX_SIZE,
+        default=c.ORDER_ROUTER_DEFAULT_SIZE
+    ),
+    cursor: str | None = Query(
+        None, description="Курсор страницы (next_cursor предыдущей)"
+    ),
+    order_status: str | None = Query(
+        None,
+        alias='status',
+        max_length=c.ORDER_STATUS_LENGTH_MAX,
+        description="Статус заказа"
+    ),
+    date_from: datetime | None = Query(
+        None, description="Заказы не раньше этой даты"
+    ),
+    date_to: datetime | None = Query(
+        None, description="Заказы раньше этой даты"
+    ),
     db: AsyncSession = Depends(get_async_db),
     buyer: UserModel = Depends(get_current_buyer)
 ):
     """
-    Получение (чтение) всех созданных заказов в
-    приложении конкретного покупателя
+    Получение (чтение) созданных заказов конкретного покупателя,
+    от новых к старым, постранично по курсору. Отбор по покупателю,
+    статусу и датам выполняется в БД (индекс orders(buyer_id, order_date)).
+    Условия на дату ставятся на обе таблицы, чтобы Postgres читал
+    только секции orders и order_items нужных месяцев
     """
+    filters = [Order.buyer_id == buyer.id]
+    if order_status is not None:
+        filters.append(Order.status == order_status)
+    if date_from is not None:
+        filters.append(Order.order_date >= date_from)
+        filters.append(OrderItem.order_date >= date_from)
+    if date_to is not None:
+        filters.append(Order.order_date < date_to)
+        filters.append(OrderItem.order_date < date_to)
+    if cursor is not None:
+        # Страница начинается сразу после последней выданной детали
+        cursor_key = decode_order_cursor(cursor)
+        filters.append(
+            tuple_(Order.order_date, OrderItem.order_id, OrderItem.product_id)
+            < tuple_(*cursor_key)
+        )
+        # Сравнение кортежей секции не отсекает - граница даты отдельно
+        filters.append(Order.order_date <= cursor_key[0])
+        filters.append(OrderItem.order_date <= cursor_key[0])
+
     result = await db.scalars(
         select(OrderItem)
-        .options(selectinload(OrderItem.product))
-        .options(selectinload(OrderItem.order))
+        .join(OrderItem.order)
+        .where(*filters)
+        .order_by(
+            Order.order_date.desc(),
+            OrderItem.order_id.desc(),
+            OrderItem.product_id.desc()
         )
-    order_items = [
-        order_item for order_item in result.all()
-        if order_item.order.buyer_id == buyer.id
-    ]
-    return order_items
+        .limit(size + 1)
+        .options(contains_eager(OrderItem.order))
+    )
+    order_items = result.all()
+
+    # Лишняя строка показывает, что есть следующая страница
+    next_cursor = None
+    if len(order_items) > size:
+        order_items = order_items[:size]
+        next_cursor = encode_order_cursor(order_items[-1])
+    return {'items': order_items, 'next_cursor': next_cursor}
 
 
 @router_1.post('/checkout', response_model=list[OrderItemSchemas])
 async def checkout_order(
+    request: Request,
     buyer: UserModel = Depends(get_current_buyer),
+    partial: bool = Query(
+        default=False,
+        description=(
+            "Оформить товары, которые есть в наличии, оставив "
+            "остальные в корзине (по умолчанию - всё или ничего)"
+        )
+    ),
+    idempotency_key: str | None = Header(
+        None,
+        max_length=c.IDEMPOTENCY_KEY_MAX_LENGTH,
+        description="Ключ повтора запроса: корзина оформляется один раз"
+    ),
     db: AsyncSession = Depends(get_async_db)
 ):
     """
     Оформление всех заказов пользователя, которые тот сформировал
     у себя в корзине с последующим выводом деталей заказов,
-    содержащих сведения как о самом заказе, так и о продукте заказа
+    содержащих сведения как о самом заказе, так и о продукте заказа.
+    Повтор с тем же Idempotency-Key получает сохранённый ответ
     """
+    async def checkout():
+        order_keys = await checkout_cart_items(buyer, db, partial)
+
+        # Получение полной инф-и о заказах, их деталях и продуктах заказов
+        result = await db.scalars(
+            select(OrderItem)
+            .where(
+                tuple_(OrderItem.order_id, OrderItem.order_date)
+                .in_(order_keys)
+            )
+            .options(selectinload(OrderItem.order))
+            .order_by(OrderItem.order_id)
+        )
+        return result.all()
 
-    # Получение всех добавленных в корзину продуктов
-    # конкретного покупателя
-    items = await db.scalars(
-        select(CartItemModel)
-        .where(CartItemModel.user_id == buyer.id)
-        .options(selectinload(CartItemModel.product))
-        .order_by(CartItemModel.id)
+    return await run_idempotent(
+        request, db, buyer.id, idempotency_key, order_items_adapter, checkout
     )
-    cart_items = items.all()
 
-    # Валидация корзины покупателя на пустоту
-    if not cart_items:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Корзина пуста"
-        )
 
-    # Создание задач по оформлению "финишных" заказов для asyncio.wait
-    # с присвоением каждой задаче в качестве имени - id модели деталей
-    # оформленного в корзине товара (CartItem)
-    tasks = [
-        asyncio.create_task(
-            create_order_with_cart_item(cart_item, buyer),
-            name=str(cart_item.id)
-        ) for cart_item in cart_items
-    ]
-    total_orders = len(tasks)
-
-    # Запуск задач по оформлению "финишных" заказов
-    done_orders, pending_order = await asyncio.wait(tasks)
-
-    # получение списка id моделей деталей заказов (CartItem)
-    # сформированных в корзине и успешно оформленных как "финишные" заказы
-    order_item_id_done = get_list_order_item_id_done(done_orders)
-    done_count_orders = len(order_item_id_done)
-
-    # Страховочная (перспективная) процедура отмены ожидающих выполнения задач
-    # по оформлению "финишных" заказов, в случае остановки процесса оформ-ия
-    for task in pending_order:
-        task.cancel()
-
-    # ???????????????
-    await asyncio.sleep(0)
-
-    # Чистка корзины от успешно оформленных заказов - удаление всех
-    # соответствующих моделей заказов корзины (CartItem) у пользователя,
-    # оформившего заказ
-    if order_item_id_done:
-        await db.execute(delete(CartItemModel).where(
-            CartItemModel.user_id == buyer.id,
-            CartItemModel.id.in_(order_item_id_done)
-        )
-        )
-        await db.commit()
-
-    # Проверка, что все ли заказы из корзины прошли успешное "финишное"
-    # оформление и вывод в противном случае соотв. сообщения и
-    # названиями продуктов, заказы на которые не прошли оформление
-    if total_orders != done_count_orders:
-        fail_order_items_products = [
-            cart_item.product.name for cart_item in cart_items
-            if cart_item.id not in order_item_id_done
+@router_1.patch('/status', response_model=OrderStatusBulkResult)
+async def update_order_statuses(
+    changes: OrderStatusBulkUpdate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserModel = Depends(get_current_seller_or_admin)
+):
+    """
+    Пакетная смена статусов заказов по допустимым переходам
+    (pending -> paid -> shipped -> delivered, отмена до отгрузки).
+    Один запрос к БД на каждый новый статус, события смены статусов
+    записываются в outbox order_status_events той же транзакцией.
+    Продавец меняет статусы только заказов своих товаров
+    """
+    seller_id = (
+        current_user.id if current_user.role == c.USER_NAME_ROLE_SELLER
+        else None
+    )
+    events = await change_order_statuses(
+        {item.order_id: item.status for item in changes.items},
+        current_user.id,
+        db,
+        seller_id
+    )
+    await db.commit()
+    updated_ids = {event['order_id'] for event in events}
+    return {
+        'updated': events,
+        'rejected': [
+            item.order_id for item in changes.items
+            if item.order_id not in updated_ids
         ]
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=(
-                f"Произошла ошибка при оформлении заказа(-ов) и не "
-                f"оформлен(-о) {total_orders - done_count_orders} заказ(-а):"
-                f" {', '.join(fail_order_items_products)}"
-            )
-        )
-    # Вывод списка моделей деталей заказов в случае успешного "финишного"
-    # оформления всех сформированных в корзине заказов
-    return [add_order.result() for add_order in done_orders]
+    }
@@ -1,10 +1,9 @@
 import asyncio
 from pathlib import Path
 
-import aiohttp
 from fastapi import (
     APIRouter, Depends, HTTPException, status,
-    Query, UploadFile, File, Form
+    Query, Response, UploadFile, File, Form
 )
 from fastapi_filter import FilterDepends
 from sqlalchemy import desc, func, select, or_
@@ -13,23 +12,39 @@ from sqlalchemy.orm import selectinload
 
 import app.constants as c
 import app.config as conf
-from app.auth import get_current_seller
+from app.auth import get_current_seller, get_current_seller_or_admin
 from app.db_depends import get_async_db
 from app.filters import ProductFilter
 from app.models.images import Image
+from app.models.product_cards import ProductCard
 from app.models.products import Product as ProductModel
-from app.models.categories import Category as CategoryModel
 from app.models.users import User as UserModel
-from app.schemas import Product as ProductSchema, ProductCreate, ProductList
-from app.service.validators import validate_category
+from app.schemas import (
+    Product as ProductSchema,
+    ProductCreate,
+    ProductImageStatus,
+    ProductList
+)
+from app.service.cleanup import MediaCleanupQueue, get_media_cleanup
+from app.service.image_jobs import (
+    create_image_upload_jobs,
+    discard_staged_images,
+    get_image_upload_state,
+    image_jobs_event,
+    retry_failed_image_upload_jobs
+)
+from app.service.stock_shards import distribute_stock
+from app.service.storage import MediaStorage, get_media_storage
+from app.service.validators import validate_active_category
 from app.service.tools import (
     create_object_model,
     update_object_model,
     get_active_object_model_or_404_and_validate_category,
     get_validators_filters,
-    save_product_image,
-    remove_product_image,
-    save_product_image_on_disk
+    get_category_subtree_ids,
+    get_table_columns,
+    get_rows,
+    refresh_product_cards
 )
 
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
@@ -119,7 +134,8 @@ async def get_all_products(
         db: AsyncSession = Depends(get_async_db),
 ):
     """
-    Возвращает список всех активных товаров.
+    Возвращает список карточек всех активных товаров.
+    Без поиска список читается из одной таблицы product_cards.
     """
     filter_args = {
         'category_id': category_id,
@@ -129,7 +145,7 @@ async def get_all_products(
         'seller_id': seller_id,
         'is_active': True
     }
-    validators_filters = get_validators_filters(filter_args)
+    validators_filters = get_validators_filters(filter_args, ProductCard)
 
     rank_col = None
 
@@ -169,36 +185,40 @@ async def get_all_products(
         # validators_filters.append(ProductModel.tsv.op('@@')(ts_query))
         # rank_col = func.ts_rank_cd(ProductModel.tsv, ts_query).label("rank")
 
-    total_stmt = select(func.count()).select_from(
-        ProductModel
-    ).where(*validators_filters)
-
-    total = await db.scalar(total_stmt) or 0
+    # Колонки карточки товара (product_id отдаётся как id товара)
+    card_columns = [
+        ProductCard.product_id.label('id'),
+        *get_table_columns(ProductCard, exclude=('product_id',)),
+        ProductCard.image_variant_names.label('image_variant_names')
+    ]
+    total_stmt = select(func.count()).select_from(ProductCard)
+    products_stmt = select(*card_columns)
 
     if rank_col is not None:
-        products_stmt = (
-            select(ProductModel, rank_col)
-            .where(*validators_filters)
-            .order_by(desc(rank_col), ProductModel.id)
-            .offset((page - 1) * page_size)
-            .limit(page_size)
+        # Для полнотекстового поиска нужен tsv из таблицы товаров
+        total_stmt = total_stmt.join(
+            ProductModel, ProductModel.id == ProductCard.product_id
         )
-        result = await db.execute(products_stmt)
-        items = [row[0] for row in result.all()]
-        # сами объекты
-        # при желании можно вернуть ранг в ответе
-        # ranks = [row.rank for row in rows]
-    else:
         products_stmt = (
-            select(ProductModel)
-            .where(*validators_filters)
-            .options(selectinload(ProductModel.images))
-            .order_by(ProductModel.id)
-            .offset((page - 1) * page_size)
-            .limit(page_size)
+            products_stmt
+            .join(ProductModel, ProductModel.id == ProductCard.product_id)
+            .order_by(desc(rank_col), ProductCard.product_id)
         )
+        # при желании можно вернуть ранг в ответе,
+        # добавив rank_col в список колонок
+    else:
+        products_stmt = products_stmt.order_by(ProductCard.product_id)
 
-        items = (await db.scalars(products_stmt)).all()
+    total = await db.scalar(total_stmt.where(*validators_filters)) or 0
+
+    # Строки карточек без создания ORM-объектов
+    items = await get_rows(
+        products_stmt
+        .where(*validators_filters)
+        .offset((page - 1) * page_size)
+        .limit(page_size),
+        db
+    )
 
     return {
         "items": items,
@@ -214,25 +234,31 @@ async def get_all_products(
         status_code=status.HTTP_201_CREATED
 )
 async def create_product(
+    response: Response,
     product: ProductCreate = Depends(ProductCreate.as_form),
     image: UploadFile | None = File(None),
     image_others: list[UploadFile] | None = File(
         default=None,
         description=f'Загрузите до {conf.MAX_COUNT_IMAGES} картинок'
     ),
+    deferred: bool = Query(
+        False,
+        description=(
+            "true — дополнительные картинки загружаются в фоне, "
+            "ответ 202 со статусом картинок pending"
+        )
+    ),
     db: AsyncSession = Depends(get_async_db),
+    storage: MediaStorage = Depends(get_media_storage),
     current_user: UserModel = Depends(get_current_seller)
 ):
     """
     Создаёт новый товар.
     """
-    await validate_category(
-        CategoryModel,
-        product.category_id,
-        db)
+    await validate_active_category(product.category_id, db)
 
-    # Сохранение изображения (если есть) на локальной машине
-    image_url = await save_product_image(image) if image else None
+    # Сохранение изображения (если есть) в хранилище картинок
+    image_url = await storage.save(image) if image else None
 
     # Сбор интересуемых значений (аргументов) модели Product
     values = product.model_dump() | {
@@ -246,55 +272,73 @@ async def create_product(
 
     # отправляет запрос в БД (получение ID модели Product)
     await db.flush()
+    staged_names = []
+    if image_others and deferred:
+        # Картинки сохраняются на локальный диск и ставятся в очередь
+        # фонового обработчика, товар сохраняется сразу
+        staged_names = await create_image_upload_jobs(
+            db_product.id, image_others[:conf.MAX_COUNT_IMAGES], db
+        )
+        db_product.image_status = c.IMAGE_STATUS_PENDING
+        response.status_code = status.HTTP_202_ACCEPTED
     # проверка на наличие дополнительных изображений
-    # и при их наличии сохранение на yandex диске
-    if image_others:
-        async with aiohttp.ClientSession() as session:
-            # Создание задач для потоковой загрузки
-            tasks = [
-                asyncio.create_task(
-                    save_product_image_on_disk(image, session),
-                    name=str(number)
-                )
-                for number, image in enumerate(
-                    image_others[:conf.MAX_COUNT_IMAGES]
+    # и при их наличии сохранение в хранилище картинок
+    elif image_others:
+        # Создание задач для потоковой загрузки
+        tasks = [
+            asyncio.create_task(
+                storage.save(image),
+                name=str(number)
+            )
+            for number, image in enumerate(
+                image_others[:conf.MAX_COUNT_IMAGES]
+            )
+        ]
+
+        # асинхронные считывание чанками и сохранение файлов
+        done_tasks, pending_tasks = await asyncio.wait(tasks)
+
+        # формирование списка успешно сохраненных файлов
+        saved_images = []
+        for done_task in done_tasks:
+            if done_task.exception() is None:
+                saved_images.append(done_task)
+
+        # Сортировка для получения изначального порядка картинок
+        if saved_images:
+            saved_images.sort(key=lambda x: int(x.get_name()))
+
+        # страховочное закрытие фоновых не завершенных задач
+        for pending_task in pending_tasks:
+            pending_task.cancel()
+
+        # переключение для завершения задач выше, помеченных на удаление
+        await asyncio.sleep(0)
+
+        # создание объектов таблицы Image при наличии успешно
+        # сохраненных картинок
+        if saved_images:
+            for saved_image in saved_images:
+                image_url, image_uuid = saved_image.result()
+                other_image_product = Image(
+                    title=str(image_uuid),
+                    title_url=image_url,
+                    product_id=db_product.id
                 )
-            ]
-
-            # асинхронные считывание чанками и сохранение файлов
-            done_tasks, pending_tasks = await asyncio.wait(tasks)
-
-            # формирование списка успешно сохраненных файлов
-            saved_images = []
-            for done_task in done_tasks:
-                if done_task.exception() is None:
-                    saved_images.append(done_task)
-
-            # Сортировка для получения изначального порядка картинок
-            if saved_images:
-                saved_images.sort(key=lambda x: int(x.get_name()))
-
-            # страховочное закрытие фоновых не завершенных задач
-            for pending_task in pending_tasks:
-                pending_task.cancel()
-
-            # переключение для завершения задач выше, помеченных на удаление
-            await asyncio.sleep(0)
-
-            # создание объектов таблицы Image при наличии успешно
-            # сохраненных картинок
-            if saved_images:
-                for saved_image in saved_images:
-                    image_url, image_uuid = saved_image.result()
-                    other_image_product = Image(
-                        title=str(image_uuid),
-                        title_url=image_url,
-                        product_id=db_product.id
-                    )
-                    db.add(other_image_product)
-
-    # Сохраняем все изменения в БД
-    await db.commit()
+                db.add(other_image_product)
+
+    try:
+        # Карточка товара для списка товаров
+        await refresh_product_cards(db, ProductModel.id == db_product.id)
+
+        # Сохраняем все изменения в БД
+        await db.commit()
+    except Exception:
+        # Без записей задач отложенные картинки никто не загрузит
+        await discard_staged_images(staged_names)
+        raise
+    if deferred:
+        image_jobs_event.set()
 
     # получение объекта продукта
     # и добавленных дополнительных картинок
@@ -320,15 +364,20 @@ async def get_products_by_category(
     category_id: int, db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Возвращает список товаров в указанной категории по её ID.
+    Возвращает список товаров в указанной категории по её ID,
+    включая товары всех подкатегорий.
     """
-    await validate_category(
-        CategoryModel,
-        category_id,
-        db)
-    stmt = select(ProductModel).where(
-        ProductModel.is_active == True,
-        ProductModel.category_id == category_id
+    await validate_active_category(category_id, db)
+    # Товары категории и всех её подкатегорий одним запросом
+    stmt = (
+        select(ProductModel)
+        .options(selectinload(ProductModel.images))
+        .where(
+            ProductModel.is_active == True,
+            ProductModel.category_id.in_(
+                get_category_subtree_ids(category_id)
+            )
+        )
     )
     products = await db.scalars(stmt)
     result = products.all()
@@ -347,11 +396,67 @@ async def get_product(
     Возвращает детальную информацию о товаре по его ID.
     """
     product = await get_active_object_model_or_404_and_validate_category(
-        ProductModel, product_id, db, CategoryModel
+        ProductModel, product_id, db
     )
     return product
 
 
+@router.get(
+        "/{product_id}/images/status",
+        response_model=ProductImageStatus,
+        status_code=status.HTTP_200_OK
+)
+async def get_product_images_status(
+    product_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserModel = Depends(get_current_seller_or_admin)
+):
+    """
+    Возвращает состояние фоновой загрузки дополнительных картинок товара
+    (имена файлов и ошибки видны только продавцу товара и администратору).
+    """
+    product = await get_active_object_model_or_404_and_validate_category(
+        ProductModel, product_id, db
+    )
+    if (
+        current_user.role != c.USER_NAME_ROLE_ADMIN
+        and product.seller_id != current_user.id
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You can only view your own products"
+        )
+    return await get_image_upload_state(product, db)
+
+
+@router.post(
+        "/{product_id}/images/retry",
+        response_model=ProductImageStatus,
+        status_code=status.HTTP_202_ACCEPTED
+)
+async def retry_product_images(
+    product_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserModel = Depends(get_current_seller)
+):
+    """
+    Повторно ставит в очередь неудавшиеся загрузки картинок товара.
+    """
+    product = await get_active_object_model_or_404_and_validate_category(
+        ProductModel, product_id, db
+    )
+    if product.seller_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You can only update your own products"
+        )
+    await retry_failed_image_upload_jobs(product_id, db)
+    await db.commit()
+    image_jobs_event.set()
+    await db.refresh(product)
+    return await get_image_upload_state(product, db)
+
+
 @router.put(
         "/{product_id}",
         response_model=ProductSchema,
@@ -362,13 +467,15 @@ async def update_product(
     product_update: ProductCreate = Depends(ProductCreate.as_form),
     image: UploadFile | None = File(None),
     db: AsyncSession = Depends(get_async_db),
+    storage: MediaStorage = Depends(get_media_storage),
+    media_cleanup: MediaCleanupQueue = Depends(get_media_cleanup),
     current_user: UserModel = Depends(get_current_seller)
 ):
     """
     Обновляет товар по его ID.
     """
     product = await get_active_object_model_or_404_and_validate_category(
-        ProductModel, product_id, db, CategoryModel
+        ProductModel, product_id, db
     )
     if product.seller_id != current_user.id:
         raise HTTPException(
@@ -376,17 +483,26 @@ async def update_product(
             detail="You can only update your own products"
         )
 
-    image_url = await save_product_image(image) if image else None
-    if product.image_url:
-        remove_product_image(product.image_url)
+    image_url = await storage.save(image) if image else None
+    old_image_url = product.image_url
     product = await update_object_model(
         ProductModel,
         product,
         product_update.model_dump() | {
             'image_url': image_url[0] if image_url else None
         },
-        db
+        db,
+        commit=False
     )
+    # Новый остаток популярного товара раскладывается по его шардам
+    if product.stock_shards > 0:
+        await distribute_stock(
+            product.id, product_update.stock, product.stock_shards, db
+        )
+    await refresh_product_cards(db, ProductModel.id == product.id)
+    await db.commit()
+    # Старая картинка удаляется в фоне после сохранения товара
+    media_cleanup.schedule(old_image_url)
     return product
 
 
@@ -397,13 +513,14 @@ async def update_product(
 async def delete_product(
     product_id: int,
     db: AsyncSession = Depends(get_async_db),
+    media_cleanup: MediaCleanupQueue = Depends(get_media_cleanup),
     current_user: UserModel = Depends(get_current_seller)
 ):
     """
     Удаляет товар по его ID.
     """
     product = await get_active_object_model_or_404_and_validate_category(
-        ProductModel, product_id, db, CategoryModel
+        ProductModel, product_id, db
     )
     if product.seller_id != current_user.id:
         raise HTTPException(
@@ -411,7 +528,11 @@ async def delete_product(
             detail="You can only delete your own products"
         )
     await update_object_model(
-        ProductModel, product, {'is_active': False}, db
+        ProductModel, product, {'is_active': False}, db, commit=False
     )
-    remove_product_image(product.image_url)
+    await refresh_product_cards(db, ProductModel.id == product.id)
+    await db.commit()
+    # Картинки удаляются в фоне, дополнительные картинки снятого
+    # товара позже найдёт очистка сирот
+    media_cleanup.schedule(product.image_url)
     return {"status": "success", "message": "Product marked as inactive"}
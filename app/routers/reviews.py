@@ -13,7 +13,9 @@ from app.service.tools import (
     create_object_model,
     update_object_model,
     get_active_object_model_or_404,
-    update_grade_product
+    update_grade_product,
+    get_table_columns,
+    get_rows
 )
 
 
@@ -27,11 +29,13 @@ router = APIRouter(
 async def get_reviews(
     db: AsyncSession = Depends(get_async_db)
 ):
-    reviews_db = await db.scalars(select(ReviewModel).where(
-        ReviewModel.is_active == True
-    )
+    reviews_db = await get_rows(
+        select(*get_table_columns(ReviewModel)).where(
+            ReviewModel.is_active == True
+        ),
+        db
     )
-    return reviews_db.all()
+    return reviews_db
 
 
 @router.post('/')
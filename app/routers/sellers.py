@@ -0,0 +1,53 @@
+from datetime import date, datetime, timedelta, timezone
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import app.constants as c
+from app.auth import get_current_seller
+from app.db_depends import get_async_db
+from app.models.users import User as UserModel
+from app.schemas import SellerStats
+from app.service.seller_stats import get_seller_stats
+
+
+router = APIRouter(prefix='/sellers', tags=["sellers"])
+
+
+@router.get('/me/stats', response_model=SellerStats)
+async def get_my_stats(
+    date_from: date | None = Query(
+        None, description="Первый день периода (по умолчанию - 30 дней назад)"
+    ),
+    date_to: date | None = Query(
+        None, description="Последний день периода (по умолчанию - сегодня)"
+    ),
+    top: int = Query(
+        c.SELLER_STATS_TOP_PRODUCTS,
+        ge=1,
+        le=100,
+        description="Сколько самых продаваемых товаров вернуть"
+    ),
+    db: AsyncSession = Depends(get_async_db),
+    seller: UserModel = Depends(get_current_seller)
+):
+    """
+    Выручка, проданное количество и заказы текущего продавца по дням,
+    самые продаваемые товары периода. Читается дневная статистика
+    продаж (seller_daily_stats), а не история заказов
+    """
+    date_to = date_to or datetime.now(timezone.utc).date()
+    date_from = date_from or date_to - timedelta(
+        days=c.SELLER_STATS_DEFAULT_DAYS - 1
+    )
+    if date_from > date_to:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="date_from must not be later than date_to"
+        )
+    if (date_to - date_from).days >= c.SELLER_STATS_MAX_DAYS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Period can be up to {c.SELLER_STATS_MAX_DAYS} days"
+        )
+    return await get_seller_stats(seller.id, date_from, date_to, top, db)
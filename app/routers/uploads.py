@@ -0,0 +1,400 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+import app.config as conf
+import app.constants as c
+from app.auth import get_current_seller
+from app.db_depends import get_async_db
+from app.models.images import Image
+from app.models.products import Product as ProductModel
+from app.models.upload_sessions import UploadSession
+from app.models.users import User as UserModel
+from app.schemas import (
+    Product as ProductSchema,
+    UploadSession as UploadSessionSchema,
+    UploadSessionCreate
+)
+from app.service.cleanup import MediaCleanupQueue, get_media_cleanup
+from app.service.storage import MediaStorage, get_media_storage
+from app.service.tools import (
+    get_active_object_model_or_404_and_validate_category,
+    open_local_upload,
+    read_file_header,
+    refresh_product_cards,
+    write_upload_chunks
+)
+from app.service.validators import (
+    validate_content_type_value,
+    validate_extension,
+    validate_image_signature,
+    validate_size
+)
+
+
+router = APIRouter(
+    prefix="/uploads",
+    tags=["uploads"],
+)
+
+
+def get_upload_path(session_id: str) -> Path:
+    return conf.MEDIA_UPLOAD_ROOT / f'{session_id}.part'
+
+
+async def get_product_of_seller(
+    product_id: int, current_user: UserModel, db: AsyncSession
+) -> ProductModel:
+    product = await get_active_object_model_or_404_and_validate_category(
+        ProductModel, product_id, db
+    )
+    if product.seller_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You can only update your own products"
+        )
+    return product
+
+
+def validate_open_upload_session(upload_session: UploadSession) -> None:
+    """
+    Сессия открыта, не истекла, принадлежит этому узлу (части лежат
+    на его диске) и не занята другим запросом
+    """
+    now = datetime.now(timezone.utc)
+    if upload_session.status != c.UPLOAD_SESSION_STATUS_OPEN:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Upload session is already finalized"
+        )
+    if upload_session.expires_at <= now:
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="Upload session has expired"
+        )
+    if upload_session.upload_node not in (None, conf.MEDIA_STAGING_NODE):
+        raise HTTPException(
+            status_code=status.HTTP_421_MISDIRECTED_REQUEST,
+            detail={
+                'message': 'Upload session belongs to another node',
+                'node': upload_session.upload_node
+            }
+        )
+    if (
+        upload_session.uploading_until is not None
+        and upload_session.uploading_until > now
+    ):
+        raise_upload_session_busy()
+
+
+def raise_upload_session_busy():
+    raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="Another request is processing this upload session"
+    )
+
+
+async def get_upload_session_or_404(
+    session_id: str, current_user: UserModel, db: AsyncSession
+) -> UploadSession:
+    upload_session = await db.scalar(
+        select(UploadSession).where(
+            UploadSession.id == session_id,
+            UploadSession.user_id == current_user.id
+        )
+    )
+    if upload_session is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Upload session not found"
+        )
+    return upload_session
+
+
+async def claim_upload_offset(
+    session_id: str, offset: int, current_user: UserModel, db: AsyncSession
+) -> UploadSession:
+    """
+    Берёт аренду смещения offset короткой закоммиченной транзакцией.
+    Тело запроса (или сохранение файла при завершении с offset, равным
+    размеру) выполняется уже без соединения с БД, а параллельный
+    запрос к той же сессии получает 409, пока аренда не истечёт
+    """
+    now = func.now()
+    upload_session = await db.scalar(
+        update(UploadSession)
+        .where(
+            UploadSession.id == session_id,
+            UploadSession.user_id == current_user.id,
+            UploadSession.status == c.UPLOAD_SESSION_STATUS_OPEN,
+            UploadSession.expires_at > now,
+            UploadSession.received_size == offset,
+            or_(
+                UploadSession.upload_node.is_(None),
+                UploadSession.upload_node == conf.MEDIA_STAGING_NODE
+            ),
+            or_(
+                UploadSession.uploading_until.is_(None),
+                UploadSession.uploading_until <= now
+            )
+        )
+        .values(
+            uploading_until=now + timedelta(
+                seconds=conf.UPLOAD_CHUNK_LEASE_TIMEOUT
+            )
+        )
+        .returning(UploadSession)
+        .execution_options(populate_existing=True)
+    )
+    if upload_session is None:
+        # Аренда не взята - выясняем причину для ответа клиенту
+        upload_session = await get_upload_session_or_404(
+            session_id, current_user, db
+        )
+        validate_open_upload_session(upload_session)
+        if offset != upload_session.received_size:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail={
+                    'message': 'Unexpected chunk offset',
+                    'offset': upload_session.received_size
+                }
+            )
+        raise_upload_session_busy()
+    await db.commit()
+    return upload_session
+
+
+async def release_upload_offset(
+    session_id: str, lease_until: datetime, db: AsyncSession
+) -> None:
+    """Снимает аренду смещения, если она всё ещё наша"""
+    await db.execute(
+        update(UploadSession)
+        .where(
+            UploadSession.id == session_id,
+            UploadSession.uploading_until == lease_until
+        )
+        .values(uploading_until=None)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+
+
+@router.post(
+        "/",
+        response_model=UploadSessionSchema,
+        status_code=status.HTTP_201_CREATED
+)
+async def create_upload_session(
+    upload: UploadSessionCreate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserModel = Depends(get_current_seller)
+):
+    """
+    Создаёт сессию возобновляемой загрузки картинки товара.
+    """
+    # Всё, что известно до получения файла, проверяется сразу
+    validate_content_type_value(upload.content_type)
+    validate_extension(Path(upload.file_name or "").suffix.lower() or ".jpg")
+    validate_size(upload.size)
+    await get_product_of_seller(upload.product_id, current_user, db)
+
+    upload_session = UploadSession(
+        id=str(uuid.uuid4()),
+        user_id=current_user.id,
+        upload_node=conf.MEDIA_STAGING_NODE,
+        expires_at=(
+            datetime.now(timezone.utc)
+            + timedelta(seconds=conf.UPLOAD_SESSION_TTL)
+        ),
+        **upload.model_dump()
+    )
+    get_upload_path(upload_session.id).touch()
+    db.add(upload_session)
+    await db.commit()
+    return upload_session
+
+
+@router.get("/{session_id}", response_model=UploadSessionSchema)
+async def get_upload_session(
+    session_id: str,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserModel = Depends(get_current_seller)
+):
+    """
+    Возвращает состояние сессии загрузки (смещение для продолжения).
+    """
+    return await get_upload_session_or_404(session_id, current_user, db)
+
+
+@router.put("/{session_id}", response_model=UploadSessionSchema)
+async def upload_chunk(
+    session_id: str,
+    request: Request,
+    offset: int = Query(ge=0, description="Смещение части в файле"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserModel = Depends(get_current_seller)
+):
+    """
+    Принимает очередную часть файла (тело запроса) с указанного смещения.
+    Смещение должно совпадать с уже полученным размером, иначе 409
+    с актуальным смещением в ответе.
+    """
+    upload_session = await claim_upload_offset(
+        session_id, offset, current_user, db
+    )
+    lease_until = upload_session.uploading_until
+    path = get_upload_path(session_id)
+    try:
+        received_size = await write_upload_chunks(
+            request.stream(), path, offset, upload_session.size
+        )
+
+        # Сигнатура файла проверяется, как только получены первые байты
+        signature_length = min(
+            c.UPLOAD_SIGNATURE_LENGTH, upload_session.size
+        )
+        if offset < signature_length <= received_size:
+            header = await asyncio.to_thread(
+                read_file_header, path, signature_length
+            )
+            validate_image_signature(header, upload_session.content_type)
+    except Exception:
+        await release_upload_offset(session_id, lease_until, db)
+        raise
+
+    # Полученные до обрыва соединения байты тоже сохраняются,
+    # клиент продолжит с нового смещения. Запись проходит, только если
+    # аренда не истекла и смещение не перехватил другой запрос
+    upload_session = await db.scalar(
+        update(UploadSession)
+        .where(
+            UploadSession.id == session_id,
+            UploadSession.received_size == offset,
+            UploadSession.uploading_until == lease_until
+        )
+        .values(received_size=received_size, uploading_until=None)
+        .returning(UploadSession)
+        .execution_options(populate_existing=True)
+    )
+    if upload_session is None:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Upload lease has expired, request the current offset"
+        )
+    await db.commit()
+    return upload_session
+
+
+@router.post(
+        "/{session_id}/finalize",
+        response_model=ProductSchema,
+        status_code=status.HTTP_200_OK
+)
+async def finalize_upload_session(
+    session_id: str,
+    db: AsyncSession = Depends(get_async_db),
+    storage: MediaStorage = Depends(get_media_storage),
+    media_cleanup: MediaCleanupQueue = Depends(get_media_cleanup),
+    current_user: UserModel = Depends(get_current_seller)
+):
+    """
+    Завершает загрузку: файл сохраняется в хранилище картинок
+    и привязывается к товару сессии.
+    """
+    upload_session = await get_upload_session_or_404(
+        session_id, current_user, db
+    )
+    validate_open_upload_session(upload_session)
+    if upload_session.received_size != upload_session.size:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={
+                'message': 'Upload is not complete',
+                'offset': upload_session.received_size
+            }
+        )
+    product = await get_product_of_seller(
+        upload_session.product_id, current_user, db
+    )
+    if not upload_session.is_main:
+        images_count = await db.scalar(
+            select(func.count()).select_from(Image).where(
+                Image.product_id == product.id,
+                Image.is_active == True
+            )
+        )
+        if images_count >= conf.MAX_COUNT_IMAGES:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Product can have up to {conf.MAX_COUNT_IMAGES} images"
+            )
+
+    # Сессия арендуется так же, как при приёме части: файл сохраняется
+    # в хранилище без блокировки строки и соединения с БД
+    upload_session = await claim_upload_offset(
+        session_id, upload_session.size, current_user, db
+    )
+    lease_until = upload_session.uploading_until
+    path = get_upload_path(session_id)
+    try:
+        async with open_local_upload(
+            path, upload_session.file_name, upload_session.content_type
+        ) as upload_file:
+            image_url, file_name = await storage.save(upload_file)
+    except Exception:
+        await release_upload_offset(session_id, lease_until, db)
+        raise
+
+    # Сессия завершается, только если аренда всё ещё наша
+    finalized = await db.scalar(
+        update(UploadSession)
+        .where(
+            UploadSession.id == session_id,
+            UploadSession.status == c.UPLOAD_SESSION_STATUS_OPEN,
+            UploadSession.uploading_until == lease_until
+        )
+        .values(
+            status=c.UPLOAD_SESSION_STATUS_FINALIZED, uploading_until=None
+        )
+        .returning(UploadSession.id)
+    )
+    if finalized is None:
+        await db.rollback()
+        media_cleanup.schedule(image_url)
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Upload lease has expired, request the current offset"
+        )
+
+    await db.refresh(product)
+    old_image_url = None
+    if upload_session.is_main:
+        old_image_url = product.image_url
+        product.image_url = image_url
+    else:
+        db.add(Image(
+            title=str(file_name),
+            title_url=image_url,
+            product_id=product.id
+        ))
+    await db.flush()
+    await refresh_product_cards(db, ProductModel.id == product.id)
+    await db.commit()
+    await asyncio.to_thread(path.unlink, missing_ok=True)
+    media_cleanup.schedule(old_image_url)
+
+    return await db.scalar(
+        select(ProductModel)
+        .options(selectinload(ProductModel.images))
+        .where(ProductModel.id == product.id)
+        .execution_options(populate_existing=True)
+    )
@@ -15,9 +15,14 @@ from app.auth import (
 )
 from app.config import SECRET_KEY, ALGORITHM, NAME_TOKEN_HEAD
 from app.db_depends import get_async_db
+from app.models.profiles import Profile as ProfileModel
 from app.models.users import User as UserModel
 from app.schemas import UserCreate, User as UserSchema, UserRead
-from app.service.tools import create_object_model
+from app.service.tools import (
+    create_object_model,
+    get_table_columns,
+    get_rows
+)
 
 
 router = APIRouter(prefix='/users', tags=["users"])
@@ -56,11 +61,35 @@ async def create_user(
 async def get_users(
     db: AsyncSession = Depends(get_async_db)
 ):
-    users = await db.scalars(select(UserModel).options(
-        selectinload(UserModel.profile)
+    # Колонки профиля с префиксом, чтобы не пересекаться с колонками юзера
+    profile_columns = [
+        column.label(f'profile_{column.name}')
+        for column in get_table_columns(
+            ProfileModel, exclude=('id', 'user_id')
+        )
+    ]
+    rows = await get_rows(
+        select(
+            *get_table_columns(UserModel, exclude=('hashed_password',)),
+            ProfileModel.id.label('profile_id'),
+            *profile_columns
         )
+        .outerjoin(ProfileModel, ProfileModel.user_id == UserModel.id)
+        .order_by(UserModel.id),
+        db
     )
-    return users.all()
+    users = []
+    for row in rows:
+        user = {
+            key: value for key, value in row.items()
+            if not key.startswith('profile_')
+        }
+        user['profile'] = {
+            key.removeprefix('profile_'): row[key]
+            for key in (column.name for column in profile_columns)
+        } if row['profile_id'] is not None else None
+        users.append(user)
+    return users
 
 
 @router.get('/me', response_model=UserRead)
@@ -1,12 +1,15 @@
-from datetime import datetime
+from datetime import date, datetime
 from decimal import Decimal
 from typing import Annotated
 
 from fastapi import Form
-from pydantic import BaseModel, Field, ConfigDict, EmailStr
+from pydantic import (
+    BaseModel, Field, ConfigDict, EmailStr, computed_field, field_validator
+)
 from typing import Optional
 
 import app.constants as c
+from app.service.images import get_public_image_url, get_variant_urls
 
 
 class BaseFieldIdIsActive(BaseModel):
@@ -41,6 +44,16 @@ class Category(CategoryCreate, BaseFieldIdIsActive):
     model_config = ConfigDict(from_attributes=True)
 
 
+class CategoryTree(Category):
+    """
+    Модель узла дерева категорий с вложенными подкатегориями.
+    Используется в GET /categories/tree.
+    """
+    children: list['CategoryTree'] = Field(
+        default_factory=list, description='Подкатегории'
+    )
+
+
 class ProductCreate(BaseModel):
     """
     Модель для создания и обновления товара.
@@ -125,9 +138,18 @@ class Image(BaseModel):
     title: str
     title_url: str
     order_date: datetime
+    # Записанные копии картинки (в ответ не попадают)
+    variant_names: Optional[list[str]] = Field(None, exclude=True)
 
     model_config = ConfigDict(from_attributes=True)
 
+    _public_title_url = field_validator('title_url')(get_public_image_url)
+
+    @computed_field(description='URL уменьшенных копий картинки')
+    @property
+    def variants(self) -> Optional[dict[str, str]]:
+        return get_variant_urls(self.title_url, self.variant_names)
+
 
 class Product(ProductCreate, BaseFieldIdIsActive):
     """
@@ -141,6 +163,104 @@ class Product(ProductCreate, BaseFieldIdIsActive):
     rating: Optional[float] = Field(None)
     seller_id: int = Field()
     images: Optional[list[Image]] = Field(None)
+    image_status: str = Field(
+        c.IMAGE_STATUS_READY,
+        description='Статус загрузки дополнительных картинок: '
+        'ready, pending или failed'
+    )
+    image_variant_names: Optional[list[str]] = Field(None, exclude=True)
+
+    model_config = ConfigDict(from_attributes=True)
+
+    _public_image_url = field_validator('image_url')(get_public_image_url)
+
+    @computed_field(description='URL уменьшенных копий картинки товара')
+    @property
+    def image_variants(self) -> Optional[dict[str, str]]:
+        return get_variant_urls(self.image_url, self.image_variant_names)
+
+
+class ProductCard(BaseModel):
+    """
+    Модель карточки товара для страниц списка товаров.
+    Используется в GET /products.
+    """
+    id: int
+    name: str
+    price: float
+    stock: int
+    rating: Optional[float] = Field(None)
+    is_active: bool
+    image_url: Optional[str] = Field(
+        None,
+        description='URL основной картинки товара'
+    )
+    category_id: int
+    category_name: str
+    seller_id: int
+    seller_name: str = Field(description='Отображаемое имя продавца')
+    review_count: int = Field(ge=0, description='Количество отзывов')
+    image_variant_names: Optional[list[str]] = Field(None, exclude=True)
+
+    model_config = ConfigDict(from_attributes=True)
+
+    _public_image_url = field_validator('image_url')(get_public_image_url)
+
+    @computed_field(description='URL уменьшенных копий картинки товара')
+    @property
+    def image_variants(self) -> Optional[dict[str, str]]:
+        return get_variant_urls(self.image_url, self.image_variant_names)
+
+
+class ImageUploadJob(BaseModel):
+    """Задача фоновой загрузки дополнительной картинки товара"""
+    id: int
+    position: int = Field(description='Порядковый номер картинки')
+    original_name: Optional[str] = Field(None)
+    status: str = Field(description='pending, processing, done или failed')
+    attempts: int = Field(ge=0, description='Количество попыток загрузки')
+    last_error: Optional[str] = Field(None)
+    next_attempt_at: datetime
+    created_at: datetime
+    updated_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class ProductImageStatus(BaseModel):
+    """Состояние фоновой загрузки дополнительных картинок товара"""
+    product_id: int
+    image_status: str
+    jobs: list[ImageUploadJob] = Field(default_factory=list)
+
+
+class UploadSessionCreate(BaseModel):
+    """Создание сессии возобновляемой загрузки картинки товара"""
+    product_id: int = Field(description='ID товара для картинки')
+    is_main: bool = Field(
+        False, description='Основная картинка товара или дополнительная'
+    )
+    file_name: Optional[str] = Field(None, description='Исходное имя файла')
+    content_type: str = Field(description='MIME-тип картинки')
+    size: int = Field(gt=0, description='Полный размер файла в байтах')
+
+
+class UploadSession(BaseModel):
+    """Состояние сессии возобновляемой загрузки"""
+    id: str
+    product_id: int
+    is_main: bool
+    file_name: Optional[str] = Field(None)
+    content_type: str
+    size: int
+    received_size: int = Field(
+        description='Смещение, с которого ожидается следующая часть'
+    )
+    upload_node: Optional[str] = Field(
+        None, description='Узел, принимающий части и завершение загрузки'
+    )
+    status: str
+    expires_at: datetime
 
     model_config = ConfigDict(from_attributes=True)
 
@@ -149,7 +269,9 @@ class ProductList(BaseModel):
     """
     Список пагинации для товаров.
     """
-    items: list[Product] = Field(description="Товары для текущей страницы")
+    items: list[ProductCard] = Field(
+        description="Карточки товаров для текущей страницы"
+    )
     total: int = Field(ge=0, description="Общее количество товаров")
     page: int = Field(ge=1, description="Номер текущей страницы")
     page_size: int = Field(ge=1, description="Количество элементов на странице")
@@ -232,9 +354,127 @@ class OrderItem(BaseModel):
 
     quantity: int
     price: Decimal
+    # Снимок товара на момент покупки
+    product_id: int
+    product_name: str = Field(description='Название товара при покупке')
+    product_image_url: Optional[str] = Field(
+        None, description='URL картинки товара при покупке'
+    )
+    seller_id: int
+    product_image_variant_names: Optional[list[str]] = Field(
+        None, exclude=True
+    )
 
     order: OrderSchemas
-    product: Product
+
+    _public_image_url = field_validator('product_image_url')(
+        get_public_image_url
+    )
+
+    @computed_field(description='URL уменьшенных копий картинки товара')
+    @property
+    def product_image_variants(self) -> Optional[dict[str, str]]:
+        return get_variant_urls(
+            self.product_image_url, self.product_image_variant_names
+        )
+
+
+class OrderItemList(BaseModel):
+    """
+    Страница заказов покупателя (постраничный вывод по курсору).
+    """
+    items: list[OrderItem] = Field(description="Детали заказов страницы")
+    next_cursor: Optional[str] = Field(
+        None, description="Курсор следующей страницы (нет - страница последняя)"
+    )
+
+
+class OrderStatusChange(BaseModel):
+    order_id: int = Field(description="ID заказа")
+    status: str = Field(description="Новый статус заказа")
+
+    @field_validator('status')
+    @classmethod
+    def validate_status(cls, value: str) -> str:
+        if value not in c.ORDER_STATUS_TRANSITIONS:
+            raise ValueError(
+                f"Status must be one of: "
+                f"{', '.join(c.ORDER_STATUS_TRANSITIONS)}"
+            )
+        return value
+
+
+class OrderStatusBulkUpdate(BaseModel):
+    """
+    Пакетная смена статусов заказов (например, отгрузка партии).
+    """
+    items: list[OrderStatusChange] = Field(
+        min_length=1,
+        max_length=c.ORDER_STATUS_BULK_MAX_SIZE,
+        description="Заказы и их новые статусы"
+    )
+
+    @field_validator('items')
+    @classmethod
+    def validate_unique_orders(
+        cls, value: list[OrderStatusChange]
+    ) -> list[OrderStatusChange]:
+        if len({item.order_id for item in value}) != len(value):
+            raise ValueError("Each order can be listed only once")
+        return value
+
+
+class OrderStatusChanged(BaseModel):
+    order_id: int
+    order_date: datetime
+    from_status: Optional[str] = Field(None)
+    to_status: str
+
+
+class OrderStatusBulkResult(BaseModel):
+    """
+    Результат пакетной смены статусов заказов.
+    """
+    updated: list[OrderStatusChanged] = Field(
+        description="Заказы со сменённым статусом"
+    )
+    rejected: list[int] = Field(
+        description=(
+            "ID заказов без изменений: не найдены, чужие "
+            "или переход статуса недопустим"
+        )
+    )
+
+
+class SellerDayStats(BaseModel):
+    day: date
+    revenue: Decimal = Field(description="Выручка за день")
+    units_sold: int = Field(description="Продано единиц товара")
+    orders_count: int = Field(description="Количество заказов")
+
+
+class SellerTopProduct(BaseModel):
+    product_id: int
+    product_name: str
+    revenue: Decimal = Field(description="Выручка за период")
+    units_sold: int = Field(description="Продано единиц за период")
+
+
+class SellerStats(BaseModel):
+    """
+    Статистика продаж продавца за период (дни в UTC).
+    """
+    date_from: date
+    date_to: date
+    revenue: Decimal = Field(description="Выручка за период")
+    units_sold: int = Field(description="Продано единиц товара за период")
+    orders_count: int = Field(description="Количество заказов за период")
+    days: list[SellerDayStats] = Field(
+        description="Итоги по дням (дни без продаж пропущены)"
+    )
+    top_products: list[SellerTopProduct] = Field(
+        description="Самые продаваемые товары по выручке"
+    )
 
 
 class CartItemCreate(BaseModel):
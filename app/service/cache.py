@@ -0,0 +1,280 @@
+import asyncio
+import time
+
+import asyncpg
+from loguru import logger
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import app.config as conf
+from app.database import async_engine
+from app.models.categories import Category as CategoryModel
+
+
+class CategoryTreeCache:
+    """
+    Внутрипроцессный кэш дерева категорий в виде готовых байтов JSON.
+    Сбрасывается при создании, изменении и удалении категорий. Дерево,
+    во время построения которого пришёл сброс, не сохраняется: его
+    поколение (generation до чтения) устарело. Пока подписка
+    на уведомления не активна, дерево живёт не дольше
+    CATEGORY_REGISTRY_FALLBACK_TTL
+    """
+
+    def __init__(self):
+        self.content: bytes | None = None
+        self.loaded_at = 0.0
+        self.generation = 0
+        self.listening = False
+
+    def get(self) -> bytes | None:
+        if not self.listening and (
+            time.monotonic() - self.loaded_at
+            >= conf.CATEGORY_REGISTRY_FALLBACK_TTL
+        ):
+            return None
+        return self.content
+
+    def set(self, content: bytes, generation: int) -> None:
+        if generation == self.generation:
+            self.content = content
+            self.loaded_at = time.monotonic()
+
+    def invalidate(self) -> None:
+        self.generation += 1
+        self.content = None
+
+
+class CategoryRegistry:
+    """
+    Внутрипроцессный реестр категорий: id -> (is_active, parent_id).
+    Загружается при старте приложения и сбрасывается по уведомлению
+    Postgres (LISTEN/NOTIFY) об изменении категорий в любом воркере.
+    Пока подписка на уведомления не активна, данные живут не дольше
+    CATEGORY_REGISTRY_FALLBACK_TTL. Счётчик поколений не даёт загрузке,
+    во время которой пришёл сброс, сохранить устаревшие данные
+    """
+
+    def __init__(self):
+        self.categories: dict[int, tuple[bool, int | None]] | None = None
+        self.loaded_at = 0.0
+        self.generation = 0
+        self.listening = False
+        self.lock = asyncio.Lock()
+
+    def is_fresh(self) -> bool:
+        if self.categories is None:
+            return False
+        return self.listening or (
+            time.monotonic() - self.loaded_at
+            < conf.CATEGORY_REGISTRY_FALLBACK_TTL
+        )
+
+    async def load(
+        self, db: AsyncSession
+    ) -> dict[int, tuple[bool, int | None]]:
+        generation = self.generation
+        result = await db.execute(
+            select(
+                CategoryModel.id,
+                CategoryModel.is_active,
+                CategoryModel.parent_id
+            )
+        )
+        categories = {
+            category_id: (is_active, parent_id)
+            for category_id, is_active, parent_id in result.all()
+        }
+        # Сброс во время чтения: данные годятся только для этого запроса
+        if generation == self.generation:
+            self.categories = categories
+            self.loaded_at = time.monotonic()
+        return categories
+
+    async def get(
+        self, category_id: int, db: AsyncSession
+    ) -> tuple[bool, int | None] | None:
+        categories = self.categories
+        if not self.is_fresh():
+            async with self.lock:
+                categories = self.categories
+                if not self.is_fresh():
+                    categories = await self.load(db)
+        return categories.get(category_id)
+
+    def invalidate(self) -> None:
+        self.generation += 1
+        self.categories = None
+
+
+class LinkCache:
+    """
+    Внутрипроцессный кэш временных ссылок на скачивание с TTL.
+    Одновременные запросы одной и той же ссылки выполняют
+    только один запрос к хранилищу (single-flight)
+    """
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.links: dict[str, tuple[str, float]] = {}
+        self.in_flight: dict[str, asyncio.Future] = {}
+
+    def peek(self, key: str) -> str | None:
+        """Ссылка из кэша без обращения к хранилищу"""
+        entry = self.links.get(key)
+        if entry is None or entry[1] <= time.monotonic():
+            return None
+        return entry[0]
+
+    def set(self, key: str, link: str) -> None:
+        if len(self.links) >= self.max_size:
+            now = time.monotonic()
+            for expired_key in [
+                k for k, (_, expires) in self.links.items() if expires <= now
+            ]:
+                del self.links[expired_key]
+            if len(self.links) >= self.max_size:
+                # Удаляем самую старую запись
+                del self.links[next(iter(self.links))]
+        self.links[key] = (link, time.monotonic() + self.ttl)
+
+    async def get(self, key: str, fetch) -> str:
+        """
+        Ссылка из кэша, а при промахе - из хранилища через fetch(key).
+        Запрос к хранилищу защищён от отмены ожидающих его клиентов
+        """
+        link = self.peek(key)
+        if link is not None:
+            return link
+        future = self.in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self.load(key, fetch))
+            self.in_flight[key] = future
+        return await asyncio.shield(future)
+
+    async def get_many(self, keys, fetch) -> dict[str, str]:
+        """Ссылки для нескольких ключей, недостающие запрашиваются пачкой"""
+        keys = list(dict.fromkeys(keys))
+        links = await asyncio.gather(*(self.get(key, fetch) for key in keys))
+        return dict(zip(keys, links))
+
+    async def load(self, key: str, fetch) -> str:
+        try:
+            link = await fetch(key)
+            self.set(key, link)
+            return link
+        finally:
+            self.in_flight.pop(key, None)
+
+    def invalidate(self, key: str) -> None:
+        self.links.pop(key, None)
+
+
+category_tree_cache = CategoryTreeCache()
+category_registry = CategoryRegistry()
+
+
+def invalidate_category_caches(*args) -> None:
+    """
+    Сброс всех кэшей категорий текущего процесса.
+    Используется и как обработчик уведомлений LISTEN/NOTIFY
+    """
+    category_registry.invalidate()
+    category_tree_cache.invalidate()
+
+
+def set_category_listening(listening: bool) -> None:
+    """Переключение кэшей категорий на подписку или на fallback TTL"""
+    category_registry.listening = listening
+    category_tree_cache.listening = listening
+
+
+class CategoryChangesListener:
+    """
+    Подписка текущего процесса на уведомления об изменении категорий
+    через отдельное соединение asyncpg. При потере соединения кэши
+    переходят на fallback TTL, а подписка восстанавливается в фоне
+    с растущей паузой между попытками
+    """
+
+    def __init__(self):
+        self.connection: asyncpg.Connection | None = None
+        self.reconnect_task: asyncio.Task | None = None
+        self.stopped = False
+
+    async def connect(self) -> None:
+        dsn = async_engine.url.set(drivername='postgresql').render_as_string(
+            hide_password=False
+        )
+        connection = await asyncpg.connect(dsn)
+        try:
+            connection.add_termination_listener(self.on_terminated)
+            await connection.add_listener(
+                conf.CATEGORY_CHANGES_CHANNEL, invalidate_category_caches
+            )
+        except BaseException:
+            await connection.close()
+            raise
+        self.connection = connection
+        set_category_listening(True)
+        # Изменения, пропущенные без подписки
+        invalidate_category_caches()
+
+    def on_terminated(self, connection) -> None:
+        """
+        Соединение для уведомлений потеряно - кэши больше не могут
+        узнать об изменениях и переходят на чтение из БД
+        """
+        set_category_listening(False)
+        invalidate_category_caches()
+        logger.warning('Category changes listener connection was terminated')
+        if not self.stopped and (
+            self.reconnect_task is None or self.reconnect_task.done()
+        ):
+            self.reconnect_task = asyncio.create_task(self.reconnect())
+
+    async def reconnect(self) -> None:
+        delay = conf.CATEGORY_LISTENER_RECONNECT_DELAY
+        while not self.stopped:
+            await asyncio.sleep(delay)
+            try:
+                await self.connect()
+            except Exception as e:
+                logger.warning(
+                    f'Category changes listener reconnect failed: {e}'
+                )
+                delay = min(
+                    delay * 2, conf.CATEGORY_LISTENER_RECONNECT_MAX_DELAY
+                )
+            else:
+                logger.info('Category changes listener reconnected')
+                return
+
+    async def stop(self) -> None:
+        """Закрытие соединения для уведомлений при остановке приложения"""
+        self.stopped = True
+        if self.reconnect_task is not None:
+            self.reconnect_task.cancel()
+        set_category_listening(False)
+        if self.connection is not None:
+            self.connection.remove_termination_listener(self.on_terminated)
+            await self.connection.close()
+
+
+async def listen_category_changes() -> CategoryChangesListener:
+    """
+    Подписка текущего процесса на уведомления об изменении категорий.
+    Возвращает подписку, которую нужно остановить при остановке
+    приложения
+    """
+    listener = CategoryChangesListener()
+    await listener.connect()
+    return listener
+
+
+async def stop_listening_category_changes(
+    listener: CategoryChangesListener
+) -> None:
+    """Остановка подписки при остановке приложения"""
+    await listener.stop()
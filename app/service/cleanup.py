@@ -0,0 +1,370 @@
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+
+from fastapi import Request
+from loguru import logger
+from sqlalchemy import delete, func, select, union_all, update
+
+import app.config as conf
+import app.constants as c
+from app.database import async_engine, async_session_maker
+from app.models import (
+    Image as ImageModel,
+    ImageUploadJob,
+    MediaBlob,
+    OrderItem,
+    Product as ProductModel,
+    UploadSession
+)
+from .images import get_variant_name, is_variant_name
+from .storage import LocalMediaStorage, MediaStorage
+
+
+class MediaCleanupQueue:
+    """
+    Очередь удаления картинок из хранилища. Обработчики запросов
+    только ставят URL в очередь, а удаляет их фоновая задача воркера.
+    Если очередь переполнена, файл позже найдёт очистка сирот
+    """
+
+    def __init__(self, storage: MediaStorage):
+        self.storage = storage
+        self.queue: asyncio.Queue[str] = asyncio.Queue(
+            maxsize=conf.MEDIA_CLEANUP_QUEUE_SIZE
+        )
+        self.task: asyncio.Task | None = None
+
+    def schedule(self, url: str | None) -> None:
+        if not url:
+            return
+        try:
+            self.queue.put_nowait(url)
+        except asyncio.QueueFull:
+            logger.warning(f'Media cleanup queue is full, skipped {url}')
+
+    async def run(self) -> None:
+        while True:
+            url = await self.queue.get()
+            try:
+                await self.storage.delete(url)
+            except Exception as e:
+                logger.warning(f'Media cleanup of {url} failed: {e}')
+            finally:
+                self.queue.task_done()
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Дожидается удаления поставленных в очередь файлов (с таймаутом)"""
+        try:
+            await asyncio.wait_for(
+                self.queue.join(), conf.MEDIA_CLEANUP_SHUTDOWN_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            logger.warning(
+                f'Media cleanup stopped with {self.queue.qsize()} files left'
+            )
+        self.task.cancel()
+
+
+async def get_media_cleanup(request: Request) -> MediaCleanupQueue:
+    """
+    Предоставляет очередь удаления картинок, созданную в lifespan
+    """
+    return request.state.media_cleanup
+
+
+def get_references_stmt(urls: list[str]):
+    """
+    Ссылки на картинки из активных товаров и их дополнительных картинок
+    с количеством использований каждой (счётчик ref_count media_blobs)
+    """
+    references = union_all(
+        select(ProductModel.image_url.label('url')).where(
+            ProductModel.is_active == True,
+            ProductModel.image_url.in_(urls)
+        ),
+        select(ImageModel.title_url.label('url'))
+        .join(ProductModel, ProductModel.id == ImageModel.product_id)
+        .where(
+            ImageModel.is_active == True,
+            ProductModel.is_active == True,
+            ImageModel.title_url.in_(urls)
+        )
+    ).subquery()
+    return (
+        select(references.c.url, func.count().label('ref_count'))
+        .group_by(references.c.url)
+    )
+
+
+def get_ordered_urls_stmt(urls: list[str]):
+    """
+    Картинки из снимков товаров в деталях заказов: такие файлы
+    не удаляются, пока на них ссылается хотя бы один заказ
+    """
+    return (
+        select(OrderItem.product_image_url)
+        .where(OrderItem.product_image_url.in_(urls))
+        .distinct()
+    )
+
+
+async def sweep_media_blobs(storage: MediaStorage, report: dict) -> None:
+    """
+    Сверка счётчиков ссылок media_blobs этого хранилища с товарами
+    и картинками пачками. Файлы без ссылок, которых нет и в снимках
+    заказов, удаляются из хранилища (работает для любого бэкенда)
+    """
+    border = datetime.now(timezone.utc) - timedelta(
+        seconds=conf.MEDIA_SWEEP_GRACE_PERIOD
+    )
+    last_digest = ''
+    while True:
+        async with async_session_maker() as db:
+            blobs = (await db.execute(
+                select(MediaBlob)
+                .where(
+                    MediaBlob.backend == storage.name,
+                    MediaBlob.digest > last_digest,
+                    MediaBlob.updated_at < border
+                )
+                .order_by(MediaBlob.digest)
+                .limit(conf.MEDIA_SWEEP_BATCH_SIZE)
+            )).scalars().all()
+            if not blobs:
+                return
+            last_digest = blobs[-1].digest
+            urls = [blob.url for blob in blobs if blob.url]
+            references = dict((await db.execute(
+                get_references_stmt(urls)
+            )).all())
+            ordered = set((await db.execute(
+                get_ordered_urls_stmt(urls)
+            )).scalars().all())
+            for blob in blobs:
+                ref_count = references.get(blob.url, 0)
+                keep = ref_count > 0 or blob.url in ordered
+                if ref_count == blob.ref_count and keep:
+                    continue
+                # Условие на старое значение счётчика защищает
+                # от параллельной загрузки того же файла
+                condition = (
+                    MediaBlob.backend == blob.backend,
+                    MediaBlob.digest == blob.digest,
+                    MediaBlob.ref_count == blob.ref_count
+                )
+                if keep:
+                    await db.execute(
+                        update(MediaBlob).where(*condition)
+                        .values(ref_count=ref_count)
+                    )
+                    report['ref_counts_fixed'] += 1
+                    continue
+                deleted = await db.scalar(
+                    delete(MediaBlob).where(*condition)
+                    .returning(MediaBlob.file_name)
+                )
+                if deleted is None:
+                    continue
+                # Недописанный файл (url пуст) тоже удаляется,
+                # если он успел появиться в хранилище
+                await storage.delete_files(blob.file_name)
+                report['blobs'] += 1
+            await db.commit()
+        await asyncio.sleep(conf.MEDIA_SWEEP_BATCH_PAUSE)
+
+
+def get_local_orphan_candidates(border: float) -> list[tuple[str, int]]:
+    """
+    Файлы MEDIA_ROOT старше границы border (время изменения) с их
+    размером. Копии учитываются, только если их оригинала уже нет
+    """
+    names = set(os.listdir(conf.MEDIA_ROOT))
+    originals = {
+        get_variant_name(name, variant): name
+        for name in names if not is_variant_name(name)
+        for variant in conf.IMAGE_VARIANTS
+    }
+    candidates = []
+    for name in sorted(names):
+        if name in originals:
+            continue
+        stat_result = (conf.MEDIA_ROOT / name).stat()
+        if stat_result.st_mtime < border:
+            candidates.append((name, stat_result.st_size))
+    return candidates
+
+
+async def sweep_local_files(report: dict) -> None:
+    """
+    Удаление файлов MEDIA_ROOT, на которые не ссылаются ни товары,
+    ни картинки, ни media_blobs (старые файлы и недописанные загрузки)
+    """
+    storage = LocalMediaStorage()
+    border = (
+        datetime.now(timezone.utc).timestamp() - conf.MEDIA_SWEEP_GRACE_PERIOD
+    )
+    candidates = await asyncio.to_thread(get_local_orphan_candidates, border)
+    url_prefix = (
+        f'/{conf.DIRECTORY_USER_CONTENT}/{conf.DIRECTORY_IMAGE_PRODUCTS}/'
+    )
+    for start in range(0, len(candidates), conf.MEDIA_SWEEP_BATCH_SIZE):
+        batch = dict(candidates[start:start + conf.MEDIA_SWEEP_BATCH_SIZE])
+        async with async_session_maker() as db:
+            urls = [url_prefix + name for name in batch]
+            referenced = set((await db.execute(
+                get_references_stmt(urls)
+            )).scalars().all()) | set((await db.execute(
+                get_ordered_urls_stmt(urls)
+            )).scalars().all())
+            # Файлы под учётом media_blobs сверяет sweep_media_blobs
+            tracked = set((await db.execute(
+                select(MediaBlob.file_name)
+                .where(
+                    MediaBlob.backend == storage.name,
+                    MediaBlob.file_name.in_(list(batch))
+                )
+            )).scalars().all())
+        for name, size in batch.items():
+            if url_prefix + name in referenced or name in tracked:
+                continue
+            await storage.delete_files(name)
+            report['files'] += 1
+            report['bytes'] += size
+        await asyncio.sleep(conf.MEDIA_SWEEP_BATCH_PAUSE)
+
+
+def remove_stale_upload_files(
+    expired: set[str], active: set[str], border: float
+) -> int:
+    """
+    Удаление файлов истёкших сессий загрузки и файлов без сессии
+    старше границы border. Возвращает число освобождённых байт
+    """
+    reclaimed = 0
+    for path in conf.MEDIA_UPLOAD_ROOT.iterdir():
+        stat_result = path.stat()
+        stale = path.stem not in active and stat_result.st_mtime < border
+        if path.stem in expired or stale:
+            reclaimed += stat_result.st_size
+            path.unlink(missing_ok=True)
+    return reclaimed
+
+
+async def sweep_upload_sessions(report: dict) -> None:
+    """Удаление истёкших сессий возобновляемой загрузки и их файлов"""
+    async with async_session_maker() as db:
+        expired = set((await db.execute(
+            delete(UploadSession)
+            .where(UploadSession.expires_at < func.now())
+            .returning(UploadSession.id)
+        )).scalars().all())
+        active = set((await db.execute(
+            select(UploadSession.id).where(
+                UploadSession.status == c.UPLOAD_SESSION_STATUS_OPEN
+            )
+        )).scalars().all())
+        await db.commit()
+    border = datetime.now(timezone.utc).timestamp() - conf.UPLOAD_SESSION_TTL
+    report['upload_sessions'] += len(expired)
+    report['bytes'] += await asyncio.to_thread(
+        remove_stale_upload_files, expired, active, border
+    )
+
+
+def get_staged_orphan_candidates(border: float) -> list[tuple[str, int]]:
+    """Файлы MEDIA_STAGING_ROOT старше границы border с их размером"""
+    candidates = []
+    for path in sorted(conf.MEDIA_STAGING_ROOT.iterdir()):
+        stat_result = path.stat()
+        if stat_result.st_mtime < border:
+            candidates.append((path.name, stat_result.st_size))
+    return candidates
+
+
+def remove_staged_files(names: list[str]) -> None:
+    for name in names:
+        (conf.MEDIA_STAGING_ROOT / name).unlink(missing_ok=True)
+
+
+async def sweep_staged_images(report: dict) -> None:
+    """
+    Удаление отложенных картинок этого узла, для которых нет
+    незавершённой задачи загрузки (товар не сохранился, задача
+    выполнена, отклонена или удалена вместе с товаром)
+    """
+    border = (
+        datetime.now(timezone.utc).timestamp() - conf.MEDIA_SWEEP_GRACE_PERIOD
+    )
+    candidates = await asyncio.to_thread(get_staged_orphan_candidates, border)
+    for start in range(0, len(candidates), conf.MEDIA_SWEEP_BATCH_SIZE):
+        batch = dict(candidates[start:start + conf.MEDIA_SWEEP_BATCH_SIZE])
+        async with async_session_maker() as db:
+            pending = set((await db.execute(
+                select(ImageUploadJob.staged_name).where(
+                    ImageUploadJob.staged_name.in_(list(batch)),
+                    ImageUploadJob.status.notin_((
+                        c.IMAGE_JOB_STATUS_DONE, c.IMAGE_JOB_STATUS_REJECTED
+                    ))
+                )
+            )).scalars().all())
+        orphans = [name for name in batch if name not in pending]
+        await asyncio.to_thread(remove_staged_files, orphans)
+        report['staged_files'] += len(orphans)
+        report['bytes'] += sum(batch[name] for name in orphans)
+        await asyncio.sleep(conf.MEDIA_SWEEP_BATCH_PAUSE)
+
+
+async def sweep_media(storage: MediaStorage) -> dict | None:
+    """
+    Очистка хранилища от картинок-сирот. Одновременно выполняется только
+    в одном воркере (advisory lock Postgres). Возвращает отчёт
+    о найденном или None, если очистку уже выполняет другой воркер
+    """
+    report = {
+        'blobs': 0,
+        'ref_counts_fixed': 0,
+        'files': 0,
+        'upload_sessions': 0,
+        'staged_files': 0,
+        'bytes': 0,
+    }
+    # Отложенные картинки лежат на диске узла, поэтому их чистит
+    # каждый воркер, не дожидаясь общей блокировки
+    await sweep_staged_images(report)
+    async with async_engine.connect() as lock_connection:
+        locked = await lock_connection.scalar(
+            select(func.pg_try_advisory_lock(conf.MEDIA_SWEEP_LOCK_KEY))
+        )
+        if not locked:
+            return None
+        try:
+            await sweep_media_blobs(storage, report)
+            await sweep_local_files(report)
+            await sweep_upload_sessions(report)
+        finally:
+            await lock_connection.scalar(
+                select(func.pg_advisory_unlock(conf.MEDIA_SWEEP_LOCK_KEY))
+            )
+            await lock_connection.commit()
+    logger.info(
+        f'Media sweep reclaimed {report["blobs"]} blobs, '
+        f'{report["files"]} local files ({report["bytes"]} bytes), '
+        f'{report["upload_sessions"]} upload sessions, '
+        f'{report["staged_files"]} staged images, '
+        f'fixed {report["ref_counts_fixed"]} reference counts'
+    )
+    return report
+
+
+async def run_media_sweeper(storage: MediaStorage) -> None:
+    """Периодическая очистка сирот (фоновая задача воркера)"""
+    while True:
+        await asyncio.sleep(conf.MEDIA_SWEEP_INTERVAL)
+        try:
+            await sweep_media(storage)
+        except Exception as e:
+            logger.warning(f'Media sweep failed: {e}')
@@ -0,0 +1,137 @@
+import asyncio
+import time
+
+import aiohttp
+from fastapi import HTTPException, Request, status
+from loguru import logger
+
+import app.config as conf
+
+
+def create_http_session() -> aiohttp.ClientSession:
+    """
+    Создание общего HTTP-клиента на время жизни воркера:
+    пул соединений с keep-alive, ограничением на хост и кэшем DNS
+    """
+    connector = aiohttp.TCPConnector(
+        limit=conf.HTTP_POOL_LIMIT,
+        limit_per_host=conf.HTTP_POOL_LIMIT_PER_HOST,
+        ttl_dns_cache=conf.HTTP_DNS_CACHE_TTL,
+        keepalive_timeout=conf.HTTP_KEEPALIVE_TIMEOUT
+    )
+    timeout = aiohttp.ClientTimeout(
+        total=conf.HTTP_TIMEOUT_TOTAL,
+        connect=conf.HTTP_TIMEOUT_CONNECT,
+        sock_read=conf.HTTP_TIMEOUT_SOCK_READ
+    )
+    return aiohttp.ClientSession(
+        connector=connector, timeout=timeout, raise_for_status=True
+    )
+
+
+async def get_http_session(request: Request) -> aiohttp.ClientSession:
+    """
+    Предоставляет общий HTTP-клиент, созданный в lifespan приложения
+    """
+    return request.state.http_session
+
+
+class CircuitBreaker:
+    """
+    Размыкатель цепи для внешнего сервиса: после серии ошибок подряд
+    запросы сразу отклоняются, пока не пройдёт reset_timeout,
+    затем пропускается один пробный запрос. Остальные отклоняются,
+    пока он не завершится: успех замыкает цепь, ошибка снова
+    размыкает её на reset_timeout
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: int):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.probing = False
+
+    def before_call(self) -> None:
+        if self.opened_at is None:
+            return
+        if (
+            not self.probing
+            and time.monotonic() - self.opened_at >= self.reset_timeout
+        ):
+            self.probing = True
+            return
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f'{self.name} is temporarily unavailable'
+        )
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.probing or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self.probing = False
+            logger.warning(f'Circuit breaker for {self.name} is open')
+
+    def release_probe(self) -> None:
+        """
+        Пробный запрос завершился без ответа о состоянии сервиса
+        (отмена, ошибка валидации) - следующий запрос снова пробный
+        """
+        self.probing = False
+
+
+yandex_disk_breaker = CircuitBreaker(
+    'Yandex Disk',
+    conf.HTTP_CIRCUIT_FAILURE_THRESHOLD,
+    conf.HTTP_CIRCUIT_RESET_TIMEOUT
+)
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """Ошибки сети, таймауты и ответы 5xx имеет смысл повторить"""
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status >= 500
+    return isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError))
+
+
+async def call_with_retry(request_factory, breaker: CircuitBreaker):
+    """
+    Выполнение запроса(-ов) к внешнему сервису с повторами
+    и экспоненциальной задержкой через размыкатель цепи.
+    request_factory - функция без аргументов, возвращающая корутину
+    (для каждой попытки создаётся заново)
+    """
+    for attempt in range(conf.HTTP_RETRY_ATTEMPTS):
+        breaker.before_call()
+        try:
+            result = await request_factory()
+        except Exception as e:
+            # Ошибка валидации, поднятая в генераторе тела запроса,
+            # приходит от aiohttp обёрнутой в ошибку соединения
+            if isinstance(e.__cause__, HTTPException):
+                breaker.release_probe()
+                raise e.__cause__
+            if not is_retryable_error(e):
+                # Ответ 4xx - сервис доступен, цепь замыкается
+                if isinstance(e, aiohttp.ClientResponseError):
+                    breaker.record_success()
+                else:
+                    breaker.release_probe()
+                raise
+            breaker.record_failure()
+            if attempt == conf.HTTP_RETRY_ATTEMPTS - 1:
+                raise
+            await asyncio.sleep(conf.HTTP_RETRY_BACKOFF * 2 ** attempt)
+        except BaseException:
+            breaker.release_probe()
+            raise
+        else:
+            breaker.record_success()
+            return result
@@ -0,0 +1,270 @@
+import asyncio
+import hashlib
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
+from fastapi import HTTPException, Request, Response, status
+from loguru import logger
+from pydantic import TypeAdapter
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import app.config as conf
+import app.constants as c
+from app.database import async_session_maker
+from app.models import IdempotencyKey
+
+
+# Выполняющиеся в этом воркере запросы с ключом: повтор с тем же ключом
+# ждёт события, а не опрашивает БД (повторы в других воркерах опрашивают)
+in_flight_requests: dict[tuple[int, str], asyncio.Event] = {}
+
+
+def get_request_fingerprint(request: Request) -> str:
+    """SHA-256 метода, пути и параметров запроса"""
+    return hashlib.sha256(
+        f'{request.method} {request.url.path}?{request.url.query}'.encode()
+    ).hexdigest()
+
+
+def dump_response(adapter: TypeAdapter, result) -> bytes:
+    """Сериализация результата обработчика (ORM-объектов) в JSON"""
+    return adapter.dump_json(
+        adapter.validate_python(result, from_attributes=True)
+    )
+
+
+def get_stored_response(idempotency_key: IdempotencyKey) -> Response:
+    return Response(
+        content=idempotency_key.response_body,
+        status_code=idempotency_key.response_status,
+        media_type="application/json",
+        headers={'Idempotent-Replayed': 'true'}
+    )
+
+
+async def claim_idempotency_key(
+    user_id: int, key: str, fingerprint: str
+) -> tuple[IdempotencyKey | None, datetime | None]:
+    """
+    Захват ключа для выполнения запроса. Сначала ключ читается: повтор
+    завершённого запроса получает запись с сохранённым ответом (одним
+    SELECT, без записи в БД). Новый ключ вставляется, ключ упавшего
+    воркера (выполнение просрочено) перехватывается - тогда возвращается
+    метка захвата (updated_at), по которой сохраняется ответ. Пока запрос
+    с тем же ключом выполняется, повтор ждёт его завершения
+    """
+    deadline = time.monotonic() + conf.IDEMPOTENCY_WAIT_TIMEOUT
+    while True:
+        async with async_session_maker() as db:
+            idempotency_key = await db.scalar(
+                select(IdempotencyKey).where(
+                    IdempotencyKey.user_id == user_id,
+                    IdempotencyKey.key == key
+                )
+            )
+            if idempotency_key is None:
+                lease = await db.scalar(
+                    pg_insert(IdempotencyKey)
+                    .values(user_id=user_id, key=key, request_hash=fingerprint)
+                    .on_conflict_do_nothing(
+                        constraint='uq_idempotency_keys_user_key'
+                    )
+                    .returning(IdempotencyKey.updated_at)
+                )
+                await db.commit()
+                if lease is not None:
+                    return None, lease
+                # Ключ вставлен параллельным запросом - читается заново
+                continue
+            if idempotency_key.request_hash != fingerprint:
+                raise HTTPException(
+                    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    detail="Idempotency-Key was used for another request"
+                )
+            if idempotency_key.status == c.IDEMPOTENCY_STATUS_COMPLETED:
+                return idempotency_key, None
+            lease_border = datetime.now(timezone.utc) - timedelta(
+                seconds=conf.IDEMPOTENCY_LEASE_TIMEOUT
+            )
+            if idempotency_key.updated_at < lease_border:
+                lease = await db.scalar(
+                    update(IdempotencyKey)
+                    .where(
+                        IdempotencyKey.id == idempotency_key.id,
+                        IdempotencyKey.status
+                        == c.IDEMPOTENCY_STATUS_PROCESSING,
+                        IdempotencyKey.updated_at == idempotency_key.updated_at
+                    )
+                    .values(updated_at=func.now())
+                    .returning(IdempotencyKey.updated_at)
+                )
+                await db.commit()
+                if lease is not None:
+                    return None, lease
+
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="A request with this Idempotency-Key is in progress"
+            )
+        event = in_flight_requests.get((user_id, key))
+        try:
+            if event is not None:
+                await asyncio.wait_for(event.wait(), timeout)
+            else:
+                await asyncio.sleep(
+                    min(conf.IDEMPOTENCY_POLL_INTERVAL, timeout)
+                )
+        except asyncio.TimeoutError:
+            pass
+
+
+async def save_idempotent_response(
+    db: AsyncSession,
+    user_id: int,
+    key: str,
+    lease: datetime,
+    status_code: int,
+    body: str
+) -> None:
+    """
+    Сохранение ответа в сессии db (коммит выполняет вызывающий код).
+    Ключ должен быть всё ещё захвачен этим выполнением (метка lease):
+    если его перехватил другой воркер, возвращается 409, а транзакция
+    с заказами не должна быть закоммичена
+    """
+    saved = await db.scalar(
+        update(IdempotencyKey)
+        .where(
+            IdempotencyKey.user_id == user_id,
+            IdempotencyKey.key == key,
+            IdempotencyKey.status == c.IDEMPOTENCY_STATUS_PROCESSING,
+            IdempotencyKey.updated_at == lease
+        )
+        .values(
+            status=c.IDEMPOTENCY_STATUS_COMPLETED,
+            response_status=status_code,
+            response_body=body
+        )
+        .returning(IdempotencyKey.id)
+    )
+    if saved is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A request with this Idempotency-Key is in progress"
+        )
+
+
+async def release_idempotency_key(user_id: int, key: str) -> None:
+    """
+    Удаление ключа неудачного запроса: повтор выполнит его заново.
+    Удаляется только незавершённый ключ - если транзакция с ответом
+    всё же закоммичена (обрыв на коммите), ключ остаётся
+    """
+    async with async_session_maker() as db:
+        await db.execute(
+            delete(IdempotencyKey).where(
+                IdempotencyKey.user_id == user_id,
+                IdempotencyKey.key == key,
+                IdempotencyKey.status == c.IDEMPOTENCY_STATUS_PROCESSING
+            )
+        )
+        await db.commit()
+
+
+async def abort_idempotent(db: AsyncSession, user_id: int, key: str) -> None:
+    """Откат транзакции запроса и освобождение его ключа"""
+    await db.rollback()
+    await release_idempotency_key(user_id, key)
+
+
+async def run_idempotent(
+    request: Request,
+    db: AsyncSession,
+    user_id: int,
+    key: str | None,
+    adapter: TypeAdapter,
+    handler,
+    status_code: int = status.HTTP_200_OK
+) -> Response:
+    """
+    Выполнение обработчика запроса с ключом Idempotency-Key. Обработчик
+    пишет в сессию db, но не коммитит её: ответ сохраняется в ключе
+    той же транзакцией, что и заказы, - повтор с тем же ключом получает
+    его без выполнения запроса и записи в БД. Ошибка клиента 4xx тоже
+    сохраняется, при других ошибках транзакция откатывается, а ключ
+    удаляется. Без ключа обработчик просто выполняется и коммитится
+    """
+    if key is None:
+        content = dump_response(adapter, await handler())
+        await db.commit()
+        return Response(
+            content=content,
+            status_code=status_code,
+            media_type="application/json"
+        )
+
+    stored, lease = await claim_idempotency_key(
+        user_id, key, get_request_fingerprint(request)
+    )
+    if stored is not None:
+        return get_stored_response(stored)
+
+    event = in_flight_requests[(user_id, key)] = asyncio.Event()
+    try:
+        content = dump_response(adapter, await handler())
+        await save_idempotent_response(
+            db, user_id, key, lease, status_code, content.decode()
+        )
+        await db.commit()
+    except HTTPException as e:
+        await asyncio.shield(db.rollback())
+        if e.status_code < status.HTTP_500_INTERNAL_SERVER_ERROR:
+            # Ошибка клиента (например, нехватка товара) - тоже ответ
+            async with async_session_maker() as key_db:
+                await save_idempotent_response(
+                    key_db, user_id, key, lease, e.status_code,
+                    json.dumps({'detail': e.detail})
+                )
+                await key_db.commit()
+        else:
+            await release_idempotency_key(user_id, key)
+        raise
+    except BaseException:
+        await asyncio.shield(abort_idempotent(db, user_id, key))
+        raise
+    finally:
+        in_flight_requests.pop((user_id, key), None)
+        event.set()
+    return Response(
+        content=content, status_code=status_code, media_type="application/json"
+    )
+
+
+async def sweep_idempotency_keys() -> int:
+    """Удаление ключей старше IDEMPOTENCY_KEY_TTL"""
+    border = datetime.now(timezone.utc) - timedelta(
+        seconds=conf.IDEMPOTENCY_KEY_TTL
+    )
+    async with async_session_maker() as db:
+        result = await db.execute(
+            delete(IdempotencyKey)
+            .where(IdempotencyKey.created_at < border)
+            .returning(IdempotencyKey.id)
+        )
+        await db.commit()
+        return len(result.all())
+
+
+async def run_idempotency_key_sweeper() -> None:
+    """Периодическое удаление устаревших ключей (задача воркера)"""
+    while True:
+        await asyncio.sleep(conf.IDEMPOTENCY_SWEEP_INTERVAL)
+        try:
+            await sweep_idempotency_keys()
+        except Exception as e:
+            logger.warning(f'Idempotency key sweep failed: {e}')
@@ -0,0 +1,303 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import aiofiles
+from fastapi import HTTPException, UploadFile, status
+from loguru import logger
+from sqlalchemy import and_, case, exists, func, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import app.config as conf
+import app.constants as c
+from app.database import async_session_maker
+from app.models import Image as ImageModel, ImageUploadJob, Product as ProductModel
+from .storage import MediaStorage
+from .tools import (
+    get_rows, get_table_columns, open_local_upload, read_file_chunks,
+    refresh_product_cards
+)
+from .validators import validate_content_type, validate_extension
+
+
+# Сигнал фоновому обработчику текущего воркера о новых задачах
+# (задачи из других воркеров подхватываются по интервалу опроса)
+image_jobs_event = asyncio.Event()
+
+
+async def stage_image(file: UploadFile) -> str:
+    """
+    Сохранение дополнительной картинки в MEDIA_STAGING_ROOT до загрузки
+    в хранилище. Валидация та же, что и при обычной загрузке
+    """
+    validate_content_type(file)
+    extension = Path(file.filename or "").suffix.lower() or ".jpg"
+    validate_extension(extension)
+    staged_name = f'{uuid.uuid4()}{extension}'
+    staged_path = conf.MEDIA_STAGING_ROOT / staged_name
+    try:
+        async with aiofiles.open(staged_path, "wb") as out_file:
+            async for content in read_file_chunks(file):
+                await out_file.write(content)
+    except Exception:
+        await asyncio.to_thread(staged_path.unlink, missing_ok=True)
+        raise
+    return staged_name
+
+
+async def discard_staged_images(staged_names: list[str]) -> None:
+    """Удаление отложенных картинок, задачи которых не были сохранены"""
+    def unlink_all():
+        for staged_name in staged_names:
+            (conf.MEDIA_STAGING_ROOT / staged_name).unlink(missing_ok=True)
+
+    await asyncio.to_thread(unlink_all)
+
+
+async def create_image_upload_jobs(
+    product_id: int, files: list[UploadFile], db: AsyncSession
+) -> list[str]:
+    """
+    Постановка дополнительных картинок товара в очередь загрузки.
+    Записи задач сохраняются вместе с товаром, файлы - на диске этого
+    узла. Возвращает имена файлов, чтобы удалить их, если товар
+    не сохранится
+    """
+    results = await asyncio.gather(
+        *(stage_image(file) for file in files), return_exceptions=True
+    )
+    staged_names = [
+        result for result in results if isinstance(result, str)
+    ]
+    errors = [
+        result for result in results if isinstance(result, BaseException)
+    ]
+    if errors:
+        await discard_staged_images(staged_names)
+        raise errors[0]
+    await db.execute(
+        insert(ImageUploadJob),
+        [
+            {
+                'product_id': product_id,
+                'position': position,
+                'staged_name': staged_name,
+                'staging_node': conf.MEDIA_STAGING_NODE,
+                'original_name': file.filename,
+                'content_type': file.content_type,
+            }
+            for position, (file, staged_name) in enumerate(
+                zip(files, staged_names)
+            )
+        ]
+    )
+    return staged_names
+
+
+def get_image_status_expression(product_id):
+    """Статус картинок товара по состоянию его задач загрузки"""
+    def has_jobs(*statuses):
+        return exists().where(
+            ImageUploadJob.product_id == product_id,
+            ImageUploadJob.status.in_(statuses)
+        )
+
+    return case(
+        (
+            has_jobs(
+                c.IMAGE_JOB_STATUS_PENDING, c.IMAGE_JOB_STATUS_PROCESSING
+            ),
+            c.IMAGE_STATUS_PENDING
+        ),
+        (
+            has_jobs(
+                c.IMAGE_JOB_STATUS_FAILED, c.IMAGE_JOB_STATUS_REJECTED
+            ),
+            c.IMAGE_STATUS_FAILED
+        ),
+        else_=c.IMAGE_STATUS_READY
+    )
+
+
+async def update_product_image_status(product_id: int, db: AsyncSession):
+    await db.execute(
+        update(ProductModel)
+        .where(ProductModel.id == product_id)
+        .values(image_status=get_image_status_expression(product_id))
+    )
+
+
+async def get_image_upload_state(product, db: AsyncSession) -> dict:
+    """Статус картинок товара и его задачи загрузки (по порядку)"""
+    jobs = await get_rows(
+        select(*get_table_columns(
+            ImageUploadJob,
+            exclude=('product_id', 'staged_name', 'content_type')
+        ))
+        .where(ImageUploadJob.product_id == product.id)
+        .order_by(ImageUploadJob.position),
+        db
+    )
+    return {
+        'product_id': product.id,
+        'image_status': product.image_status,
+        'jobs': jobs,
+    }
+
+
+async def claim_image_upload_jobs() -> list:
+    """
+    Забирает пачку готовых к выполнению задач этого узла (файлы лежат
+    на его диске). Параллельные обработчики других воркеров пропускают
+    заблокированные строки (SKIP LOCKED), а задачи, зависшие в работе
+    дольше IMAGE_JOB_LEASE_TIMEOUT, забираются заново
+    """
+    lease_border = datetime.now(timezone.utc) - timedelta(
+        seconds=conf.IMAGE_JOB_LEASE_TIMEOUT
+    )
+    ready_jobs = (
+        select(ImageUploadJob.id)
+        .where(
+            or_(
+                ImageUploadJob.staging_node == conf.MEDIA_STAGING_NODE,
+                ImageUploadJob.staging_node.is_(None)
+            ),
+            or_(
+                and_(
+                    ImageUploadJob.status == c.IMAGE_JOB_STATUS_PENDING,
+                    ImageUploadJob.next_attempt_at <= func.now()
+                ),
+                and_(
+                    ImageUploadJob.status == c.IMAGE_JOB_STATUS_PROCESSING,
+                    ImageUploadJob.updated_at < lease_border
+                )
+            )
+        )
+        .order_by(ImageUploadJob.product_id, ImageUploadJob.position)
+        .limit(conf.IMAGE_JOB_BATCH_SIZE)
+        .with_for_update(skip_locked=True)
+    )
+    async with async_session_maker() as db:
+        result = await db.execute(
+            update(ImageUploadJob)
+            .where(ImageUploadJob.id.in_(ready_jobs.scalar_subquery()))
+            .values(
+                status=c.IMAGE_JOB_STATUS_PROCESSING,
+                attempts=ImageUploadJob.attempts + 1
+            )
+            .returning(
+                ImageUploadJob.id,
+                ImageUploadJob.product_id,
+                ImageUploadJob.staged_name,
+                ImageUploadJob.original_name,
+                ImageUploadJob.content_type,
+                ImageUploadJob.attempts
+            )
+        )
+        jobs = sorted(result.all(), key=lambda job: job.id)
+        await db.commit()
+    return jobs
+
+
+async def finish_image_upload_job(job, values: dict, image=None) -> None:
+    """
+    Сохранение результата задачи, картинки товара (если загружена)
+    и пересчёт статуса картинок товара с его карточкой
+    """
+    async with async_session_maker() as db:
+        if image is not None:
+            link, file_name = image
+            db.add(ImageModel(
+                title=str(file_name),
+                title_url=link,
+                product_id=job.product_id
+            ))
+        await db.execute(
+            update(ImageUploadJob)
+            .where(ImageUploadJob.id == job.id)
+            .values(**values)
+        )
+        await update_product_image_status(job.product_id, db)
+        await refresh_product_cards(db, ProductModel.id == job.product_id)
+        await db.commit()
+
+
+async def process_image_upload_job(job, storage: MediaStorage) -> None:
+    staged_path = conf.MEDIA_STAGING_ROOT / job.staged_name
+    try:
+        async with open_local_upload(
+            staged_path, job.original_name, job.content_type
+        ) as staged_file:
+            image = await storage.save(staged_file)
+    except Exception as e:
+        # Ошибки валидации и потеря файла не исправятся повтором
+        # (задача отклоняется и не ставится в очередь повторно),
+        # остальные повторяются с экспоненциальной задержкой
+        permanent = (
+            isinstance(e, HTTPException)
+            and e.status_code < status.HTTP_500_INTERNAL_SERVER_ERROR
+        ) or isinstance(e, FileNotFoundError)
+        if permanent:
+            job_status = c.IMAGE_JOB_STATUS_REJECTED
+        elif job.attempts >= conf.IMAGE_JOB_MAX_ATTEMPTS:
+            job_status = c.IMAGE_JOB_STATUS_FAILED
+        else:
+            job_status = c.IMAGE_JOB_STATUS_PENDING
+        delay = conf.IMAGE_JOB_RETRY_BACKOFF * 2 ** (job.attempts - 1)
+        logger.warning(
+            f'Image upload job {job.id} attempt {job.attempts} failed: {e}'
+        )
+        await finish_image_upload_job(job, {
+            'status': job_status,
+            'last_error': str(getattr(e, 'detail', e)),
+            'next_attempt_at': func.now() + timedelta(seconds=delay),
+        })
+        return
+    await finish_image_upload_job(
+        job, {'status': c.IMAGE_JOB_STATUS_DONE, 'last_error': None}, image
+    )
+    await asyncio.to_thread(staged_path.unlink, missing_ok=True)
+
+
+async def run_image_upload_worker(storage: MediaStorage) -> None:
+    """Фоновый обработчик задач загрузки картинок (задача воркера)"""
+    while True:
+        try:
+            jobs = await claim_image_upload_jobs()
+            for job in jobs:
+                await process_image_upload_job(job, storage)
+        except Exception as e:
+            logger.warning(f'Image upload worker failed: {e}')
+            jobs = []
+        if jobs:
+            continue
+        image_jobs_event.clear()
+        try:
+            await asyncio.wait_for(
+                image_jobs_event.wait(), conf.IMAGE_JOB_POLL_INTERVAL
+            )
+        except asyncio.TimeoutError:
+            pass
+
+
+async def retry_failed_image_upload_jobs(
+    product_id: int, db: AsyncSession
+) -> None:
+    """
+    Повторная постановка неудавшихся загрузок без повторной отправки.
+    Отклонённые задачи (rejected) не повторяются
+    """
+    await db.execute(
+        update(ImageUploadJob)
+        .where(
+            ImageUploadJob.product_id == product_id,
+            ImageUploadJob.status == c.IMAGE_JOB_STATUS_FAILED
+        )
+        .values(
+            status=c.IMAGE_JOB_STATUS_PENDING,
+            attempts=0,
+            next_attempt_at=func.now()
+        )
+    )
+    await update_product_image_status(product_id, db)
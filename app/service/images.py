@@ -0,0 +1,120 @@
+import asyncio
+import io
+import urllib
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import PurePosixPath
+
+from PIL import Image, ImageOps
+
+import app.config as conf
+
+
+# Пул процессов для обработки картинок (создаётся при первом обращении)
+image_process_pool: ProcessPoolExecutor | None = None
+
+
+def get_variant_extension() -> str:
+    return '.jpg' if conf.IMAGE_VARIANT_FORMAT == 'jpeg' else '.webp'
+
+
+def get_variant_name(file_name: str, variant: str) -> str:
+    """
+    Имя файла уменьшенной копии картинки, лежащей рядом с оригиналом:
+    <имя оригинала без расширения>_<вариант>.<формат копий>
+    """
+    return f'{PurePosixPath(file_name).stem}_{variant}{get_variant_extension()}'
+
+
+def is_variant_name(file_name: str) -> bool:
+    """Проверка, что файл является уменьшенной копией, а не оригиналом"""
+    stem = PurePosixPath(file_name).stem
+    return any(stem.endswith(f'_{variant}') for variant in conf.IMAGE_VARIANTS)
+
+
+def get_public_image_url(url: str | None) -> str | None:
+    """
+    Адрес картинки для клиента. Путь к файлу на яндекс диске заменяется
+    постоянным адресом API, который перенаправляет на ссылку скачивания
+    """
+    if url and url.startswith(conf.YANDEX_APP_PATH_PREFIX):
+        file_name = url.removeprefix(conf.YANDEX_APP_PATH_PREFIX)
+        return f'{conf.YANDEX_IMAGE_URL}/{file_name}'
+    return url
+
+
+def get_variant_urls(
+    url: str | None, variant_names: list[str] | None
+) -> dict[str, str] | None:
+    """
+    Ссылки на уменьшенные копии картинки по ссылке на оригинал.
+    Вместо копий, которых нет в хранилище (variant_names - записанные
+    копии из media_blobs), отдаётся ссылка на оригинал. Для временных
+    ссылок (с параметрами запроса) и картинок яндекс диска копии
+    не вычисляются
+    """
+    if not url or url.startswith(conf.YANDEX_IMAGE_URL):
+        return None
+    parsed = urllib.parse.urlparse(url)
+    if parsed.query:
+        return None
+    base, _, file_name = url.rpartition('/')
+    variant_names = variant_names or ()
+    return {
+        variant: (
+            f'{base}/{get_variant_name(file_name, variant)}'
+            if variant in variant_names else url
+        )
+        for variant in conf.IMAGE_VARIANTS
+    }
+
+
+def make_image_variants(data: bytes) -> dict[str, bytes]:
+    """
+    Создание уменьшенных копий картинки (выполняется в пуле процессов).
+    Возвращает словарь {вариант: байты картинки}
+    """
+    with Image.open(io.BytesIO(data)) as source:
+        # Учёт поворота из EXIF и приведение к поддерживаемому режиму
+        source = ImageOps.exif_transpose(source)
+        mode = 'RGB' if conf.IMAGE_VARIANT_FORMAT == 'jpeg' else 'RGBA'
+        source = source.convert(mode)
+        variants = {}
+        for variant, size in conf.IMAGE_VARIANTS.items():
+            image = source.copy()
+            # thumbnail сохраняет пропорции и не увеличивает картинку
+            image.thumbnail(size)
+            buffer = io.BytesIO()
+            image.save(
+                buffer,
+                format=conf.IMAGE_VARIANT_FORMAT.upper(),
+                quality=conf.IMAGE_VARIANT_QUALITY
+            )
+            variants[variant] = buffer.getvalue()
+    return variants
+
+
+def get_image_process_pool() -> ProcessPoolExecutor:
+    global image_process_pool
+    if image_process_pool is None:
+        image_process_pool = ProcessPoolExecutor(
+            max_workers=conf.IMAGE_PROCESS_WORKERS
+        )
+    return image_process_pool
+
+
+def shutdown_image_process_pool() -> None:
+    global image_process_pool
+    if image_process_pool is not None:
+        image_process_pool.shutdown(cancel_futures=True)
+        image_process_pool = None
+
+
+async def generate_image_variants(data: bytes) -> dict[str, bytes]:
+    """
+    Создание уменьшенных копий картинки в пуле процессов,
+    чтобы не блокировать event loop
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_image_process_pool(), make_image_variants, data
+    )
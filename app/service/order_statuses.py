@@ -0,0 +1,134 @@
+from collections import defaultdict
+
+from sqlalchemy import exists, func, insert, literal, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+import app.constants as c
+from app.models import Order, OrderItem, OrderStatusEvent
+from .seller_stats import revert_seller_sales
+from .stock_holds import return_cancelled_stock
+
+
+def get_source_statuses(status: str) -> list[str]:
+    """Статусы, из которых разрешён переход в status"""
+    return [
+        source for source, targets in c.ORDER_STATUS_TRANSITIONS.items()
+        if status in targets
+    ]
+
+
+def get_seller_order_condition(order, seller_id: int):
+    """Заказ содержит товар продавца seller_id"""
+    return exists().where(
+        OrderItem.order_id == order.id,
+        OrderItem.order_date == order.order_date,
+        OrderItem.seller_id == seller_id
+    )
+
+
+async def change_order_statuses(
+    changes: dict[int, str],
+    changed_by: int,
+    db: AsyncSession,
+    seller_id: int | None = None
+) -> list:
+    """
+    Смена статусов заказов (id заказа -> новый статус) по машине
+    состояний ORDER_STATUS_TRANSITIONS. Заказы блокируются одним
+    запросом в порядке id, затем на каждый новый статус выполняется
+    один запрос: UPDATE orders ... RETURNING передаёт изменённые заказы
+    в INSERT событий outbox (order_status_events) в том же запросе.
+    Отменённые заказы вычитаются из статистики продаж продавцов,
+    их количество возвращается в остаток товаров.
+    Заказы с недопустимым переходом не меняются. Продавец (seller_id)
+    меняет только заказы своих товаров. Возвращает строки событий.
+    Коммит выполняет вызывающий код
+    """
+    groups = defaultdict(list)
+    for order_id, status in changes.items():
+        groups[status].append(order_id)
+
+    # Блокировка в едином порядке: параллельные запросы
+    # с пересекающимися заказами не взаимоблокируются
+    lock = (
+        select(Order.id)
+        .where(Order.id.in_(list(changes)))
+        .order_by(Order.id, Order.order_date)
+        .with_for_update()
+    )
+    if seller_id is not None:
+        lock = lock.where(get_seller_order_condition(Order, seller_id))
+    await db.execute(lock)
+
+    events = []
+    for status, order_ids in sorted(groups.items()):
+        # Статус до изменения читается из снимка запроса
+        previous_order = aliased(Order)
+        previous_status = func.coalesce(
+            previous_order.status, c.ORDER_DEFAULT_STATUS
+        )
+        previous = (
+            select(
+                previous_order.id,
+                previous_order.order_date,
+                previous_status.label('status')
+            )
+            .where(
+                previous_order.id.in_(order_ids),
+                previous_status.in_(get_source_statuses(status))
+            )
+        )
+        if seller_id is not None:
+            previous = previous.where(
+                get_seller_order_condition(previous_order, seller_id)
+            )
+        previous = previous.subquery('previous')
+        updated = (
+            update(Order)
+            .where(
+                Order.id == previous.c.id,
+                Order.order_date == previous.c.order_date
+            )
+            .values(status=status)
+            .returning(
+                Order.id,
+                Order.order_date,
+                Order.buyer_id,
+                previous.c.status.label('from_status'),
+                Order.status
+            )
+            .cte('updated')
+        )
+        result = await db.execute(
+            insert(OrderStatusEvent)
+            .from_select(
+                [
+                    'order_id', 'order_date', 'buyer_id',
+                    'from_status', 'to_status', 'changed_by'
+                ],
+                select(
+                    updated.c.id,
+                    updated.c.order_date,
+                    updated.c.buyer_id,
+                    updated.c.from_status,
+                    updated.c.status,
+                    literal(changed_by)
+                )
+            )
+            .returning(
+                OrderStatusEvent.order_id,
+                OrderStatusEvent.order_date,
+                OrderStatusEvent.from_status,
+                OrderStatusEvent.to_status
+            )
+        )
+        changed = result.mappings().all()
+        if status == c.ORDER_STATUS_CANCELLED:
+            cancelled = [
+                (row['order_id'], row['order_date']) for row in changed
+            ]
+            await revert_seller_sales(cancelled, db)
+            await return_cancelled_stock(cancelled, db)
+        events.extend(changed)
+    return events
@@ -0,0 +1,223 @@
+import asyncio
+import gzip
+import re
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+from loguru import logger
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+import app.config as conf
+from app.database import async_engine
+
+
+# Секционированные таблицы заказов: секции создаются в этом порядке
+# (сначала orders, на которую ссылается order_items), отсоединяются
+# в обратном
+ORDER_PARTITIONED_TABLES = ('orders', 'order_items')
+
+# Имя месячной секции: <таблица>_y<год>m<месяц>
+PARTITION_NAME_PATTERN = re.compile(r'_y(\d{4})m(\d{2})$')
+
+
+def add_months(month: date, months: int) -> date:
+    """Первое число месяца, отстоящего от month на months месяцев"""
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def get_current_month() -> date:
+    return datetime.now(timezone.utc).date().replace(day=1)
+
+
+def get_partition_name(table: str, month: date) -> str:
+    return f'{table}_y{month.year}m{month.month:02d}'
+
+
+def get_partition_month(partition_name: str) -> date | None:
+    """Месяц секции по её имени (None для секции по умолчанию)"""
+    match = PARTITION_NAME_PATTERN.search(partition_name)
+    if match is None:
+        return None
+    return date(int(match[1]), int(match[2]), 1)
+
+
+def get_month_bounds(month: date) -> tuple[str, str]:
+    start, end = month, add_months(month, 1)
+    return f"'{start} 00:00:00+00'", f"'{end} 00:00:00+00'"
+
+
+async def move_default_partition_rows(
+    connection: AsyncConnection, month: date
+) -> int:
+    """
+    Перенос заказов месяца, попавших в секции по умолчанию, в новые
+    секции этого месяца. Секции создаются отдельными таблицами,
+    заполняются и присоединяются в одной транзакции. Секции по
+    умолчанию на это время закрыты для записи. Возвращает число
+    перенесённых заказов
+    """
+    start, end = get_month_bounds(month)
+    in_month = f'order_date >= {start} AND order_date < {end}'
+    for table in ORDER_PARTITIONED_TABLES:
+        await connection.execute(text(
+            f'LOCK TABLE {table}_default IN EXCLUSIVE MODE'
+        ))
+    moved = 0
+    # Сначала order_items, чтобы удаление заказов из секции
+    # по умолчанию не нарушало внешний ключ
+    for table in reversed(ORDER_PARTITIONED_TABLES):
+        partition_name = get_partition_name(table, month)
+        await connection.execute(text(
+            f'CREATE TABLE {partition_name} '
+            f'(LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+        ))
+        moved = (await connection.execute(text(
+            f'WITH moved AS ('
+            f'DELETE FROM {table}_default WHERE {in_month} RETURNING *'
+            f') INSERT INTO {partition_name} SELECT * FROM moved'
+        ))).rowcount
+    for table in ORDER_PARTITIONED_TABLES:
+        await connection.execute(text(
+            f'ALTER TABLE {table} ATTACH PARTITION '
+            f'{get_partition_name(table, month)} '
+            f'FOR VALUES FROM ({start}) TO ({end})'
+        ))
+    return moved
+
+
+async def create_order_partitions(
+    connection: AsyncConnection, month: date
+) -> None:
+    """
+    Создание секций orders и order_items за месяц (если их ещё нет).
+    Если заказы этого месяца уже попали в секцию по умолчанию,
+    они переносятся в новые секции
+    """
+    exists = await connection.scalar(text(
+        f"SELECT to_regclass('{get_partition_name('orders', month)}') "
+        f'IS NOT NULL'
+    ))
+    if exists:
+        return
+    start, end = get_month_bounds(month)
+    has_default_rows = await connection.scalar(text(
+        f'SELECT EXISTS (SELECT 1 FROM orders_default '
+        f'WHERE order_date >= {start} AND order_date < {end})'
+    ))
+    if has_default_rows:
+        moved = await move_default_partition_rows(connection, month)
+        logger.warning(
+            f'Moved {moved} orders for {month} out of the default partition'
+        )
+        return
+    for table in ORDER_PARTITIONED_TABLES:
+        await connection.execute(text(
+            f'CREATE TABLE IF NOT EXISTS {get_partition_name(table, month)} '
+            f'PARTITION OF {table} FOR VALUES FROM ({start}) TO ({end})'
+        ))
+
+
+async def ensure_order_partitions() -> None:
+    """
+    Создание секций заказов с текущего месяца на
+    ORDER_PARTITION_MONTHS_AHEAD месяцев вперёд. Одновременно
+    выполняется только в одном воркере (advisory lock Postgres).
+    Ошибка создания секции не глотается: без секции заказы месяца
+    копятся в секции по умолчанию
+    """
+    async with async_engine.connect() as connection:
+        locked = await connection.scalar(
+            select(func.pg_try_advisory_lock(conf.ORDER_PARTITION_LOCK_KEY))
+        )
+        if not locked:
+            return
+        try:
+            current_month = get_current_month()
+            for months in range(conf.ORDER_PARTITION_MONTHS_AHEAD + 1):
+                month = add_months(current_month, months)
+                try:
+                    await create_order_partitions(connection, month)
+                    await connection.commit()
+                except Exception:
+                    await connection.rollback()
+                    raise
+        finally:
+            await connection.scalar(
+                select(func.pg_advisory_unlock(conf.ORDER_PARTITION_LOCK_KEY))
+            )
+            await connection.commit()
+
+
+async def run_order_partition_maintenance() -> None:
+    """Периодическое создание будущих секций заказов (задача воркера)"""
+    while True:
+        try:
+            await ensure_order_partitions()
+        except Exception as e:
+            logger.error(f'Order partition maintenance failed: {e}')
+        await asyncio.sleep(conf.ORDER_PARTITION_CHECK_INTERVAL)
+
+
+async def get_order_partition_months(connection: AsyncConnection) -> list:
+    """Месяцы существующих секций orders (по возрастанию)"""
+    names = (await connection.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "WHERE parent.relname = 'orders'"
+    ))).scalars().all()
+    return sorted(filter(None, map(get_partition_month, names)))
+
+
+async def export_partition(
+    connection: AsyncConnection, partition_name: str, path: Path
+) -> None:
+    """Выгрузка секции в сжатый CSV (COPY ... TO STDOUT)"""
+    raw_connection = await connection.get_raw_connection()
+    with gzip.open(path, 'wb') as archive:
+        async def write(chunk: bytes) -> None:
+            await asyncio.to_thread(archive.write, chunk)
+
+        await raw_connection.driver_connection.copy_from_table(
+            partition_name, output=write, format='csv', header=True
+        )
+
+
+async def archive_order_partitions(before: date) -> list[Path]:
+    """
+    Архивация секций заказов за месяцы до before. Секции orders
+    и order_items выгружаются в ORDER_ARCHIVE_ROOT из одного снимка
+    без блокировок, после чего обе отсоединяются и удаляются короткой
+    транзакцией. Возвращает пути созданных архивов
+    """
+    conf.ORDER_ARCHIVE_ROOT.mkdir(parents=True, exist_ok=True)
+    archives = []
+    async with async_engine.connect() as connection:
+        months = await get_order_partition_months(connection)
+        await connection.commit()
+        for month in months:
+            if month >= before:
+                break
+            await connection.execute(text(
+                'SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY'
+            ))
+            for table in ORDER_PARTITIONED_TABLES:
+                partition_name = get_partition_name(table, month)
+                path = conf.ORDER_ARCHIVE_ROOT / f'{partition_name}.csv.gz'
+                # Архив появляется под своим именем только целиком
+                part_path = path.with_name(f'{path.name}.part')
+                await export_partition(connection, partition_name, part_path)
+                await asyncio.to_thread(part_path.replace, path)
+                archives.append(path)
+            await connection.commit()
+            for table in reversed(ORDER_PARTITIONED_TABLES):
+                partition_name = get_partition_name(table, month)
+                await connection.execute(text(
+                    f'ALTER TABLE {table} DETACH PARTITION {partition_name}'
+                ))
+                await connection.execute(text(f'DROP TABLE {partition_name}'))
+            await connection.commit()
+            logger.info(f'Order partitions for {month} archived')
+    return archives
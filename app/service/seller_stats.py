@@ -0,0 +1,161 @@
+import random
+from collections import defaultdict
+from datetime import date, timezone
+from decimal import Decimal
+
+from sqlalchemy import Date, cast, desc, func, literal, select, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import OrderItem, Product as ProductModel, SellerDailyStat
+
+
+def get_upsert_stmt(stmt):
+    """Продажи прибавляются к уже накопленным за день"""
+    return stmt.on_conflict_do_update(
+        index_elements=['seller_id', 'day', 'product_id', 'slot'],
+        set_={
+            'revenue': SellerDailyStat.revenue + stmt.excluded.revenue,
+            'units_sold': (
+                SellerDailyStat.units_sold + stmt.excluded.units_sold
+            ),
+            'orders_count': (
+                SellerDailyStat.orders_count + stmt.excluded.orders_count
+            ),
+        }
+    )
+
+
+async def record_seller_sales(
+    order_keys: list[tuple], converted: list[dict], db: AsyncSession
+) -> None:
+    """
+    Учёт оформленных заказов (ключи заказов и списанные товары
+    create_orders) в дневной статистике продавцов одним
+    INSERT ... ON CONFLICT DO UPDATE. Продажа популярного товара
+    попадает в случайный слот. Коммит выполняет вызывающий код
+    """
+    sales = defaultdict(lambda: [Decimal(0), 0, 0])
+    for (_, order_date), item in zip(order_keys, converted):
+        slot = (
+            random.randrange(item['stock_shards'])
+            if item.get('stock_shards') else 0
+        )
+        key = (
+            item['seller_id'],
+            order_date.astimezone(timezone.utc).date(),
+            item['product_id'],
+            slot
+        )
+        sales[key][0] += item['quantity'] * item['price']
+        sales[key][1] += item['quantity']
+        sales[key][2] += 1
+    if not sales:
+        return
+    # Строки вставляются в порядке ключа - без взаимоблокировок
+    # параллельных оформлений
+    await db.execute(get_upsert_stmt(pg_insert(SellerDailyStat).values([
+        {
+            'seller_id': seller_id,
+            'day': day,
+            'product_id': product_id,
+            'slot': slot,
+            'revenue': revenue,
+            'units_sold': units_sold,
+            'orders_count': orders_count
+        }
+        for (seller_id, day, product_id, slot), (
+            revenue, units_sold, orders_count
+        ) in sorted(sales.items())
+    ])))
+
+
+async def revert_seller_sales(order_keys: list[tuple], db: AsyncSession) -> None:
+    """
+    Вычитание отменённых заказов (ключи id, дата) из дневной статистики
+    продавцов одним INSERT ... SELECT ... ON CONFLICT DO UPDATE
+    по их деталям. Коммит выполняет вызывающий код
+    """
+    if not order_keys:
+        return
+    day = cast(func.timezone('UTC', OrderItem.order_date), Date)
+    cancelled = (
+        select(
+            OrderItem.seller_id,
+            day,
+            OrderItem.product_id,
+            literal(0),
+            -func.sum(OrderItem.quantity * OrderItem.price),
+            -func.sum(OrderItem.quantity),
+            -func.count()
+        )
+        .where(
+            tuple_(OrderItem.order_id, OrderItem.order_date).in_(order_keys)
+        )
+        .group_by(OrderItem.seller_id, day, OrderItem.product_id)
+        .order_by(OrderItem.seller_id, day, OrderItem.product_id)
+    )
+    await db.execute(get_upsert_stmt(pg_insert(SellerDailyStat).from_select(
+        [
+            'seller_id', 'day', 'product_id', 'slot',
+            'revenue', 'units_sold', 'orders_count'
+        ],
+        cancelled
+    )))
+
+
+async def get_seller_stats(
+    seller_id: int, date_from: date, date_to: date, top: int, db: AsyncSession
+) -> dict:
+    """
+    Статистика продавца за дни [date_from, date_to]: итоги по дням
+    и самые продаваемые (по выручке) товары периода. Читаются только
+    строки seller_daily_stats продавца за период
+    """
+    filters = (
+        SellerDailyStat.seller_id == seller_id,
+        SellerDailyStat.day >= date_from,
+        SellerDailyStat.day <= date_to
+    )
+    days = (await db.execute(
+        select(
+            SellerDailyStat.day,
+            func.sum(SellerDailyStat.revenue).label('revenue'),
+            func.sum(SellerDailyStat.units_sold).label('units_sold'),
+            func.sum(SellerDailyStat.orders_count).label('orders_count')
+        )
+        .where(*filters)
+        .group_by(SellerDailyStat.day)
+        .order_by(SellerDailyStat.day)
+    )).mappings().all()
+    products = (
+        select(
+            SellerDailyStat.product_id,
+            func.sum(SellerDailyStat.revenue).label('revenue'),
+            func.sum(SellerDailyStat.units_sold).label('units_sold')
+        )
+        .where(*filters)
+        .group_by(SellerDailyStat.product_id)
+        .order_by(desc('revenue'), SellerDailyStat.product_id)
+        .limit(top)
+        .subquery()
+    )
+    top_products = (await db.execute(
+        select(
+            products.c.product_id,
+            ProductModel.name.label('product_name'),
+            products.c.revenue,
+            products.c.units_sold
+        )
+        .join(ProductModel, ProductModel.id == products.c.product_id)
+        .order_by(products.c.revenue.desc(), products.c.product_id)
+    )).mappings().all()
+    return {
+        'date_from': date_from,
+        'date_to': date_to,
+        'revenue': sum((row['revenue'] for row in days), Decimal(0)),
+        'units_sold': sum(row['units_sold'] for row in days),
+        'orders_count': sum(row['orders_count'] for row in days),
+        'days': days,
+        'top_products': top_products,
+    }
@@ -0,0 +1,482 @@
+import asyncio
+from datetime import timedelta
+
+from loguru import logger
+from sqlalchemy import (
+    Integer, column, delete, func, literal, or_, select, tuple_, update,
+    values
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import app.config as conf
+from app.database import async_session_maker
+from app.models import (
+    OrderItem, Product as ProductModel, ProductCard, ProductStockShard,
+    StockHold
+)
+from .stock_shards import reserve_stock_shard
+
+
+async def lock_user_stock_holds(user_id: int, db: AsyncSession) -> None:
+    """
+    Блокировка резервирования покупателем до конца транзакции (advisory
+    lock по id покупателя): параллельные запросы одного покупателя
+    не учтут один резерв в счётчиках дважды. Товары не блокируются -
+    резервы разных покупателей не ждут друг друга
+    """
+    await db.execute(select(func.pg_advisory_xact_lock(
+        literal(conf.STOCK_HOLD_LOCK_KEY, Integer),
+        literal(user_id, Integer)
+    )))
+
+
+async def reserve_products(
+    deltas: dict[int, int], db: AsyncSession
+) -> set[int]:
+    """
+    Изменение счётчиков reserved товаров без шардов на разницу
+    резервов (id товара -> разница) одним условным UPDATE: резерв
+    увеличивается, только если stock - reserved хватает, уменьшение
+    проходит всегда. Возвращает id товаров, счётчики которых изменены
+    """
+    if not deltas:
+        return set()
+    wanted = values(
+        column('product_id', Integer),
+        column('delta', Integer),
+        name='wanted'
+    ).data(sorted(deltas.items()))
+    return set((await db.execute(
+        update(ProductModel)
+        .where(
+            ProductModel.id == wanted.c.product_id,
+            ProductModel.is_active == True,
+            ProductModel.stock_shards == 0,
+            or_(
+                wanted.c.delta <= 0,
+                ProductModel.stock - ProductModel.reserved >= wanted.c.delta
+            )
+        )
+        .values(reserved=ProductModel.reserved + wanted.c.delta)
+        .returning(ProductModel.id)
+        .execution_options(synchronize_session=False)
+    )).scalars().all())
+
+
+async def reserve_sharded_product(
+    product_id: int, quantity: int, held: tuple | None, db: AsyncSession
+) -> int | None:
+    """
+    Резервирование популярного товара на одном из его шардов. Прежний
+    резерв покупателя (количество, шард) снимается с его шарда, если
+    новый резерв не поставлен - возвращается обратно. Возвращает номер
+    шарда или None, если свободного остатка не хватает
+    """
+    def change_reserved(shard: int, delta: int):
+        return (
+            update(ProductStockShard)
+            .where(
+                ProductStockShard.product_id == product_id,
+                ProductStockShard.shard == shard
+            )
+            .values(reserved=ProductStockShard.reserved + delta)
+            .execution_options(synchronize_session=False)
+        )
+
+    if held is not None:
+        await db.execute(change_reserved(held[1], -held[0]))
+    shard = await reserve_stock_shard(product_id, quantity, db)
+    if shard is None and held is not None:
+        await db.execute(change_reserved(held[1], held[0]))
+    return shard
+
+
+async def place_stock_holds(
+    user_id: int, quantities: dict[int, int], db: AsyncSession
+) -> set[int]:
+    """
+    Резервирование товаров покупателем (id товара -> количество).
+    Количество учитывается условным UPDATE счётчика reserved товара
+    (у популярного товара - одного из шардов), без блокировки товара
+    и без подсчёта чужих резервов. Резерв покупателя создаётся или
+    обновляется с продлением срока. Возвращает id зарезервированных
+    товаров. Коммит выполняет вызывающий код
+    """
+    if not quantities:
+        return set()
+    await lock_user_stock_holds(user_id, db)
+    # Прежние резервы покупателя (в том числе истёкшие - они ещё
+    # учтены в счётчиках) блокируются от очистки до коммита
+    held = {
+        product_id: (quantity, shard)
+        for product_id, quantity, shard in (await db.execute(
+            select(StockHold.product_id, StockHold.quantity, StockHold.shard)
+            .where(
+                StockHold.user_id == user_id,
+                StockHold.product_id.in_(list(quantities))
+            )
+            .with_for_update()
+        )).all()
+    }
+    shard_counts = dict((await db.execute(
+        select(ProductModel.id, ProductModel.stock_shards).where(
+            ProductModel.id.in_(list(quantities)),
+            ProductModel.is_active == True
+        )
+    )).all())
+
+    placed = dict.fromkeys(await reserve_products(
+        {
+            product_id: quantity - held.get(product_id, (0, None))[0]
+            for product_id, quantity in quantities.items()
+            if shard_counts.get(product_id) == 0
+        },
+        db
+    ))
+    for product_id in sorted(quantities):
+        if not shard_counts.get(product_id):
+            continue
+        shard = await reserve_sharded_product(
+            product_id, quantities[product_id], held.get(product_id), db
+        )
+        if shard is not None:
+            placed[product_id] = shard
+    if not placed:
+        return set()
+
+    stmt = pg_insert(StockHold).values([
+        {
+            'user_id': user_id,
+            'product_id': product_id,
+            'quantity': quantities[product_id],
+            'shard': shard,
+            'expires_at': func.now() + timedelta(seconds=conf.STOCK_HOLD_TTL)
+        }
+        for product_id, shard in sorted(placed.items())
+    ])
+    await db.execute(stmt.on_conflict_do_update(
+        constraint='uq_stock_holds_user_product',
+        set_={
+            'quantity': stmt.excluded.quantity,
+            'shard': stmt.excluded.shard,
+            'expires_at': stmt.excluded.expires_at,
+        }
+    ))
+    return set(placed)
+
+
+def get_release_ctes(*where) -> list:
+    """
+    CTE снятия резервов по условию where (DELETE ... RETURNING)
+    и возврата их количества из счётчиков reserved товаров и шардов.
+    Первый CTE - удалённые резервы
+    """
+    released = (
+        delete(StockHold)
+        .where(*where)
+        .returning(StockHold.product_id, StockHold.shard, StockHold.quantity)
+        .cte('released')
+    )
+    totals = (
+        select(
+            released.c.product_id,
+            released.c.shard,
+            func.sum(released.c.quantity).label('quantity')
+        )
+        .group_by(released.c.product_id, released.c.shard)
+        .cte('released_totals')
+    )
+    products = (
+        update(ProductModel)
+        .where(
+            ProductModel.id == totals.c.product_id,
+            totals.c.shard.is_(None)
+        )
+        .values(reserved=ProductModel.reserved - totals.c.quantity)
+        .cte('released_products')
+    )
+    shards = (
+        update(ProductStockShard)
+        .where(
+            ProductStockShard.product_id == totals.c.product_id,
+            ProductStockShard.shard == totals.c.shard
+        )
+        .values(reserved=ProductStockShard.reserved - totals.c.quantity)
+        .cte('released_shards')
+    )
+    return [released, totals, products, shards]
+
+
+def get_release_stock_holds_ctes(user_id: int, product_ids=None) -> list:
+    """
+    CTE снятия резервов покупателя (всех или по товарам product_ids)
+    """
+    where = [StockHold.user_id == user_id]
+    if product_ids is not None:
+        where.append(StockHold.product_id.in_(product_ids))
+    return get_release_ctes(*where)
+
+
+async def release_stock_holds(
+    user_id: int, db: AsyncSession, product_ids=None
+) -> None:
+    """
+    Снятие резервов покупателя (всех или по товарам product_ids).
+    Коммит выполняет вызывающий код
+    """
+    released, *ctes = get_release_stock_holds_ctes(user_id, product_ids)
+    await db.execute(
+        select(func.count()).select_from(released).add_cte(*ctes)
+    )
+
+
+async def get_missing_stock_holds(
+    user_id: int, quantities: dict[int, int], db: AsyncSession
+) -> dict[int, int]:
+    """
+    Позиции, для которых у покупателя нет активного резерва
+    на нужное количество (резерв истёк, снят или меньше нужного)
+    """
+    held = dict((await db.execute(
+        select(StockHold.product_id, StockHold.quantity).where(
+            StockHold.user_id == user_id,
+            StockHold.product_id.in_(list(quantities)),
+            StockHold.expires_at > func.now()
+        )
+    )).all())
+    return {
+        product_id: quantity for product_id, quantity in quantities.items()
+        if held.get(product_id) != quantity
+    }
+
+
+async def convert_stock_holds(
+    user_id: int, quantities: dict[int, int], db: AsyncSession
+) -> list:
+    """
+    Списание резервов покупателя под заказ (id товара -> количество):
+    удаляются только активные резервы ровно на нужное количество
+    (DELETE ... RETURNING), для них читается снимок товара. Строки
+    products не блокируются и не меняются - остаток и счётчик резервов
+    уменьшает take_converted_stock последним запросом перед коммитом.
+    Возвращает словари товаров: количество, шард резерва, цена, снимок
+    товара для деталей заказа и число шардов остатка. Коммит выполняет
+    вызывающий код
+    """
+    converted = {
+        product_id: (quantity, shard)
+        for product_id, quantity, shard in (await db.execute(
+            delete(StockHold)
+            .where(
+                StockHold.user_id == user_id,
+                tuple_(StockHold.product_id, StockHold.quantity)
+                .in_(list(quantities.items())),
+                StockHold.expires_at > func.now()
+            )
+            .returning(
+                StockHold.product_id, StockHold.quantity, StockHold.shard
+            )
+        )).all()
+    }
+    if not converted:
+        return []
+    snapshot = (await db.execute(
+        select(
+            ProductModel.id.label('product_id'),
+            ProductModel.price,
+            ProductModel.name.label('product_name'),
+            ProductModel.image_url.label('product_image_url'),
+            ProductModel.seller_id,
+            ProductModel.stock_shards
+        )
+        .where(ProductModel.id.in_(list(converted)))
+        .order_by(ProductModel.id)
+    )).mappings().all()
+    return [
+        dict(
+            row,
+            quantity=converted[row['product_id']][0],
+            shard=converted[row['product_id']][1]
+        )
+        for row in snapshot
+    ]
+
+
+async def take_converted_stock(converted: list, db: AsyncSession) -> set[int]:
+    """
+    Уменьшение остатка и счётчика резервов товаров заказа (строки
+    convert_stock_holds) на количество списанных резервов. Вызывается
+    последним запросом перед коммитом. Товары без шардов списываются
+    одним UPDATE products (остаток их карточек обновляется в том же
+    запросе), популярные - одним UPDATE шардов своих резервов, строка
+    products не меняется. Возвращает id товаров, остатка которых хватило
+    """
+    if not converted:
+        return set()
+    rows = sorted(
+        (item['product_id'], item['shard'], item['quantity'])
+        for item in converted
+    )
+    unsharded_rows = [
+        (product_id, quantity)
+        for product_id, shard, quantity in rows if shard is None
+    ]
+    sharded_rows = [row for row in rows if row[1] is not None]
+    taken = set()
+
+    if unsharded_rows:
+        unsharded = values(
+            column('product_id', Integer),
+            column('quantity', Integer),
+            name='unsharded'
+        ).data(unsharded_rows)
+        decremented = (
+            update(ProductModel)
+            .where(
+                ProductModel.id == unsharded.c.product_id,
+                # Страховка от уменьшения остатка продавцом
+                # после резервирования
+                ProductModel.stock >= unsharded.c.quantity
+            )
+            .values(
+                stock=ProductModel.stock - unsharded.c.quantity,
+                reserved=ProductModel.reserved - unsharded.c.quantity
+            )
+            .returning(ProductModel.id, ProductModel.stock)
+            .cte('decremented')
+        )
+        cards = (
+            update(ProductCard)
+            .where(ProductCard.product_id == decremented.c.id)
+            .values(stock=decremented.c.stock)
+            .cte('cards')
+        )
+        taken.update((await db.execute(
+            select(decremented.c.id).add_cte(cards)
+        )).scalars().all())
+
+    if sharded_rows:
+        sharded = values(
+            column('product_id', Integer),
+            column('shard', Integer),
+            column('quantity', Integer),
+            name='sharded'
+        ).data(sharded_rows)
+        taken.update((await db.execute(
+            update(ProductStockShard)
+            .where(
+                ProductStockShard.product_id == sharded.c.product_id,
+                ProductStockShard.shard == sharded.c.shard,
+                ProductStockShard.stock >= sharded.c.quantity
+            )
+            .values(
+                stock=ProductStockShard.stock - sharded.c.quantity,
+                reserved=ProductStockShard.reserved - sharded.c.quantity
+            )
+            .returning(ProductStockShard.product_id)
+            .execution_options(synchronize_session=False)
+        )).scalars().all())
+    return taken
+
+
+async def return_cancelled_stock(
+    order_keys: list[tuple], db: AsyncSession
+) -> None:
+    """
+    Возврат количества отменённых заказов (ключи id, дата) в остаток -
+    обратная операция take_converted_stock одним запросом: товарам
+    без шардов количество прибавляется в products (и в их карточки),
+    популярным - в шард с номером id заказа по модулю числа шардов
+    (products.stock обновит синхронизация шардов). Коммит выполняет
+    вызывающий код
+    """
+    if not order_keys:
+        return
+    # У товара без шардов номер шарда всегда 0 (без деления на ноль)
+    shard = func.mod(
+        OrderItem.order_id, func.greatest(ProductModel.stock_shards, 1)
+    )
+    cancelled = (
+        select(
+            OrderItem.product_id,
+            ProductModel.stock_shards,
+            shard.label('shard'),
+            func.sum(OrderItem.quantity).label('quantity')
+        )
+        .join(ProductModel, ProductModel.id == OrderItem.product_id)
+        .where(
+            tuple_(OrderItem.order_id, OrderItem.order_date).in_(order_keys)
+        )
+        .group_by(OrderItem.product_id, ProductModel.stock_shards, shard)
+        .cte('cancelled')
+    )
+    restocked = (
+        update(ProductModel)
+        .where(
+            ProductModel.id == cancelled.c.product_id,
+            cancelled.c.stock_shards == 0
+        )
+        .values(stock=ProductModel.stock + cancelled.c.quantity)
+        .returning(ProductModel.id, ProductModel.stock)
+        .cte('restocked')
+    )
+    cards = (
+        update(ProductCard)
+        .where(ProductCard.product_id == restocked.c.id)
+        .values(stock=restocked.c.stock)
+        .cte('restocked_cards')
+    )
+    shards = (
+        update(ProductStockShard)
+        .where(
+            ProductStockShard.product_id == cancelled.c.product_id,
+            ProductStockShard.shard == cancelled.c.shard,
+            cancelled.c.stock_shards > 0
+        )
+        .values(stock=ProductStockShard.stock + cancelled.c.quantity)
+        .cte('restocked_shards')
+    )
+    await db.execute(
+        select(func.count()).select_from(restocked).add_cte(cards, shards)
+    )
+
+
+async def sweep_stock_holds() -> int:
+    """
+    Удаление истёкших резервов пачками с возвратом их количества
+    из счётчиков reserved. Строки, заблокированные резервированием
+    или оформлением заказа, пропускаются (SKIP LOCKED) - их спишет или
+    снимет само оформление. Возвращает количество удалённых резервов
+    """
+    released = 0
+    while True:
+        expired = (
+            select(StockHold.id)
+            .where(StockHold.expires_at <= func.now())
+            .limit(conf.STOCK_HOLD_SWEEP_BATCH_SIZE)
+            .with_for_update(skip_locked=True)
+        )
+        deleted, *ctes = get_release_ctes(
+            StockHold.id.in_(expired.scalar_subquery())
+        )
+        async with async_session_maker() as db:
+            count = await db.scalar(
+                select(func.count()).select_from(deleted).add_cte(*ctes)
+            )
+            await db.commit()
+        released += count
+        if count < conf.STOCK_HOLD_SWEEP_BATCH_SIZE:
+            return released
+
+
+async def run_stock_hold_sweeper() -> None:
+    """Периодическая очистка истёкших резервов (фоновая задача воркера)"""
+    while True:
+        await asyncio.sleep(conf.STOCK_HOLD_SWEEP_INTERVAL)
+        try:
+            released = await sweep_stock_holds()
+            if released:
+                logger.info(f'Released {released} expired stock holds')
+        except Exception as e:
+            logger.warning(f'Stock hold sweep failed: {e}')
@@ -0,0 +1,282 @@
+import asyncio
+
+from fastapi import HTTPException, status
+from loguru import logger
+from sqlalchemy import delete, func, or_, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import app.config as conf
+from app.database import async_session_maker
+from app.models import (
+    Product as ProductModel, ProductCard, ProductStockShard, StockHold
+)
+
+
+def get_sharded_stock_expression(product_id):
+    """Сумма остатков шардов товара"""
+    return func.coalesce(
+        select(func.sum(ProductStockShard.stock))
+        .where(ProductStockShard.product_id == product_id)
+        .scalar_subquery(),
+        0
+    )
+
+
+async def assign_stock_hold_shards(
+    product_id: int, shard_count: int, db: AsyncSession
+) -> dict[int, int]:
+    """
+    Перенос резервов товара без шарда или с удалённого шарда
+    на шарды 0..shard_count-1 (по id резерва) и пересчёт счётчиков
+    reserved шардов по резервам. Возвращает номер шарда -> количество
+    в резервах. Вызывается при смене режима шардов под блокировкой
+    товара
+    """
+    await db.execute(
+        update(StockHold)
+        .where(
+            StockHold.product_id == product_id,
+            or_(StockHold.shard.is_(None), StockHold.shard >= shard_count)
+        )
+        .values(shard=StockHold.id % shard_count)
+    )
+    return dict((await db.execute(
+        select(StockHold.shard, func.sum(StockHold.quantity))
+        .where(StockHold.product_id == product_id)
+        .group_by(StockHold.shard)
+    )).all())
+
+
+async def distribute_stock(
+    product_id: int, total: int, shard_count: int, db: AsyncSession
+) -> None:
+    """
+    Раскладка остатка total по shard_count шардам: каждому шарду сначала
+    достаётся количество его резервов, остальное делится поровну. Строки
+    шардов обновляются на месте (INSERT ... ON CONFLICT DO UPDATE
+    в порядке номеров), лишние шарды удаляются, их резервы переносятся
+    на оставшиеся. Коммит выполняет вызывающий код
+    """
+    reserved = await assign_stock_hold_shards(product_id, shard_count, db)
+    stocks = {}
+    for shard in range(shard_count):
+        stocks[shard] = min(reserved.get(shard, 0), total)
+        total -= stocks[shard]
+    share, rest = divmod(total, shard_count)
+    stmt = pg_insert(ProductStockShard).values([
+        {
+            'product_id': product_id,
+            'shard': shard,
+            'stock': stocks[shard] + share + (1 if shard < rest else 0),
+            'reserved': reserved.get(shard, 0)
+        }
+        for shard in range(shard_count)
+    ])
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=['product_id', 'shard'],
+        set_={'stock': stmt.excluded.stock, 'reserved': stmt.excluded.reserved}
+    ))
+    await db.execute(
+        delete(ProductStockShard)
+        .where(
+            ProductStockShard.product_id == product_id,
+            ProductStockShard.shard >= shard_count
+        )
+    )
+
+
+async def lock_product_stock(product_id: int, db: AsyncSession):
+    """
+    Блокировка строки товара и его шардов до конца транзакции
+    и получение товара с актуальным остатком (для смены режима)
+    """
+    product = await db.scalar(
+        select(ProductModel)
+        .where(ProductModel.id == product_id)
+        .with_for_update()
+    )
+    if product is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Product not found"
+        )
+    if product.stock_shards > 0:
+        shards = (await db.execute(
+            select(ProductStockShard.stock)
+            .where(ProductStockShard.product_id == product_id)
+            .order_by(ProductStockShard.shard)
+            .with_for_update()
+        )).scalars().all()
+        product.stock = sum(shards)
+    return product
+
+
+async def enable_stock_shards(
+    product_id: int, db: AsyncSession, shard_count: int = conf.STOCK_SHARD_COUNT
+) -> None:
+    """
+    Включение (или смена числа) шардов остатка товара.
+    Коммит выполняет вызывающий код
+    """
+    product = await lock_product_stock(product_id, db)
+    await distribute_stock(product_id, product.stock, shard_count, db)
+    product.stock_shards = shard_count
+    product.reserved = 0
+
+
+async def disable_stock_shards(product_id: int, db: AsyncSession) -> None:
+    """
+    Возврат остатка и резервов товара в products и удаление шардов.
+    Коммит выполняет вызывающий код
+    """
+    product = await lock_product_stock(product_id, db)
+    await db.execute(
+        update(StockHold)
+        .where(StockHold.product_id == product_id)
+        .values(shard=None)
+    )
+    product.reserved = await db.scalar(
+        select(func.coalesce(func.sum(StockHold.quantity), 0))
+        .where(StockHold.product_id == product_id)
+    )
+    await db.execute(
+        delete(ProductStockShard)
+        .where(ProductStockShard.product_id == product_id)
+    )
+    product.stock_shards = 0
+
+
+def get_random_shard_stmt(product_id: int, quantity: int, skip_locked: bool):
+    """
+    Резервирование quantity на случайном шарде товара, в котором хватает
+    незарезервированного остатка (UPDATE ... RETURNING номера шарда)
+    """
+    random_shard = (
+        select(ProductStockShard.product_id, ProductStockShard.shard)
+        .where(
+            ProductStockShard.product_id == product_id,
+            ProductStockShard.stock - ProductStockShard.reserved >= quantity
+        )
+        .order_by(func.random())
+        .limit(1)
+        .with_for_update(skip_locked=skip_locked)
+    )
+    return (
+        update(ProductStockShard)
+        .where(
+            tuple_(ProductStockShard.product_id, ProductStockShard.shard)
+            .in_(random_shard)
+        )
+        .values(reserved=ProductStockShard.reserved + quantity)
+        .returning(ProductStockShard.shard)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def reserve_stock_shard(
+    product_id: int, quantity: int, db: AsyncSession
+) -> int | None:
+    """
+    Резервирование количества на одном шарде товара. Сначала берётся
+    случайный свободный (SKIP LOCKED) шард, в котором хватает
+    незарезервированного остатка, - параллельные резервы расходятся
+    по разным строкам. Если все такие шарды заняты, резерв ждёт один
+    случайный из них. Только если ни в одном шарде не хватает остатка,
+    шарды товара блокируются (в порядке номеров) и свободный остаток
+    других шардов переносится в шард с наибольшим свободным остатком.
+    Возвращает номер шарда или None, если остатка не хватает
+    """
+    for skip_locked in (True, False):
+        shard = await db.scalar(
+            get_random_shard_stmt(product_id, quantity, skip_locked)
+        )
+        if shard is not None:
+            return shard
+
+    # Запасной путь: ни в одном шарде не хватает свободного остатка -
+    # он собирается в один шард с нескольких
+    shards = (await db.execute(
+        select(
+            ProductStockShard.shard,
+            ProductStockShard.stock,
+            ProductStockShard.reserved
+        )
+        .where(ProductStockShard.product_id == product_id)
+        .order_by(ProductStockShard.shard)
+        .with_for_update()
+    )).all()
+    free = {
+        shard: max(stock - reserved, 0) for shard, stock, reserved in shards
+    }
+    if sum(stock - reserved for _, stock, reserved in shards) < quantity:
+        return None
+    target = max(shards, key=lambda row: free[row.shard])
+    missing = quantity - free[target.shard]
+    rows = [{
+        'product_id': product_id,
+        'shard': target.shard,
+        'stock': target.stock + missing,
+        'reserved': target.reserved + quantity
+    }]
+    for shard, stock, reserved in sorted(
+        shards, key=lambda row: -free[row.shard]
+    ):
+        if not missing:
+            break
+        if shard == target.shard:
+            continue
+        part = min(free[shard], missing)
+        missing -= part
+        rows.append({
+            'product_id': product_id,
+            'shard': shard,
+            'stock': stock - part,
+            'reserved': reserved
+        })
+    await db.execute(update(ProductStockShard), rows)
+    return target.shard
+
+
+async def sync_sharded_stock() -> None:
+    """
+    Запись суммы шардов в products.stock и карточки товаров
+    с шардами (для чтения остатка без агрегации). Выполняется одним
+    воркером (advisory lock Postgres на время транзакции), строки
+    переписываются, только если остаток изменился
+    """
+    async with async_session_maker() as db:
+        locked = await db.scalar(select(
+            func.pg_try_advisory_xact_lock(conf.STOCK_SHARD_SYNC_LOCK_KEY)
+        ))
+        if not locked:
+            return
+        sharded_stock = get_sharded_stock_expression(ProductModel.id)
+        await db.execute(
+            update(ProductModel)
+            .where(
+                ProductModel.stock_shards > 0,
+                ProductModel.stock.is_distinct_from(sharded_stock)
+            )
+            .values(stock=sharded_stock)
+        )
+        await db.execute(
+            update(ProductCard)
+            .where(
+                ProductCard.product_id == ProductModel.id,
+                ProductModel.stock_shards > 0,
+                ProductCard.stock.is_distinct_from(ProductModel.stock)
+            )
+            .values(stock=ProductModel.stock)
+        )
+        await db.commit()
+
+
+async def run_stock_shard_sync() -> None:
+    """Периодическая синхронизация остатков шардов (задача воркера)"""
+    while True:
+        await asyncio.sleep(conf.STOCK_SHARD_SYNC_INTERVAL)
+        try:
+            await sync_sharded_stock()
+        except Exception as e:
+            logger.warning(f'Stock shard sync failed: {e}')
@@ -0,0 +1,679 @@
+import abc
+import asyncio
+import hashlib
+import hmac
+import os
+import time
+import urllib
+from datetime import datetime, timedelta, timezone
+from pathlib import Path, PurePosixPath
+
+import aiofiles
+import aiohttp
+from fastapi import HTTPException, Request, UploadFile, status
+from loguru import logger
+from sqlalchemy import delete, exists, func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+import app.config as conf
+from app.database import async_session_maker
+from app.models import MediaBlob, OrderItem
+from .cache import LinkCache
+from .http_client import CircuitBreaker, call_with_retry, yandex_disk_breaker
+from .images import generate_image_variants, get_variant_name
+from .tools import (
+    get_name_file_with_digest,
+    read_path_chunks,
+    spool_upload,
+    validate_file_and_get_extension
+)
+from .validators import validate_size
+
+
+# Общее ограничение одновременных загрузок в хранилище на воркер
+upload_semaphore = asyncio.Semaphore(conf.MEDIA_MAX_CONCURRENT_UPLOADS)
+
+
+class StorageMetrics:
+    """
+    Метрики задержек операций хранилища (на один бэкенд и воркер)
+    """
+
+    def __init__(self):
+        self.operations: dict[str, dict] = {}
+
+    def observe(self, operation: str, duration: float, success: bool):
+        metric = self.operations.setdefault(
+            operation,
+            {'count': 0, 'errors': 0, 'total_seconds': 0.0, 'max_seconds': 0.0}
+        )
+        metric['count'] += 1
+        metric['errors'] += 0 if success else 1
+        metric['total_seconds'] += duration
+        metric['max_seconds'] = max(metric['max_seconds'], duration)
+
+
+# Метрики по имени бэкенда: {'local': StorageMetrics(), ...}
+storage_metrics: dict[str, StorageMetrics] = {}
+
+
+class MediaStorageConfigError(RuntimeError):
+    """Хранилище картинок, выбранное в настройках, не может быть создано"""
+
+
+class MediaStorage(abc.ABC):
+    """
+    Базовый интерфейс хранилища картинок товаров.
+    Наследники реализуют _save и _delete, а общие save и delete
+    ограничивают число одновременных загрузок и собирают метрики
+    """
+    name = 'base'
+    # Хранит ли бэкенд уменьшенные копии картинок. Копии имеют смысл
+    # только там, где ссылку на них можно вычислить по ссылке на оригинал
+    stores_variants = True
+
+    def __init__(self):
+        self.metrics = storage_metrics.setdefault(self.name, StorageMetrics())
+
+    # Папка временных файлов загрузки (у локального хранилища -
+    # та же, что у файлов, чтобы перемещение было атомарным)
+    spool_dir = conf.MEDIA_UPLOAD_ROOT
+
+    async def save(self, file: UploadFile):
+        """
+        Сохраняет изображение товара и его уменьшенные копии и возвращает
+        URL для скачивания оригинала, а также имя файла с которым оно
+        будет сохранено в объекте модели Image
+        """
+        extension = validate_file_and_get_extension(file)
+        # Файл читается один раз: во временный файл с подсчётом хеша,
+        # имя файла в хранилище формируется по хешу содержимого
+        async with spool_upload(file, self.spool_dir) as (path, digest):
+            file_name = get_name_file_with_digest(digest, extension)
+            link, writer = await self.acquire_blob(file_name)
+            if link is None and not writer:
+                # Тот же файл сейчас записывает другая загрузка
+                link, writer = await self.wait_for_blob(file_name)
+            if not writer:
+                return [link, file_name]
+            data = None
+            if self.stores_variants:
+                data = await asyncio.to_thread(path.read_bytes)
+            try:
+                async with upload_semaphore:
+                    link = await self.observe(
+                        'save',
+                        self._save(path, file_name, file.content_type)
+                    )
+            except Exception:
+                await self.release_blob(file_name)
+                raise
+        await self.set_blob_url(file_name, link)
+        if data is not None:
+            await self.save_variants(data, file_name)
+        return [link, file_name]
+
+    def get_blob_key(self, file_name: str) -> tuple:
+        """Условие на строку media_blobs файла в этом хранилище"""
+        return (
+            MediaBlob.backend == self.name,
+            MediaBlob.file_name == file_name
+        )
+
+    async def acquire_blob(self, file_name: str) -> tuple[str | None, bool]:
+        """
+        Добавляет ссылку на файл с таким же содержимым в этом хранилище.
+        Возвращает ссылку на файл (None, если файл ещё не записан)
+        и признак записи: файл записывает только загрузка, вставившая
+        строку, - параллельные загрузки того же файла его не трогают
+        """
+        async with async_session_maker() as db:
+            while True:
+                inserted = await db.scalar(
+                    pg_insert(MediaBlob)
+                    .values(
+                        backend=self.name,
+                        digest=PurePosixPath(file_name).stem,
+                        file_name=file_name,
+                        ref_count=1,
+                        writing_until=func.now() + timedelta(
+                            seconds=conf.MEDIA_BLOB_WRITE_TIMEOUT
+                        )
+                    )
+                    .on_conflict_do_nothing()
+                    .returning(MediaBlob.file_name)
+                )
+                if inserted is not None:
+                    await db.commit()
+                    return None, True
+                url = (await db.execute(
+                    update(MediaBlob)
+                    .where(*self.get_blob_key(file_name))
+                    .values(ref_count=MediaBlob.ref_count + 1)
+                    .returning(MediaBlob.url)
+                )).one_or_none()
+                # Строку успели удалить - вставка повторяется
+                if url is not None:
+                    await db.commit()
+                    return url[0], False
+
+    async def wait_for_blob(self, file_name: str) -> tuple[str | None, bool]:
+        """
+        Ожидание записи файла другой загрузкой. Если она не записала
+        файл за MEDIA_BLOB_WRITE_TIMEOUT (упала или отменена), запись
+        перехватывается. Возвращает ссылку и признак записи
+        """
+        while True:
+            await asyncio.sleep(conf.MEDIA_BLOB_WAIT_INTERVAL)
+            async with async_session_maker() as db:
+                url = await db.scalar(
+                    select(MediaBlob.url).where(*self.get_blob_key(file_name))
+                )
+                if url is not None:
+                    return url, False
+                claimed = await db.scalar(
+                    update(MediaBlob)
+                    .where(
+                        *self.get_blob_key(file_name),
+                        MediaBlob.url.is_(None),
+                        or_(
+                            MediaBlob.writing_until.is_(None),
+                            MediaBlob.writing_until < func.now()
+                        )
+                    )
+                    .values(writing_until=func.now() + timedelta(
+                        seconds=conf.MEDIA_BLOB_WRITE_TIMEOUT
+                    ))
+                    .returning(MediaBlob.file_name)
+                )
+                await db.commit()
+            if claimed is not None:
+                return None, True
+
+    async def set_blob_url(self, file_name: str, url: str) -> None:
+        async with async_session_maker() as db:
+            await db.execute(
+                update(MediaBlob)
+                .where(*self.get_blob_key(file_name))
+                .values(url=url, writing_until=None)
+            )
+            await db.commit()
+
+    async def release_blob(self, file_name: str) -> None:
+        """
+        Снятие ссылки на файл, запись которого не удалась. Если того же
+        файла ждут другие загрузки, запись сразу переходит к одной из них
+        """
+        async with async_session_maker() as db:
+            await db.execute(
+                update(MediaBlob)
+                .where(*self.get_blob_key(file_name))
+                .values(
+                    ref_count=MediaBlob.ref_count - 1,
+                    writing_until=None
+                )
+            )
+            await db.execute(
+                delete(MediaBlob).where(
+                    *self.get_blob_key(file_name),
+                    MediaBlob.ref_count <= 0,
+                    MediaBlob.url.is_(None)
+                )
+            )
+            await db.commit()
+
+    async def save_variants(self, data: bytes, file_name: str) -> None:
+        """
+        Создание уменьшенных копий картинки в пуле процессов, сохранение
+        их рядом с оригиналом и запись сохранённых копий в media_blobs.
+        Ошибка обработки не отменяет загрузку оригинала - вместо
+        недостающих копий клиенты получают оригинал
+        """
+        try:
+            variants = await generate_image_variants(data)
+        except Exception as e:
+            logger.warning(f'Image variants for {file_name} failed: {e}')
+            return
+        async with upload_semaphore:
+            results = await asyncio.gather(
+                *(
+                    self.observe(
+                        'save',
+                        self._save_bytes(
+                            get_variant_name(file_name, variant), content
+                        )
+                    )
+                    for variant, content in variants.items()
+                ),
+                return_exceptions=True
+            )
+        saved = []
+        for variant, result in zip(variants, results):
+            if isinstance(result, Exception):
+                logger.warning(
+                    f'Image variant {variant} for {file_name} failed: {result}'
+                )
+            else:
+                saved.append(variant)
+        await self.set_blob_variants(file_name, saved)
+
+    async def set_blob_variants(
+        self, file_name: str, variants: list[str]
+    ) -> None:
+        """Запись копий картинки, которые есть в хранилище"""
+        async with async_session_maker() as db:
+            await db.execute(
+                update(MediaBlob)
+                .where(*self.get_blob_key(file_name))
+                .values(variants=variants or None)
+            )
+            await db.commit()
+
+    async def delete(self, url: str | None) -> None:
+        """
+        Снимает ссылку на файл изображения по URL оригинала и удаляет
+        файл и его копии, когда на него больше не ссылаются ни товары,
+        ни снимки товаров в заказах
+        """
+        if not url:
+            return
+        file_name = self.get_file_name(url)
+        if file_name is None:
+            return
+        # Ссылка определяет и хранилище: файл с тем же содержимым
+        # в другом бэкенде - другая строка media_blobs
+        blob_key = (MediaBlob.backend == self.name, MediaBlob.url == url)
+        async with async_session_maker() as db:
+            ref_count = await db.scalar(
+                update(MediaBlob)
+                .where(*blob_key)
+                .values(ref_count=MediaBlob.ref_count - 1)
+                .returning(MediaBlob.ref_count)
+            )
+            if ref_count is not None and ref_count > 0:
+                # Файл ещё используется другими товарами
+                await db.commit()
+                return
+            # Картинку показывают снимки товаров в заказах - файл остаётся
+            # (строку без ссылок позже удалит очистка сирот)
+            if await db.scalar(
+                select(exists().where(OrderItem.product_image_url == url))
+            ):
+                await db.commit()
+                return
+            if ref_count is not None:
+                await db.execute(delete(MediaBlob).where(*blob_key))
+            elif await db.scalar(
+                select(exists().where(*self.get_blob_key(file_name)))
+            ):
+                # Ссылка не из этого хранилища, а файл с тем же именем
+                # в нём учтён под своей ссылкой
+                await db.commit()
+                return
+            # Файлы удаляются до фиксации транзакции: параллельная
+            # загрузка того же файла ждёт снятия блокировки строки
+            # и записывает файл заново
+            await self.delete_files(file_name)
+            await db.commit()
+
+    async def delete_files(self, file_name: str) -> None:
+        """Удаляет файл изображения и его копии из хранилища"""
+        file_names = [file_name]
+        if self.stores_variants:
+            file_names += [
+                get_variant_name(file_name, variant)
+                for variant in conf.IMAGE_VARIANTS
+            ]
+        await asyncio.gather(*(
+            self.observe('delete', self._delete(name)) for name in file_names
+        ))
+
+    def get_file_name(self, url: str) -> str | None:
+        """Имя файла в хранилище по ссылке на него"""
+        return url.rsplit('/', 1)[-1]
+
+    async def resolve_links(self, urls) -> dict[str, str]:
+        """
+        Ссылки для скачивания по сохранённым в БД адресам картинок.
+        У хранилищ с постоянными ссылками они совпадают
+        """
+        return {url: url for url in urls if url}
+
+    def is_link_cached(self, url: str) -> bool:
+        return True
+
+    async def observe(self, operation: str, coroutine):
+        start_time = time.monotonic()
+        success = False
+        try:
+            result = await coroutine
+            success = True
+            return result
+        finally:
+            duration = time.monotonic() - start_time
+            self.metrics.observe(operation, duration, success)
+            logger.info(
+                f'Media storage {self.name} {operation}: '
+                f'{duration:.3f} s ({"ok" if success else "error"})'
+            )
+
+    @abc.abstractmethod
+    async def _save(self, path: Path, file_name: str, content_type) -> str:
+        """
+        Запись временного файла загрузки path в хранилище под именем
+        file_name с возвратом ссылки на него
+        """
+
+    @abc.abstractmethod
+    async def _save_bytes(self, file_name: str, data: bytes) -> None:
+        """Запись уменьшенной копии картинки"""
+
+    @abc.abstractmethod
+    async def _delete(self, file_name: str) -> None:
+        """Удаление файла из хранилища"""
+
+
+class LocalMediaStorage(MediaStorage):
+    """Хранение картинок на диске текущей машины в MEDIA_ROOT"""
+    name = 'local'
+
+    spool_dir = conf.MEDIA_ROOT
+
+    async def _save(self, path: Path, file_name: str, content_type) -> str:
+        try:
+            # Готовый временный файл переименовывается в файл хранилища
+            # атомарно: под именем файла никогда не лежит неполный файл
+            await asyncio.to_thread(
+                os.replace, path, conf.MEDIA_ROOT / file_name
+            )
+        except OSError as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"An unexpected error occurred during file upload: {e}"
+            )
+        # Формирование готовой ссылки для скачивания
+        return (
+            f'/{conf.DIRECTORY_USER_CONTENT}/'
+            f'{conf.DIRECTORY_IMAGE_PRODUCTS}'
+            f'/{file_name}'
+        )
+
+    async def _save_bytes(self, file_name: str, data: bytes) -> None:
+        async with aiofiles.open(conf.MEDIA_ROOT / file_name, "wb") as out_file:
+            await out_file.write(data)
+
+    async def _delete(self, file_name: str) -> None:
+        file_path = conf.MEDIA_ROOT / file_name
+        if file_path.exists():
+            file_path.unlink()
+
+
+class RemoteMediaStorage(MediaStorage):
+    """
+    Общая часть удалённых хранилищ: общий HTTP-клиент приложения,
+    повторы запросов и размыкатель цепи
+    """
+    breaker: CircuitBreaker
+
+    def __init__(self, session: aiohttp.ClientSession):
+        super().__init__()
+        self.session = session
+
+    async def _save(self, path: Path, file_name: str, content_type) -> str:
+        size = (await asyncio.to_thread(path.stat)).st_size
+
+        async def upload():
+            # Каждая попытка читает временный файл с начала. Тело
+            # запроса передаётся потоком чанков, без склейки файла
+            # в памяти
+            return await self.upload(
+                read_path_chunks(path), file_name, size, content_type
+            )
+
+        try:
+            return await call_with_retry(upload, self.breaker)
+        except HTTPException:
+            raise
+        except Exception as e:
+            # Общая обработка возможных ошибок (например, проблем с диском)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"An unexpected error occurred during file upload: {e}"
+            )
+
+    async def _save_bytes(self, file_name: str, data: bytes) -> None:
+        content_type = (
+            'image/jpeg' if conf.IMAGE_VARIANT_FORMAT == 'jpeg'
+            else 'image/webp'
+        )
+        await call_with_retry(
+            lambda: self.upload(data, file_name, len(data), content_type),
+            self.breaker
+        )
+
+    async def _delete(self, file_name: str) -> None:
+        await call_with_retry(lambda: self.remove(file_name), self.breaker)
+
+    @abc.abstractmethod
+    async def upload(self, body, file_name: str, size, content_type) -> str:
+        """
+        Загрузка тела body (байты или асинхронный генератор чанков)
+        в хранилище с возвратом ссылки на файл
+        """
+
+    @abc.abstractmethod
+    async def remove(self, file_name: str) -> None:
+        """Удаление файла из хранилища"""
+
+
+class YandexDiskMediaStorage(RemoteMediaStorage):
+    """
+    Хранение картинок в папке приложения на яндекс диске.
+    В БД хранится путь к файлу (app:/<имя файла>), а временные ссылки
+    на скачивание запрашиваются при обращении и кэшируются
+    """
+    name = 'yandex'
+    breaker = yandex_disk_breaker
+    # Копии пришлось бы отдавать через отдельные временные ссылки,
+    # поэтому на яндекс диск загружаются только оригиналы
+    stores_variants = False
+
+    def __init__(self, session: aiohttp.ClientSession):
+        super().__init__(session)
+        self.link_cache = LinkCache(
+            conf.YANDEX_LINK_CACHE_TTL, conf.YANDEX_LINK_CACHE_MAX_SIZE
+        )
+
+    async def upload(self, body, file_name: str, size, content_type) -> str:
+        path = f'{conf.YANDEX_APP_PATH_PREFIX}{file_name}'
+        payload = {
+            # Загрузить файл с названием file_name в папку приложения.
+            'path': path,
+            # перезапись существующего файла
+            'overwrite': 'True'
+        }
+        # Получение ссылки для загрузки файла
+        async with self.session.get(
+            url=conf.REQUEST_UPLOAD_URL,
+            # Заголовок для авторизации
+            headers=conf.AUTH_HEADERS,
+            # Параметры файла
+            params=payload
+        ) as response:
+            upload_url = (await response.json())['href']
+
+        # Процесс сохранения файла
+        async with self.session.put(
+            data=body,
+            url=upload_url
+        ):
+            pass
+        # Ссылка на скачивание временная, поэтому сохраняется путь
+        return path
+
+    async def get_download_link(self, path: str) -> str:
+        """Запрос временной ссылки на скачивание файла по его пути"""
+        async def request():
+            async with self.session.get(
+                url=conf.DOWNLOAD_LINK_URL,
+                headers=conf.AUTH_HEADERS,
+                params={'path': path}
+            ) as file_link:
+                return (await file_link.json())['href']
+
+        return await call_with_retry(request, self.breaker)
+
+    async def resolve_links(self, urls) -> dict[str, str]:
+        links = {url: url for url in urls if url}
+        paths = [
+            url for url in links
+            if url.startswith(conf.YANDEX_APP_PATH_PREFIX)
+        ]
+        return links | await self.link_cache.get_many(
+            paths, self.get_download_link
+        )
+
+    def is_link_cached(self, url: str) -> bool:
+        return self.link_cache.peek(url) is not None
+
+    def get_file_name(self, url: str) -> str | None:
+        if url.startswith(conf.YANDEX_APP_PATH_PREFIX):
+            return url.removeprefix(conf.YANDEX_APP_PATH_PREFIX)
+        # Старые записи хранят ссылку на скачивание,
+        # имя файла передаётся в её параметре filename
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(url).query)
+        return query.get('filename', [None])[0]
+
+    async def remove(self, file_name: str) -> None:
+        self.link_cache.invalidate(f'{conf.YANDEX_APP_PATH_PREFIX}{file_name}')
+        async with self.session.delete(
+            url=conf.RESOURCES_URL,
+            headers=conf.AUTH_HEADERS,
+            params={
+                'path': f'{conf.YANDEX_APP_PATH_PREFIX}{file_name}',
+                'permanently': 'true'
+            }
+        ):
+            pass
+
+
+class S3MediaStorage(RemoteMediaStorage):
+    """
+    Хранение картинок в S3-совместимом хранилище (path-style адреса,
+    подпись запросов AWS Signature V4 без подписи тела запроса)
+    """
+    name = 's3'
+    breaker = CircuitBreaker(
+        'S3 storage',
+        conf.HTTP_CIRCUIT_FAILURE_THRESHOLD,
+        conf.HTTP_CIRCUIT_RESET_TIMEOUT
+    )
+
+    # Настройки, без которых запросы к S3 невозможны
+    required_settings = (
+        'S3_ENDPOINT_URL', 'S3_BUCKET', 'S3_ACCESS_KEY', 'S3_SECRET_KEY'
+    )
+
+    def __init__(self, session: aiohttp.ClientSession):
+        missing = [
+            setting for setting in self.required_settings
+            if not getattr(conf, setting)
+        ]
+        if missing:
+            raise MediaStorageConfigError(
+                f'S3 media storage requires {", ".join(missing)}'
+            )
+        super().__init__(session)
+        self.endpoint = conf.S3_ENDPOINT_URL.rstrip('/')
+        self.public_url = (
+            conf.S3_PUBLIC_URL or f'{self.endpoint}/{conf.S3_BUCKET}'
+        ).rstrip('/')
+
+    def get_signed_headers(self, method: str, key: str) -> dict:
+        now = datetime.now(timezone.utc)
+        amz_date = now.strftime('%Y%m%dT%H%M%SZ')
+        date = now.strftime('%Y%m%d')
+        headers = {
+            'host': urllib.parse.urlparse(self.endpoint).netloc,
+            'x-amz-content-sha256': 'UNSIGNED-PAYLOAD',
+            'x-amz-date': amz_date,
+        }
+        signed_headers = ';'.join(sorted(headers))
+        canonical_request = '\n'.join([
+            method,
+            urllib.parse.quote(f'/{conf.S3_BUCKET}/{key}', safe='/-_.~'),
+            '',
+            ''.join(f'{name}:{headers[name]}\n' for name in sorted(headers)),
+            signed_headers,
+            'UNSIGNED-PAYLOAD'
+        ])
+        scope = f'{date}/{conf.S3_REGION}/s3/aws4_request'
+        string_to_sign = '\n'.join([
+            'AWS4-HMAC-SHA256',
+            amz_date,
+            scope,
+            hashlib.sha256(canonical_request.encode()).hexdigest()
+        ])
+        signing_key = f'AWS4{conf.S3_SECRET_KEY}'.encode()
+        for part in (date, conf.S3_REGION, 's3', 'aws4_request'):
+            signing_key = hmac.new(
+                signing_key, part.encode(), hashlib.sha256
+            ).digest()
+        signature = hmac.new(
+            signing_key, string_to_sign.encode(), hashlib.sha256
+        ).hexdigest()
+        headers['Authorization'] = (
+            f'AWS4-HMAC-SHA256 Credential={conf.S3_ACCESS_KEY}/{scope}, '
+            f'SignedHeaders={signed_headers}, Signature={signature}'
+        )
+        # Заголовок Host выставляет сам aiohttp
+        del headers['host']
+        return headers
+
+    async def upload(self, body, file_name: str, size, content_type) -> str:
+        # S3 требует Content-Length, поэтому размер проверяется заранее,
+        # а сам файл всё равно передаётся потоком чанков
+        validate_size(size)
+        headers = self.get_signed_headers('PUT', file_name) | {
+            'Content-Length': str(size),
+            'Content-Type': content_type,
+        }
+        async with self.session.put(
+            url=f'{self.endpoint}/{conf.S3_BUCKET}/{file_name}',
+            data=body,
+            headers=headers
+        ):
+            pass
+        return f'{self.public_url}/{file_name}'
+
+    async def remove(self, file_name: str) -> None:
+        async with self.session.delete(
+            url=f'{self.endpoint}/{conf.S3_BUCKET}/{file_name}',
+            headers=self.get_signed_headers('DELETE', file_name)
+        ):
+            pass
+
+
+def create_media_storage(session: aiohttp.ClientSession) -> MediaStorage:
+    """
+    Создание хранилища картинок, выбранного в MEDIA_STORAGE_BACKEND.
+    Неизвестный бэкенд или неполные настройки - ошибка при старте
+    """
+    if conf.MEDIA_STORAGE_BACKEND == YandexDiskMediaStorage.name:
+        return YandexDiskMediaStorage(session)
+    if conf.MEDIA_STORAGE_BACKEND == S3MediaStorage.name:
+        return S3MediaStorage(session)
+    if conf.MEDIA_STORAGE_BACKEND == LocalMediaStorage.name:
+        return LocalMediaStorage()
+    raise MediaStorageConfigError(
+        f'Unknown MEDIA_STORAGE_BACKEND {conf.MEDIA_STORAGE_BACKEND!r}, '
+        f'expected one of: {LocalMediaStorage.name}, '
+        f'{YandexDiskMediaStorage.name}, {S3MediaStorage.name}'
+    )
+
+
+async def get_media_storage(request: Request) -> MediaStorage:
+    """
+    Предоставляет хранилище картинок, созданное в lifespan приложения
+    """
+    return request.state.media_storage
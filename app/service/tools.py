@@ -1,25 +1,52 @@
+import asyncio
+import base64
+import hashlib
+import json
 import os
 import uuid
-import urllib
+from contextlib import asynccontextmanager
+from datetime import datetime
 from decimal import Decimal
 from pathlib import Path
 
 import aiofiles
-import aiohttp
 from fastapi import HTTPException, status, UploadFile, File, Form
-from sqlalchemy import select, update
+from sqlalchemy import (
+    Integer,
+    delete,
+    insert,
+    literal,
+    select,
+    union_all,
+    update
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import aliased, contains_eager, selectinload
 from sqlalchemy.sql import func
+from starlette.datastructures import Headers
+from starlette.requests import ClientDisconnect
 
 import app.config as conf
-from app.database import async_session_maker
 from app.models.cart_items import CartItem as CartItemModel
+from app.models.categories import Category as CategoryModel
+from app.models.category_closures import CategoryClosure
+from app.models.images import Image as ImageModel
 from app.models.orders import Order, OrderItem
+from app.models.product_cards import ProductCard
 from app.models.products import Product as ProductModel
 from app.models.reviews import Review as ReviewModel
+from app.models.users import User as UserModel
+from .seller_stats import record_seller_sales
+from .stock_holds import (
+    convert_stock_holds,
+    get_missing_stock_holds,
+    place_stock_holds,
+    release_stock_holds,
+    take_converted_stock
+)
 from .validators import (
-    validate_category,
+    validate_active_category,
     validate_content_type,
     validate_extension,
     validate_size
@@ -40,17 +67,48 @@ async def create_object_model(model, values, db: AsyncSession):
 
 
 async def update_object_model(
-    model, object_model, values: dict, db: AsyncSession
+    model, object_model, values: dict, db: AsyncSession,
+    commit: bool = True
 ):
+    """
+    Обновление объекта по id. С commit=False изменения остаются
+    в текущей транзакции, чтобы вызывающий код зафиксировал их вместе
+    со связанными изменениями (карточки товаров, шарды остатка)
+    """
     await db.execute(
         update(model)
         .where(model.id == object_model.id)
         .values(**values)
     )
+    if not commit:
+        await db.refresh(object_model)
+        return object_model
     object_model = await commit_and_refresh(object_model, db)
     return object_model
 
 
+def get_table_columns(model, exclude: tuple = ()):
+    """
+    Список колонок таблицы модели для Core-запросов
+    (без колонок, перечисленных в exclude)
+    """
+    return [
+        column for column in model.__table__.columns
+        if column.name not in exclude
+    ]
+
+
+async def get_rows(stmt, db: AsyncSession):
+    """
+    Выполняет Core-запрос только для чтения и возвращает строки
+    в виде словарей (RowMapping).
+    ORM-объекты не создаются, поэтому identity map и отслеживание
+    состояния не задействуются - строки сразу уходят в сериализатор
+    """
+    result = await db.execute(stmt)
+    return result.mappings().all()
+
+
 async def get_active_object_model_or_404(
     model, model_id, db: AsyncSession, description="Product not found"
 ):
@@ -68,14 +126,10 @@ async def get_active_object_model_or_404(
 
 
 async def get_active_object_model_or_404_and_validate_category(
-    model, model_id, db: AsyncSession, model_category
+    model, model_id, db: AsyncSession
 ):
     product = await get_active_object_model_or_404(model, model_id, db)
-    await validate_category(
-        category=model_category,
-        category_id=product.category_id,
-        db=db
-    )
+    await validate_active_category(product.category_id, db)
     return product
 
 
@@ -89,10 +143,194 @@ async def update_grade_product(product, db: AsyncSession):
     )
     avg_rating = product_raiting.scalar() or 0.0
     product.rating = avg_rating
+    # Обновление карточки товара (рейтинг и количество отзывов)
+    await refresh_product_cards(db, ProductModel.id == product.id)
     await db.commit()
 
 
-def get_validators_filters(kwargs: dict):
+async def refresh_product_cards(db: AsyncSession, *where):
+    """
+    Пересборка денормализованных карточек товаров, отобранных
+    условиями where (по таблицам products/categories/users),
+    одним запросом INSERT ... SELECT ... ON CONFLICT DO UPDATE.
+    Коммит выполняет вызывающий код
+    """
+    first_image = (
+        select(ImageModel.title_url)
+        .where(ImageModel.product_id == ProductModel.id)
+        .order_by(ImageModel.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    review_count = (
+        select(func.count())
+        .where(
+            ReviewModel.product_id == ProductModel.id,
+            ReviewModel.is_active == True
+        )
+        .scalar_subquery()
+    )
+    source = (
+        select(
+            ProductModel.id,
+            ProductModel.name,
+            ProductModel.price,
+            ProductModel.stock,
+            ProductModel.rating,
+            ProductModel.is_active,
+            func.coalesce(ProductModel.image_url, first_image),
+            ProductModel.category_id,
+            CategoryModel.name,
+            ProductModel.seller_id,
+            UserModel.email,
+            review_count
+        )
+        .join(CategoryModel, CategoryModel.id == ProductModel.category_id)
+        .join(UserModel, UserModel.id == ProductModel.seller_id)
+        .where(*where)
+    )
+    columns = [column.name for column in ProductCard.__table__.columns]
+    stmt = pg_insert(ProductCard).from_select(columns, source)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ProductCard.product_id],
+        set_={
+            column: stmt.excluded[column]
+            for column in columns if column != 'product_id'
+        }
+    )
+    await db.execute(stmt)
+
+
+async def notify_categories_changed(db: AsyncSession):
+    """
+    Уведомление всех воркеров об изменении категорий через
+    Postgres NOTIFY (доставляется подписчикам при коммите транзакции)
+    """
+    await db.execute(
+        select(func.pg_notify(conf.CATEGORY_CHANGES_CHANNEL, ''))
+    )
+
+
+async def add_category_closure(category_id, parent_id, db: AsyncSession):
+    """
+    Добавление в таблицу замыкания строк новой категории:
+    ссылки на саму себя (depth = 0) и на всех предков родителя
+    """
+    rows = select(
+        literal(category_id, Integer),
+        literal(category_id, Integer),
+        literal(0, Integer)
+    )
+    if parent_id is not None:
+        rows = union_all(
+            rows,
+            select(
+                CategoryClosure.ancestor_id,
+                literal(category_id, Integer),
+                CategoryClosure.depth + 1
+            ).where(CategoryClosure.descendant_id == parent_id)
+        )
+    await db.execute(
+        insert(CategoryClosure).from_select(
+            ['ancestor_id', 'descendant_id', 'depth'], rows
+        )
+    )
+
+
+async def move_category_closure(category_id, parent_id, db: AsyncSession):
+    """
+    Перенос поддерева категории к новому родителю в таблице замыкания.
+    Проверка на цикл выполняется заранее (validate_category_parent)
+    """
+    subtree = select(CategoryClosure.descendant_id).where(
+        CategoryClosure.ancestor_id == category_id
+    )
+    # Удаление связей поддерева со старыми предками
+    await db.execute(
+        delete(CategoryClosure).where(
+            CategoryClosure.descendant_id.in_(subtree),
+            CategoryClosure.ancestor_id.not_in(subtree)
+        )
+    )
+    if parent_id is None:
+        return
+    # Связывание каждого предка нового родителя с каждым узлом поддерева
+    supertree = aliased(CategoryClosure)
+    sub = aliased(CategoryClosure)
+    await db.execute(
+        insert(CategoryClosure).from_select(
+            ['ancestor_id', 'descendant_id', 'depth'],
+            select(
+                supertree.ancestor_id,
+                sub.descendant_id,
+                supertree.depth + sub.depth + 1
+            ).where(
+                supertree.descendant_id == parent_id,
+                sub.ancestor_id == category_id
+            )
+        )
+    )
+
+
+def get_category_subtree_ids(category_id):
+    """
+    Подзапрос id активных категорий поддерева (включая саму категорию)
+    """
+    return (
+        select(CategoryClosure.descendant_id)
+        .join(CategoryModel, CategoryModel.id == CategoryClosure.descendant_id)
+        .where(
+            CategoryClosure.ancestor_id == category_id,
+            CategoryModel.is_active == True
+        )
+    )
+
+
+async def build_category_tree(db: AsyncSession):
+    """
+    Построение дерева активных категорий одним рекурсивным CTE-запросом.
+    Подкатегории неактивной категории в дерево не попадают.
+    Возвращает список корневых узлов с вложенными children
+    """
+    tree = (
+        select(
+            CategoryModel.id,
+            CategoryModel.name,
+            CategoryModel.is_active,
+            CategoryModel.parent_id
+        )
+        .where(
+            CategoryModel.parent_id.is_(None),
+            CategoryModel.is_active == True
+        )
+        .cte('tree', recursive=True)
+    )
+    children = aliased(CategoryModel)
+    tree = tree.union_all(
+        select(
+            children.id,
+            children.name,
+            children.is_active,
+            children.parent_id
+        )
+        .join(tree, children.parent_id == tree.c.id)
+        .where(children.is_active == True)
+    )
+    rows = await get_rows(select(tree).order_by(tree.c.id), db)
+
+    # Сборка вложенной структуры: сначала все узлы, затем связи,
+    # так как потомок может иметь id меньше, чем у родителя
+    nodes = {row['id']: dict(row) | {'children': []} for row in rows}
+    roots = []
+    for node in nodes.values():
+        if node['parent_id'] is None:
+            roots.append(node)
+        else:
+            nodes[node['parent_id']]['children'].append(node)
+    return roots
+
+
+def get_validators_filters(kwargs: dict, model=ProductModel):
     if (
         kwargs.get('min_price') is not None
         and kwargs.get('max_price') is not None
@@ -104,178 +342,339 @@ def get_validators_filters(kwargs: dict):
         )
     filters = []
     if kwargs.get('category_id') is not None:
-        filters.append(ProductModel.category_id == kwargs['category_id'])
+        # Товары категории вместе со всеми её подкатегориями
+        filters.append(
+            model.category_id.in_(
+                get_category_subtree_ids(kwargs['category_id'])
+            )
+        )
     if kwargs.get('min_price') is not None:
-        filters.append(ProductModel.price >= kwargs['min_price'])
+        filters.append(model.price >= kwargs['min_price'])
     if kwargs.get('max_price') is not None:
-        filters.append(ProductModel.price <= kwargs['max_price'])
+        filters.append(model.price <= kwargs['max_price'])
     if kwargs.get('in_stock') is not None:
         filters.append(
-            ProductModel.stock > 0
+            model.stock > 0
             if kwargs['in_stock']
             else
-            ProductModel.stock == 0
+            model.stock == 0
         )
     if kwargs.get('seller_id', None) is not None:
-        filters.append(ProductModel.seller_id == kwargs['seller_id'])
+        filters.append(model.seller_id == kwargs['seller_id'])
     if kwargs.get('is_active') is not None:
-        filters.append(ProductModel.is_active == kwargs['is_active'])
+        filters.append(model.is_active == kwargs['is_active'])
     return filters
 
 
-async def _get_cart_item(
-    db: AsyncSession,
-    user_id: int,
-    product_id: int,
-):
+async def _get_returned_cart_item(db: AsyncSession, stmt):
+    """
+    Позиция корзины, изменённая запросом stmt (INSERT, UPDATE или DELETE),
+    вместе с товаром за один запрос: строка из RETURNING запроса
+    соединяется с products (WITH cart_item AS (...) SELECT ... JOIN).
+    None, если запрос не изменил ни одной строки
+    """
+    cart_item = aliased(
+        CartItemModel,
+        stmt.returning(*CartItemModel.__table__.c).cte('cart_item')
+    )
     result = await db.scalars(
-        select(CartItemModel)
-        .options(selectinload(CartItemModel.product))
-        .where(
-            CartItemModel.user_id == user_id,
-            CartItemModel.product_id == product_id,
-        )
+        select(cart_item)
+        .join(cart_item.product)
+        .options(contains_eager(cart_item.product))
+        .execution_options(populate_existing=True)
     )
     return result.first()
 
 
+async def create_orders(buyer_id: int, converted: list[dict], db: AsyncSession):
+    """
+    Пакетная вставка заказов (по заказу на товар) и их деталей со снимком
+    товара по списанным резервам, учёт продаж в дневной статистике
+    продавцов.
+    Возвращает ключи заказов (id, дата заказа - ключ секционирования)
+    в порядке переданных строк
+    """
+    for item in converted:
+        item['price'] = Decimal(item['price']).quantize(Decimal('0.01'))
+    order_keys = (await db.execute(
+        insert(Order).returning(
+            Order.id, Order.order_date, sort_by_parameter_order=True
+        ),
+        [
+            {'total': item['quantity'] * item['price'], 'buyer_id': buyer_id}
+            for item in converted
+        ]
+    )).all()
+    await db.execute(
+        insert(OrderItem),
+        [
+            {
+                'order_id': order_id,
+                'order_date': order_date,
+                'product_id': item['product_id'],
+                'quantity': item['quantity'],
+                'price': item['price'],
+                'product_name': item['product_name'],
+                'product_image_url': item['product_image_url'],
+                'seller_id': item['seller_id']
+            }
+            for (order_id, order_date), item in zip(order_keys, converted)
+        ]
+    )
+    await record_seller_sales(order_keys, converted, db)
+    return [tuple(order_key) for order_key in order_keys]
+
+
 async def create_one_order(product_id, quantity, buyer, db):
-    """ Функция по созданию одного заказа"""
+    """
+    Функция по созданию одного заказа. Резерв товара ставится отдельной
+    короткой транзакцией, затем в транзакции заказа резерв списывается,
+    а остаток уменьшается последним запросом. Коммит заказа выполняет
+    вызывающий код
+    """
 
     # Валидация и получение продукта по id
     product = await get_active_object_model_or_404(
         ProductModel, product_id, db
     )
+    # Откат транзакции делает объекты сессии устаревшими - нужные
+    # значения запоминаются заранее
+    buyer_id, product_name = buyer.id, product.name
 
-    # Проверка наличия соответ. количеста продукта
-    if product.stock < quantity:
+    # Резервирование товара условным UPDATE счётчика резервов
+    # (строка товара или шарда блокируется только до этого коммита)
+    held = await place_stock_holds(buyer_id, {product_id: quantity}, db)
+    await db.commit()
+    if not held:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Not enough stock for product {product.name}",
+            detail=f"Not enough stock for product {product_name}",
         )
-    price = Decimal(product.price)
 
-    # Валидация цены продукта
-    if price is None:
+    # Создание нового заказа и записи деталей заказа в промежуточной
+    # таблице OrderItem таблиц Order и Product по списанному резерву
+    converted = await convert_stock_holds(
+        buyer_id, {product_id: quantity}, db
+    )
+    taken = set()
+    if converted:
+        (order_id, order_date), = await create_orders(
+            buyer_id, converted, db
+        )
+        taken = await take_converted_stock(converted, db)
+    if product_id not in taken:
+        await db.rollback()
+        await release_stock_holds(buyer_id, db, [product_id])
+        await db.commit()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Product {product.name} has no price set",
+            detail=f"Not enough stock for product {product_name}",
         )
-    total = quantity * price
-
-    # Создание нового заказа
-    order = await create_object_model(
-        Order, {'total': total, 'buyer_id': buyer.id}, db
-    )
-
-    # Создание записи деталей заказа в промежуточной таблице OrderItem
-    # таблиц Order и Product
-    new_order_item = await create_object_model(
-        OrderItem,
-        {
-            'order_id': order.id,
-            'product_id': product.id,
-            'quantity': quantity,
-            'price': price
-        },
-        db
-    )
-
-    # Обновляем значение количества единиц продукта
-    product.stock -= quantity
-    await db.commit()
 
     # Получение полной инф-и о заказе, его деталях и продукте заказа
+    # (в той же транзакции: коммит выполняет вызывающий код вместе
+    # с сохранением ответа для Idempotency-Key)
     order_item = await db.scalars(select(OrderItem)
         .where(
-            OrderItem.order_id == new_order_item.order_id,
-            OrderItem.product_id == new_order_item.product_id
+            OrderItem.order_id == order_id,
+            OrderItem.order_date == order_date,
+            OrderItem.product_id == product_id
         )
-        .options(selectinload(OrderItem.product))
         .options(selectinload(OrderItem.order))
         )
     return order_item.first()
 
 
-async def create_order_with_cart_item(cart_item, buyer):
+def raise_not_enough_stock(product_names: list[str]):
+    raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail=(
+            f"Недостаточно товара в наличии, не оформлен(-о) "
+            f"{len(product_names)} заказ(-а): "
+            f"{', '.join(product_names)}"
+        )
+    )
+
+
+async def checkout_cart_items(buyer, db: AsyncSession, partial: bool = False):
     """
-    Функция по созданию одного заказа с исключением
-    конфликта сессий для асинхронного процесса загрузки моделей пачкой
+    Оформление всей корзины покупателя. Недостающие резервы позиций
+    ставятся отдельной короткой транзакцией. В транзакции заказа
+    резервы списываются одним запросом, заказы и их детали вставляются
+    пачками, оформленные позиции удаляются из корзины, а остаток товаров
+    уменьшается последним запросом перед коммитом - строки товаров
+    заблокированы только до коммита.
+    По умолчанию всё или ничего - если хотя бы одного товара не хватает,
+    транзакция откатывается (409). В режиме partial оформляется то,
+    что есть в наличии, остальное остаётся в корзине вместе с резервом.
+    Возвращает ключи созданных заказов (id, дата заказа).
+    Коммит выполняет вызывающий код
     """
+    # Откат транзакции делает объекты сессии устаревшими
+    buyer_id = buyer.id
+    cart_items_stmt = (
+        select(
+            CartItemModel.product_id,
+            CartItemModel.quantity,
+            ProductModel.name
+        )
+        .join(ProductModel, ProductModel.id == CartItemModel.product_id)
+        .where(CartItemModel.user_id == buyer_id)
+        .order_by(CartItemModel.product_id)
+    )
+    cart_items = (await db.execute(cart_items_stmt)).all()
 
-    quantity = cart_item.quantity
-    product_id = cart_item.product.id
-    async with async_session_maker() as db:
-        order_item = await create_one_order(product_id, quantity, buyer, db)
-    return order_item
+    # Валидация корзины покупателя на пустоту
+    if not cart_items:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Корзина пуста"
+        )
 
+    # Позиции обычно зарезервированы при добавлении в корзину -
+    # заново резервируются только истёкшие или изменённые резервы
+    quantities = {item.product_id: item.quantity for item in cart_items}
+    missing = await get_missing_stock_holds(buyer_id, quantities, db)
+    await place_stock_holds(buyer_id, missing, db)
+    await db.commit()
 
-def get_list_order_item_id_done(done_orders):
+    # Товары, остатка которых не хватило при списании (их позиции
+    # остаются в корзине, а откат транзакции возвращает их резервы)
+    excluded = {}
+    while True:
+        # Позиции корзины блокируются до конца транзакции, чтобы
+        # параллельное оформление той же корзины не списало остаток дважды
+        cart_items = [
+            item for item in (await db.execute(
+                cart_items_stmt.with_for_update(of=CartItemModel)
+            )).all()
+            if item.product_id not in excluded
+        ]
+        quantities = {item.product_id: item.quantity for item in cart_items}
+        converted = await convert_stock_holds(buyer_id, quantities, db)
+        ordered_product_ids = [item['product_id'] for item in converted]
+
+        failed_products = [
+            item.name for item in cart_items
+            if item.product_id not in ordered_product_ids
+        ] + list(excluded.values())
+        if failed_products and (not partial or not converted):
+            await db.rollback()
+            raise_not_enough_stock(failed_products)
+
+        # Чистка корзины от оформленных позиций
+        await db.execute(delete(CartItemModel).where(
+            CartItemModel.user_id == buyer_id,
+            CartItemModel.product_id.in_(ordered_product_ids)
+        ))
+        # Заказы и их детали вставляются пачками (по заказу на позицию)
+        order_keys = await create_orders(buyer_id, converted, db)
+        # Остаток уменьшается последним - до коммита вызывающим кодом
+        lost = set(ordered_product_ids) - await take_converted_stock(
+            converted, db
+        )
+        if not lost:
+            return order_keys
+        await db.rollback()
+        lost_products = {
+            item.product_id: item.name for item in cart_items
+            if item.product_id in lost
+        }
+        if not partial:
+            raise_not_enough_stock(list(lost_products.values()))
+        excluded.update(lost_products)
+
+
+def encode_order_cursor(order_item) -> str:
     """
-    Функция по извлечению имен из списка успешно завершенных задач
-    от asyncio.wait с преобразованием их в числа
+    Курсор постраничного вывода заказов: ключ сортировки последней
+    выданной детали заказа (дата заказа, id заказа, id товара)
     """
-    order_item_id_done = []
-    for order_item in done_orders:
-        if order_item.exception() is None:
-            order_item_id_done.append(int(order_item.get_name()))
-    return order_item_id_done
+    key = [
+        order_item.order.order_date.isoformat(),
+        order_item.order_id,
+        order_item.product_id
+    ]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
 
 
-async def create_and_get_link_from_yandex_disk(
-    image,
-    file_name,
-    session
-):
-    payload = {
-        # Загрузить файл с названием file_name в папку приложения.
-        'path': f'app:/{file_name}',
-        # перезапись существующего файла
-        'overwrite': 'True'
-    }
-    # Получение ссылки для загрузки файла
-    async with session.get(
-        url=conf.REQUEST_UPLOAD_URL,
-        # Заголовок для авторизации
-        headers=conf.AUTH_HEADERS,
-        # Параметры файла
-        params=payload
-    ) as response:
-        upload_url = (await response.json())['href']
-
-    # Процесс сохранения файла
-    async with session.put(
-        data=image,
-        url=upload_url
-    ) as file_remember:
-        # Получение расположения файла из Location
-        location = file_remember.headers['Location']
-        # Декодирование строки при помощи модуля urllib.
-        location = urllib.parse.unquote(location)
-        # Убираем первую часть расположения файла /disk,
-        location = location.replace('/disk', '')
-
-    async with session.get(
-        url=conf.DOWNLOAD_LINK_URL,
-        headers=conf.AUTH_HEADERS,
-        params={'path': location}
-    ) as file_link:
-
-        link = (await file_link.json())['href']
-    return link
-
-
-def get_name_file_with_uuid4(extension: str):
-    """
-    Получение имени файла склеивая сгененрированную
-    послед-ть uuid4() с переданным расширением (extension)
-    """
-    uuid_name = uuid.uuid4()
-    file_name = f"{uuid_name}{extension}"
+def decode_order_cursor(cursor: str) -> tuple:
+    try:
+        order_date, order_id, product_id = json.loads(
+            base64.urlsafe_b64decode(cursor.encode())
+        )
+        return datetime.fromisoformat(order_date), int(order_id), int(product_id)
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+
+def get_product_image_urls_stmt(url: str):
+    """
+    Адреса всех активных картинок товаров, у которых есть картинка url
+    (для пакетного получения ссылок на картинки одного товара)
+    """
+    product_ids = union_all(
+        select(ProductModel.id).where(ProductModel.image_url == url),
+        select(ImageModel.product_id).where(ImageModel.title_url == url)
+    )
+    return union_all(
+        select(ProductModel.image_url).where(
+            ProductModel.id.in_(product_ids),
+            ProductModel.image_url.is_not(None)
+        ),
+        select(ImageModel.title_url).where(
+            ImageModel.product_id.in_(product_ids),
+            ImageModel.is_active == True
+        )
+    )
+
+
+def get_name_file_with_digest(digest: str, extension: str):
+    """
+    Получение имени файла склеивая SHA-256 содержимого файла
+    с переданным расширением (extension). Одинаковые файлы
+    получают одинаковое имя и хранятся в одном экземпляре
+    """
+    file_name = f"{digest}{extension}"
     return file_name
 
 
-def validate_file_and_get_file_name(file: UploadFile):
+def is_content_addressed_name(file_name: str) -> bool:
+    """
+    Проверка, что имя файла (или его уменьшенной копии)
+    сформировано по хешу содержимого и файл никогда не меняется
+    """
+    stem = Path(file_name).stem.split('_', 1)[0]
+    return len(stem) == 64 and all(char in '0123456789abcdef' for char in stem)
+
+
+async def read_file_chunks(file: UploadFile, file_hash=None):
+    """
+    Асинхронный генератор чтения загружаемого файла по чанкам
+    с валидацией размера на лету (в памяти держится только один чанк).
+    Если передан file_hash (hashlib), он обновляется каждым чанком
+    в том же проходе
+    """
+    # установка счетчика для измерения размера загружаемого файла
+    current_size = 0
+    while content := await file.read(conf.CHANK_SIZE):
+        # Увеличиваем счетчик прочитанного размера
+        current_size += len(content)
+        # Валидация размера файла
+        validate_size(current_size)
+        if file_hash is not None:
+            file_hash.update(content)
+        yield content
+
+
+def validate_file_and_get_extension(file: UploadFile) -> str:
+    """
+    Валидация MIME-типа и расширения загружаемого файла.
+    Возвращает расширение для имени файла в хранилище
+    """
     # Валидация MIME-типа, отправляемого клиентом
     validate_content_type(file)
 
@@ -284,112 +683,101 @@ def validate_file_and_get_file_name(file: UploadFile):
 
     # Валидация расширения из оригинального имени файла
     validate_extension(extension)
-    # Формирование имени файла на основе uuid4() и расширения (extension)
-    file_name = get_name_file_with_uuid4(extension)
+    return extension
 
-    return file_name
+
+@asynccontextmanager
+async def spool_upload(file: UploadFile, directory: Path):
+    """
+    Запись загружаемого файла во временный файл папки directory
+    за один проход: размер валидируется, SHA-256 содержимого считается
+    на лету. Отдаёт путь к временному файлу и хеш. Временный файл
+    удаляется при выходе, если его не переместили
+    """
+    file_hash = hashlib.sha256()
+    path = directory / f'.{uuid.uuid4()}.spool'
+    try:
+        await file.seek(0)
+        async with aiofiles.open(path, 'wb') as out_file:
+            async for content in read_file_chunks(file, file_hash):
+                await out_file.write(content)
+        yield path, file_hash.hexdigest()
+    finally:
+        await asyncio.to_thread(path.unlink, missing_ok=True)
+
+
+async def read_path_chunks(path: Path):
+    """Асинхронный генератор чтения файла на диске по чанкам"""
+    async with aiofiles.open(path, 'rb') as local_file:
+        while content := await local_file.read(conf.CHANK_SIZE):
+            yield content
 
 
-async def save_product_image_on_disk(
-        file: UploadFile,
-        session: aiohttp.ClientSession
+@asynccontextmanager
+async def open_local_upload(
+    path: Path, file_name: str | None, content_type: str
 ):
     """
-    Сохраняет на яндекс диске изображение товара и возвращает
-    URL для его скачивания, а также имя файла с которым оно будет сохранено
-    в объекте модели Image
+    Файл на локальном диске в виде UploadFile для сохранения
+    в хранилище картинок (отложенные и возобновляемые загрузки).
+    Открытие и закрытие файла выполняются вне цикла событий
     """
-
-    # Формирование имени файла и его валидация
-    file_name = validate_file_and_get_file_name(file)
-    # установка счетчика для измерения размера загружаемого файла
-    current_size = 0
-    # создаем список для чанок
-    chanks = []
+    local_file = await asyncio.to_thread(open, path, 'rb')
     try:
-        while content := await file.read(conf.CHANK_SIZE):
-            # Увеличиваем счетчик прочитанного размера
-            current_size += len(content)
-            # Валидация размера файла
-            validate_size(current_size)
-            # добавление чанка в список
-            chanks.append(content)
-        # Склейка чанков в бинарный файл
-        b_image = b''.join(chanks)
-        # Сохранение на яндекс диске изображения с получением
-        # ссылки для его скачивания
-        link = await create_and_get_link_from_yandex_disk(
-            b_image,
-            file_name,
-            session
-        )
-    except Exception as e:
-        # Общая обработка возможных ошибок (например, проблем с диском)
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"An unexpected error occurred during file upload: {e}"
+        stat_result = await asyncio.to_thread(os.fstat, local_file.fileno())
+        yield UploadFile(
+            local_file,
+            size=stat_result.st_size,
+            filename=file_name,
+            headers=Headers({'content-type': content_type})
         )
+    finally:
+        await asyncio.to_thread(local_file.close)
 
-    return [link, file_name]
 
-
-async def save_product_image(file: UploadFile, session=None):
+def write_at_offset(fd: int, data: bytes, offset: int) -> None:
     """
-    Сохраняет на локальной машине изображение товара и возвращает
-    URL с которым оно будет доступно для скачивания,
-    а также имя файла с которым оно будет сохранено
-    в объекте модели Image
+    Запись данных в файл с указанного смещения без промежуточных
+    буферов и копий (memoryview + os.pwrite)
     """
-    # Формирование имени файла и его валидация
-    file_name = validate_file_and_get_file_name(file)
-    # Формирование адреса сохранения файла
-    file_path = conf.MEDIA_ROOT / file_name
-    # установка счетчика для измерения размера загружаемого файла
-    current_size = 0
-    try:
-        # Открываем файл для асинхронной записи на диск
-        async with aiofiles.open(file_path, "wb") as out_file:
-            # Читаем файл по частям
-            while content := await file.read(conf.CHANK_SIZE):
-                # Увеличиваем счетчик прочитанного размера
-                current_size += len(content)
-                # Валидация размера файла
-                validate_size(current_size)
-                # Асинхронная запись чанка в файл
-                await out_file.write(content)
-            # Формирование готовой ссылки для скачивания
-            link = (
-                f'/{conf.DIRECTORY_USER_CONTENT}/'
-                f'{conf.DIRECTORY_IMAGE_PRODUCTS}'
-                f'/{file_name}'
-            )
+    view = memoryview(data)
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view = view[written:]
+        offset += written
 
-    except HTTPException:
-        # Если HTTPException был поднят из-за размера файла,
-        # нам нужно удалить частично загруженный файл,
-        # чтобы FastAPI мог его обработать и отправить клиенту.
-        if file_path:
-            os.remove(file_path)  # Удаляем неполный файл
-        raise  # Повторно выбрасываем исключение
-    except Exception as e:
-        # Общая обработка других возможных ошибок (например, проблем с диском)
-        if file_path:
-            os.remove(file_path)  # Удаляем неполный файл
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"An unexpected error occurred during file upload: {e}"
-        )
 
-    return [link, file_name]
+def read_file_header(path: Path, length: int) -> bytes:
+    """Первые length байт файла (для проверки сигнатуры)"""
+    with open(path, 'rb') as file:
+        return file.read(length)
 
 
-def remove_product_image(url: str | None) -> None:
+async def write_upload_chunks(stream, path: Path, offset: int, size: int):
     """
-    Удаляет файл изображения, если он существует.
+    Дописывает тело запроса в файл загрузки с offset по мере получения,
+    проверяя размер на каждом чанке. Возвращает новое смещение
+    (при обрыве соединения - смещение после последнего полученного чанка)
     """
-    if not url:
-        return
-    relative_path = url.lstrip("/")
-    file_path = conf.BASE_DIR / relative_path
-    if file_path.exists():
-        file_path.unlink()
+    fd = os.open(path, os.O_WRONLY)
+    try:
+        # Отбрасываем недописанный хвост предыдущей попытки
+        os.ftruncate(fd, offset)
+        try:
+            async for chunk in stream:
+                if not chunk:
+                    continue
+                new_offset = offset + len(chunk)
+                validate_size(new_offset)
+                if new_offset > size:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail="Chunk exceeds the declared file size"
+                    )
+                await asyncio.to_thread(write_at_offset, fd, chunk, offset)
+                offset = new_offset
+        except ClientDisconnect:
+            pass
+    finally:
+        os.close(fd)
+    return offset
@@ -2,6 +2,7 @@ from fastapi import HTTPException, status, UploadFile
 from sqlalchemy import select
 
 import app.config as conf
+from app.service.cache import category_registry
 
 
 async def validate_category(category, category_id, db):
@@ -21,6 +22,35 @@ async def validate_category(category, category_id, db):
     return category
 
 
+async def validate_active_category(category_id, db):
+    """
+    Проверка существования активной категории по внутрипроцессному
+    реестру категорий (без запроса к БД, пока реестр актуален)
+    """
+    category = await category_registry.get(category_id, db)
+    if category is None or not category[0]:
+        raise HTTPException(
+            status_code=400, detail="Category not found"
+        )
+
+
+async def validate_category_parent(closure, category_id, parent_id, db):
+    """
+    Проверка на цикл при смене родителя категории:
+    новый родитель не может быть самой категорией или её потомком
+    """
+    stmt = select(closure).where(
+        closure.ancestor_id == category_id,
+        closure.descendant_id == parent_id
+    )
+    result = await db.scalars(stmt)
+    if result.first() is not None:
+        raise HTTPException(
+            status_code=400,
+            detail="Category cannot be moved into its own subtree"
+        )
+
+
 async def validate_one_review(model, user_id, db):
     """Валидация для модели ReviewModel по полю user_id"""
     model_objects = await db.scalars(select(model).where(
@@ -36,10 +66,14 @@ async def validate_one_review(model, user_id, db):
 
 
 def validate_content_type(file: UploadFile):
+    validate_content_type_value(file.content_type)
+
+
+def validate_content_type_value(content_type: str | None):
     # Мы сравниваем MIME-тип, который клиент отправляет
     # в заголовке Content-Type с жёстко заданным белым списком
     # из conf.ALLOWED_IMAGE_TYPES
-    if file.content_type not in conf.ALLOWED_IMAGE_TYPES:
+    if content_type not in conf.ALLOWED_IMAGE_TYPES:
         raise HTTPException(
             status.HTTP_400_BAD_REQUEST,
             (
@@ -73,4 +107,23 @@ def validate_size(current_size):
                 f"File too large. Max size is"
                 f"{conf.MAX_IMAGE_SIZE} B."
             )
-        )
\ No newline at end of file
+        )
+
+
+def validate_image_signature(header: bytes, content_type: str):
+    # Проверка первых байт файла на соответствие заявленному MIME-типу
+    # (выполняется по первому чанку, до получения всего файла)
+    signatures = {
+        'image/jpeg': (b'\xff\xd8\xff',),
+        'image/jpg': (b'\xff\xd8\xff',),
+        'image/png': (b'\x89PNG\r\n\x1a\n',),
+        'image/webp': (b'RIFF',),
+    }
+    valid = header.startswith(signatures.get(content_type, ()))
+    if valid and content_type == 'image/webp':
+        valid = header[8:12] == b'WEBP'
+    if not valid:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"File content does not match {content_type}"
+        )
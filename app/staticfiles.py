@@ -0,0 +1,49 @@
+import urllib
+from pathlib import Path
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+import app.config as conf
+from app.service.tools import is_content_addressed_name
+
+
+class MediaStaticFiles(StaticFiles):
+    """
+    Раздача медиа-файлов с заголовками кэширования.
+    Файлы с именем по хешу содержимого кэшируются навсегда (immutable),
+    а ETag для них - сам хеш. Range-запросы обрабатывает FileResponse.
+    В режиме MEDIA_X_ACCEL_REDIRECT приложение только находит файл,
+    а байты с диска отдаёт nginx
+    """
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        file_name = Path(full_path).name
+        immutable = is_content_addressed_name(file_name)
+        cache_control = (
+            conf.MEDIA_CACHE_CONTROL_IMMUTABLE if immutable
+            else conf.MEDIA_CACHE_CONTROL_DEFAULT
+        )
+
+        if conf.MEDIA_X_ACCEL_REDIRECT and status_code == 200:
+            # nginx сам обработает ETag, Range и условные запросы
+            location = urllib.parse.quote(
+                f'{conf.MEDIA_X_ACCEL_PREFIX}/{self.get_path(scope)}'
+            )
+            return Response(
+                headers={
+                    'X-Accel-Redirect': location,
+                    'Cache-Control': cache_control,
+                }
+            )
+
+        response = FileResponse(
+            full_path, status_code=status_code, stat_result=stat_result
+        )
+        response.headers['Cache-Control'] = cache_control
+        if immutable:
+            response.headers['ETag'] = f'"{Path(file_name).stem}"'
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response